@@ -0,0 +1,419 @@
+"""
+Comprovante de Rendimentos IN RFB 2060/2021 a partir de XMLs S-5002.
+
+Assim como `s5002_processamento`, este módulo não chama `st.*`: a geração
+em lote roda os CPFs em processos filhos, que gravam os PDFs numa pasta de
+trabalho; o processo principal registra cada resultado no manifesto e, ao
+final, compacta tudo em um ZIP.
+"""
+
+import csv
+import io
+import json
+import os
+import shutil
+import threading
+import zipfile
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from formatacao import format_value
+from s5002_processamento import montar_tabelas_s5002, processar_xml_s5002
+
+# FPDF é opcional: sem ela a geração de PDFs falha com ImportError
+try:
+    from fpdf import FPDF
+except ImportError:
+    FPDF = None
+
+LIMIAR_LOTE_PARALELO = 20  # Abaixo disso, gera os comprovantes em série
+MANIFESTO_TRABALHO = 'manifesto.jsonl'
+MANIFESTO_ZIP = 'manifesto.csv'
+COLUNAS_MANIFESTO = ('cpf', 'ano_calendario', 'status', 'arquivo', 'xmls',
+                     'total_tributavel', 'irrf', 'erro')
+
+# --- Estrutura do Comprovante IN 2060/2021 ---
+CAMPOS_COMPROVANTE_IN2060 = {
+    "quadro3": {
+        "nome": "Quadro 3 - Rendimentos Tributáveis, Deduções e Imposto sobre a Renda Retido na Fonte (IRRF)",
+        "linhas": {
+            "linha1": "Total dos rendimentos tributáveis (inclusive férias e décimo terceiro salário)",
+            "linha2": "Dedução: Contribuição à Previdência Oficial",
+            "linha3": "Dedução: Contribuição a entidades de previdência complementar",
+            "linha4": "Dedução: Pensão alimentícia",
+            "linha5": "Imposto sobre a Renda Retido na Fonte (IRRF)",
+            "linha6": "Rendimentos isentos de pensão, proventos de aposentadoria ou reforma por moléstia grave"
+        }
+    },
+    "quadro4": {
+        "nome": "Quadro 4 - Rendimentos Isentos e Não-Tributáveis",
+        "linhas": {
+            "linha1": "Parcela isenta dos proventos de aposentadoria (65 anos ou mais), exceto 13º",
+            "linha2": "Parcela isenta do 13º salário (65 anos ou mais)",
+            "linha3": "Diárias",
+            "linha4": "Pensão e proventos por moléstia grave ou acidente em serviço",
+            "linha5": "Outros rendimentos isentos e não-tributáveis"
+        }
+    },
+    "quadro5": {
+        "nome": "Quadro 5 - Rendimentos Sujeitos à Tributação Exclusiva",
+        "linhas": {
+            "linha1": "Décimo terceiro salário",
+            "linha2": "Imposto sobre a Renda Retido na Fonte sobre 13º salário",
+            "linha3": "Participação nos Lucros ou Resultados (PLR)",
+            "linha4": "Imposto sobre a Renda Retido na Fonte sobre PLR",
+            "linha5": "Outros rendimentos sujeitos à tributação exclusiva"
+        }
+    },
+    "quadro6": {
+        "nome": "Quadro 6 - Rendimentos Recebidos Acumuladamente (RRA)",
+        "linhas": {
+            "linha1": "Total dos rendimentos tributáveis (RRA)",
+            "linha2": "Dedução: Contribuição à Previdência Oficial (RRA)",
+            "linha3": "Dedução: Contribuição a entidades de previdência complementar (RRA)",
+            "linha4": "Dedução: Pensão alimentícia (RRA)",
+            "linha5": "Imposto sobre a Renda Retido na Fonte (RRA)"
+        }
+    },
+    "quadro7": {
+        "nome": "Quadro 7 - Informações Complementares",
+        "linhas": {
+            "linha1": "Rendimentos com exigibilidade suspensa",
+            "linha2": "Depósitos judiciais",
+            "linha3": "Outras informações"
+        }
+    }
+}
+
+
+def consolidar_dados_s5002(lista_dados):
+    """Junta os dados de vários XMLs de um mesmo CPF (cabeçalho do primeiro arquivo)"""
+    consolidados = {}
+    if lista_dados:
+        primeiro = lista_dados[0]
+        consolidados.update({
+            campo: primeiro.get(campo)
+            for campo in ('nrRecArqBase', 'perApur', 'tpInsc', 'nrInsc', 'cpfBenef')
+        })
+
+    consolidados['tabelas'] = montar_tabelas_s5002([dados['colunas'] for dados in lista_dados])
+    return consolidados
+
+
+def calcular_comprovante_in2060(dados_xml, info_ir, mapeamento):
+    """Distribui os valores de infoIR nos quadros/linhas do comprovante conforme o mapeamento"""
+    comprovante_dados = {
+        quadro_id: {linha_id: 0.0 for linha_id in quadro_info["linhas"]}
+        for quadro_id, quadro_info in CAMPOS_COMPROVANTE_IN2060.items()
+    }
+
+    # Soma os valores por código TPInfoIR e distribui nos quadros/linhas mapeados
+    somas_por_codigo = info_ir.groupby('tpInfoIR', observed=True)['valor'].sum()
+
+    for codigo, valor in somas_por_codigo.items():
+        if codigo in mapeamento:
+            quadro, linha = mapeamento[codigo]
+            if quadro in comprovante_dados and linha in comprovante_dados[quadro]:
+                comprovante_dados[quadro][linha] += valor
+
+    # Adiciona dados básicos
+    comprovante_dados['dados_basicos'] = {
+        'exercicio': str(int(dados_xml.get('perApur', '2025-01')[:4]) + 1),
+        'ano_calendario': dados_xml.get('perApur', '2025-01')[:4],
+        'cnpj_fonte': dados_xml.get('nrInsc', ''),
+        'cpf_beneficiario': dados_xml.get('cpfBenef', ''),
+        'nome_beneficiario': 'A DEFINIR',
+        'natureza_rendimento': 'RENDIMENTOS DO TRABALHO ASSALARIADO'
+    }
+
+    return comprovante_dados
+
+
+class ComprovanteIN2060PDF:
+    """Classe para gerar PDF do comprovante conforme IN 2060/2021"""
+
+    def __init__(self):
+        if FPDF is None:
+            raise ImportError("FPDF não está disponível. Instale com: pip install fpdf2")
+
+        self.pdf = FPDF('P', 'mm', 'A4')
+        self.pdf.set_auto_page_break(auto=True, margin=15)
+
+    def header(self):
+        self.pdf.set_font('Arial', 'B', 16)
+        self.pdf.cell(0, 10, 'COMPROVANTE DE RENDIMENTOS PAGOS', 0, 1, 'C')
+        self.pdf.cell(0, 10, 'E DE IMPOSTO SOBRE A RENDA RETIDO NA FONTE', 0, 1, 'C')
+        self.pdf.ln(5)
+
+    def footer(self):
+        self.pdf.set_y(-15)
+        self.pdf.set_font('Arial', 'I', 8)
+        self.pdf.cell(0, 10, f'Página {self.pdf.page_no()} - Conforme IN RFB nº 2060/2021', 0, 0, 'C')
+
+    def add_page(self):
+        self.pdf.add_page()
+        self.header()
+
+    def add_quadro(self, titulo, dados, linha_descricoes):
+        """Adiciona um quadro ao comprovante"""
+        self.pdf.set_font('Arial', 'B', 10)
+        self.pdf.cell(0, 8, titulo, 1, 1, 'L')
+
+        self.pdf.set_font('Arial', '', 9)
+        for linha_id, descricao in linha_descricoes.items():
+            valor = dados.get(linha_id, 0.0)
+            if valor != 0.0 or linha_id in ['linha1', 'linha5']:
+                self.pdf.cell(120, 6, descricao, 1, 0, 'L')
+                self.pdf.cell(70, 6, format_value(valor, manter_invalidos=True), 1, 1, 'R')
+
+        self.pdf.ln(3)
+
+    def output(self, buffer):
+        return self.pdf.output(buffer)
+
+
+def renderizar_comprovante_in2060(comprovante_dados):
+    """Monta o PDF do comprovante e retorna seus bytes"""
+    pdf = ComprovanteIN2060PDF()
+    pdf.add_page()
+
+    # Dados básicos
+    dados_basicos = comprovante_dados['dados_basicos']
+    pdf.pdf.set_font('Arial', 'B', 10)
+    pdf.pdf.cell(40, 8, 'Exercício:', 1, 0, 'L')
+    pdf.pdf.cell(40, 8, dados_basicos['exercicio'], 1, 0, 'C')
+    pdf.pdf.cell(40, 8, 'Ano-calendário:', 1, 0, 'L')
+    pdf.pdf.cell(70, 8, dados_basicos['ano_calendario'], 1, 1, 'C')
+    pdf.pdf.ln(3)
+
+    # Quadro 1 - Fonte Pagadora
+    pdf.pdf.set_font('Arial', 'B', 10)
+    pdf.pdf.cell(0, 8, 'QUADRO 1 - FONTE PAGADORA', 1, 1, 'L')
+    pdf.pdf.set_font('Arial', '', 9)
+    pdf.pdf.cell(30, 6, 'CNPJ:', 1, 0, 'L')
+    pdf.pdf.cell(160, 6, dados_basicos['cnpj_fonte'], 1, 1, 'L')
+    pdf.pdf.ln(3)
+
+    # Quadro 2 - Beneficiário
+    pdf.pdf.set_font('Arial', 'B', 10)
+    pdf.pdf.cell(0, 8, 'QUADRO 2 - PESSOA FÍSICA BENEFICIÁRIA', 1, 1, 'L')
+    pdf.pdf.set_font('Arial', '', 9)
+    pdf.pdf.cell(30, 6, 'CPF:', 1, 0, 'L')
+    pdf.pdf.cell(160, 6, dados_basicos['cpf_beneficiario'], 1, 1, 'L')
+    pdf.pdf.cell(30, 6, 'Nome:', 1, 0, 'L')
+    pdf.pdf.cell(160, 6, dados_basicos['nome_beneficiario'], 1, 1, 'L')
+    pdf.pdf.ln(3)
+
+    # Quadros principais
+    for quadro_id, quadro_info in CAMPOS_COMPROVANTE_IN2060.items():
+        if quadro_id in comprovante_dados:
+            pdf.add_quadro(
+                quadro_info["nome"].upper(),
+                comprovante_dados[quadro_id],
+                quadro_info["linhas"]
+            )
+
+    buffer = io.BytesIO()
+    pdf.output(buffer)
+    return buffer.getvalue()
+
+
+def nome_comprovante_in2060(cpf, ano_calendario):
+    """Nome do arquivo PDF do comprovante de um CPF"""
+    return f"Comprovante_IN2060_{cpf}_{ano_calendario}.pdf"
+
+
+# --- Geração em lote ---
+def gerar_comprovante_cpf(pasta_base, cpf, arquivos, ano_calendario, codigos, mapeamento, pasta_trabalho):
+    """
+    Gera o comprovante de um CPF na pasta de trabalho e retorna sua linha
+    do manifesto (erros ficam registrados nela em vez de interromper o lote).
+    """
+    registro = {
+        'cpf': cpf,
+        'ano_calendario': ano_calendario,
+        'status': 'ok',
+        'arquivo': '',
+        'xmls': len(arquivos),
+        'total_tributavel': 0.0,
+        'irrf': 0.0,
+        'erro': '',
+    }
+    try:
+        lista_dados = []
+        for arquivo in arquivos:
+            dados = processar_xml_s5002(os.path.join(pasta_base, arquivo), codigos)
+            if dados and dados.get('cpfBenef') == cpf:
+                lista_dados.append(dados)
+        if not lista_dados:
+            raise ValueError("Nenhum XML S-5002 válido para o CPF")
+
+        dados_xml = consolidar_dados_s5002(lista_dados)
+        comprovante = calcular_comprovante_in2060(dados_xml, dados_xml['tabelas']['info_ir'], mapeamento)
+
+        # Grava em arquivo temporário e renomeia: um PDF interrompido nunca fica com o nome final
+        nome_arquivo = nome_comprovante_in2060(cpf, ano_calendario)
+        destino = Path(pasta_trabalho) / nome_arquivo
+        temporario = destino.with_name(nome_arquivo + '.tmp')
+        temporario.write_bytes(renderizar_comprovante_in2060(comprovante))
+        os.replace(temporario, destino)
+
+        registro.update({
+            'arquivo': nome_arquivo,
+            'total_tributavel': round(float(comprovante['quadro3']['linha1']), 2),
+            'irrf': round(float(comprovante['quadro3']['linha5']), 2),
+        })
+    except Exception as e:
+        registro.update({'status': 'erro', 'erro': str(e)})
+    return registro
+
+
+def ler_manifesto_in2060(pasta_trabalho):
+    """
+    Lê o manifesto da pasta de trabalho (cpf -> última linha registrada).
+    Uma linha incompleta no fim, deixada por uma interrupção, é ignorada.
+    """
+    manifesto = {}
+    caminho = Path(pasta_trabalho) / MANIFESTO_TRABALHO
+    if not caminho.exists():
+        return manifesto
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                continue
+            manifesto[registro['cpf']] = registro
+    return manifesto
+
+
+def cpfs_concluidos_in2060(pasta_trabalho, ano_calendario):
+    """CPFs já gerados com sucesso nesta pasta de trabalho (para retomar o lote)"""
+    return {
+        cpf for cpf, registro in ler_manifesto_in2060(pasta_trabalho).items()
+        if registro['status'] == 'ok'
+        and registro['ano_calendario'] == ano_calendario
+        and (Path(pasta_trabalho) / registro['arquivo']).exists()
+    }
+
+
+def _termina_com_quebra(caminho):
+    """Indica se o arquivo termina com quebra de linha"""
+    with open(caminho, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def gerar_comprovantes_in2060(pasta_base, tarefas, ano_calendario, codigos, mapeamento,
+                              pasta_trabalho, max_workers=None, limiar_paralelo=LIMIAR_LOTE_PARALELO):
+    """
+    Gera os comprovantes dos CPFs em `tarefas` (cpf -> arquivos XML),
+    devolvendo cada linha do manifesto assim que o CPF é concluído.
+
+    Cada linha é gravada no manifesto assim que o CPF termina (no pool, pelo
+    callback do futuro, mesmo que o chamador já tenha parado de consumir), e
+    CPFs já concluídos na pasta de trabalho são pulados: rodar de novo após
+    uma interrupção retoma o lote de onde parou. Se o gerador for fechado
+    antes do fim (ex.: rerun do Streamlit), os CPFs ainda na fila são
+    cancelados. Caso o pool de processos falhe, os CPFs pendentes são
+    gerados em série.
+    """
+    pasta_trabalho = Path(pasta_trabalho)
+    pasta_trabalho.mkdir(parents=True, exist_ok=True)
+
+    concluidos = cpfs_concluidos_in2060(pasta_trabalho, ano_calendario)
+    pendentes = [cpf for cpf in sorted(tarefas) if cpf not in concluidos]
+    workers = max_workers or os.cpu_count() or 1
+
+    def tarefa(cpf):
+        return (pasta_base, cpf, tarefas[cpf], ano_calendario, codigos, mapeamento, str(pasta_trabalho))
+
+    caminho_manifesto = pasta_trabalho / MANIFESTO_TRABALHO
+    with open(caminho_manifesto, 'a', encoding='utf-8') as manifesto:
+        # Fecha a linha incompleta deixada por uma interrupção durante a escrita
+        if caminho_manifesto.stat().st_size and not _termina_com_quebra(caminho_manifesto):
+            manifesto.write('\n')
+
+        trava_manifesto = threading.Lock()
+
+        def registrar(registro):
+            with trava_manifesto:
+                manifesto.write(json.dumps(registro, ensure_ascii=False) + '\n')
+                manifesto.flush()
+            return registro
+
+        def registrar_concluido(futuro):
+            # Roda na thread do pool; futuros cancelados ou de um pool quebrado não geraram PDF
+            if not futuro.cancelled() and futuro.exception() is None:
+                registrar(futuro.result())
+
+        if len(pendentes) < limiar_paralelo or workers <= 1:
+            for cpf in pendentes:
+                yield registrar(gerar_comprovante_cpf(*tarefa(cpf)))
+            return
+
+        futuros = {}
+        entregues = set()
+        executor = None
+        try:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            for cpf in pendentes:
+                futuro = executor.submit(gerar_comprovante_cpf, *tarefa(cpf))
+                futuro.add_done_callback(registrar_concluido)
+                futuros[cpf] = futuro
+
+            for futuro in as_completed(list(futuros.values())):
+                registro = futuro.result()
+                entregues.add(registro['cpf'])
+                yield registro
+
+        except (BrokenProcessPool, OSError):
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            for cpf in pendentes:
+                if cpf in entregues:
+                    continue
+                futuro = futuros.get(cpf)
+                if futuro is not None and not futuro.cancelled() and futuro.exception() is None:
+                    yield futuro.result()  # Já gravado no manifesto pelo callback
+                else:
+                    yield registrar(gerar_comprovante_cpf(*tarefa(cpf)))
+
+        finally:
+            # Gerador fechado antes do fim: cancela a fila e espera só os CPFs
+            # em execução, cujos callbacks ainda gravam no manifesto aberto
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+
+def empacotar_comprovantes_in2060(pasta_trabalho, caminho_zip, cpfs):
+    """
+    Compacta os PDFs e o manifesto (CSV) dos `cpfs` do lote em um ZIP, um
+    arquivo por vez, e remove a pasta de trabalho. Linhas de CPFs de uma
+    execução anterior com outro filtro ficam de fora. Retorna o manifesto final.
+    """
+    pasta_trabalho = Path(pasta_trabalho)
+    caminho_zip = Path(caminho_zip)
+    manifesto = {
+        cpf: registro for cpf, registro in ler_manifesto_in2060(pasta_trabalho).items()
+        if cpf in cpfs
+    }
+
+    texto_manifesto = io.StringIO()
+    escritor = csv.DictWriter(texto_manifesto, fieldnames=COLUNAS_MANIFESTO, delimiter=';')
+    escritor.writeheader()
+    for cpf in sorted(manifesto):
+        escritor.writerow(manifesto[cpf])
+
+    temporario = caminho_zip.with_name(caminho_zip.name + '.tmp')
+    with zipfile.ZipFile(temporario, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for cpf in sorted(manifesto):
+            registro = manifesto[cpf]
+            if registro['status'] == 'ok':
+                zf.write(pasta_trabalho / registro['arquivo'], registro['arquivo'])
+        zf.writestr(MANIFESTO_ZIP, texto_manifesto.getvalue().encode('utf-8-sig'))
+    os.replace(temporario, caminho_zip)
+
+    shutil.rmtree(pasta_trabalho, ignore_errors=True)
+    return manifesto
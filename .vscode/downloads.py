@@ -0,0 +1,87 @@
+"""
+Downloads de arquivos gerados pelas páginas (PDF, CSV, ZIP).
+
+Os artefatos são gravados em disco, na pasta de exportação, e entregues ao
+navegador sem base64 nem cópias em memória da sessão:
+
+- com `server.enableStaticServing = true` (ligado em `.streamlit/config.toml`,
+  ao lado do main.py), a pasta de exportação fica dentro de `static/` do app
+  e o próprio servidor do Streamlit envia o arquivo em streaming a partir
+  do disco;
+- sem isso, usa `st.download_button` com o arquivo aberto. O Streamlit lê o
+  arquivo inteiro para a memória nesse caso, então o uso de memória só fica
+  limitado com o static serving ligado.
+"""
+
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import quote
+
+import streamlit as st
+
+from exportacao import exportar_blocos
+
+# Pasta `static` fica ao lado do main.py para ser servida em /app/static
+PASTA_STATIC = Path(__file__).resolve().parent / "static"
+PASTA_EXPORTACAO = PASTA_STATIC / "exportacoes"
+IDADE_MAXIMA_EXPORTACAO = 24 * 60 * 60  # Segundos até uma exportação antiga ser apagada
+
+
+def limpar_exportacoes_antigas(idade_maxima=IDADE_MAXIMA_EXPORTACAO):
+    """Apaga exportações mais antigas que `idade_maxima` segundos"""
+    if not PASTA_EXPORTACAO.exists():
+        return
+    limite = time.time() - idade_maxima
+    with os.scandir(PASTA_EXPORTACAO) as entradas:
+        for entrada in entradas:
+            try:
+                if entrada.stat().st_mtime < limite:
+                    if entrada.is_dir():
+                        shutil.rmtree(entrada.path, ignore_errors=True)
+                    else:
+                        os.remove(entrada.path)
+            except OSError:
+                pass
+
+
+def caminho_exportacao(nome_arquivo):
+    """
+    Caminho para gravar uma nova exportação. Cada arquivo fica numa
+    subpasta própria, para sessões diferentes não sobrescreverem umas às outras.
+    """
+    limpar_exportacoes_antigas()
+    pasta = PASTA_EXPORTACAO / uuid.uuid4().hex
+    pasta.mkdir(parents=True, exist_ok=True)
+    return pasta / nome_arquivo
+
+
+def gravar_exportacao(nome_arquivo, conteudo):
+    """Grava bytes já prontos (ex.: um PDF) na pasta de exportação"""
+    caminho = caminho_exportacao(nome_arquivo)
+    caminho.write_bytes(conteudo)
+    return caminho
+
+
+def exportar_em_blocos(blocos, nome_arquivo, formato='csv'):
+    """Grava os blocos (CSV, Parquet ou XLSX) direto no arquivo de exportação, um por vez"""
+    caminho = caminho_exportacao(nome_arquivo)
+    exportar_blocos(blocos, caminho, formato)
+    return caminho
+
+
+def oferecer_download(caminho, rotulo, mime="application/octet-stream", key=None):
+    """
+    Mostra o link/botão de download de um arquivo já gravado em disco.
+    O botão (sem static serving) carrega o arquivo inteiro na memória.
+    """
+    caminho = Path(caminho)
+    if st.get_option("server.enableStaticServing") and caminho.is_relative_to(PASTA_STATIC):
+        url = "app/static/" + quote(caminho.relative_to(PASTA_STATIC).as_posix())
+        st.markdown(f'<a href="{url}" download="{caminho.name}">{rotulo}</a>', unsafe_allow_html=True)
+        return
+
+    with open(caminho, 'rb') as arquivo:
+        st.download_button(rotulo, arquivo, file_name=caminho.name, mime=mime, key=key)
@@ -0,0 +1,137 @@
+"""
+Exportação em blocos para CSV, Parquet e XLSX, independente do Streamlit.
+
+As funções recebem um iterável de DataFrames (blocos com as mesmas colunas)
+e gravam direto no arquivo de destino, um bloco por vez: nenhum formato
+precisa do DataFrame completo em memória, e o mesmo código serve às páginas
+e a jobs em lote sem interface.
+"""
+
+import os
+
+import pandas as pd
+
+# pyarrow e openpyxl são opcionais: sem eles só o formato correspondente falha
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+# Extensão e tipo MIME de cada formato
+FORMATOS_EXPORTACAO = {
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+TAMANHO_BLOCO_EXPORTACAO = 50000  # Linhas formatadas/gravadas por vez
+LINHAS_POR_PLANILHA_XLSX = 1048575  # Limite do Excel, descontado o cabeçalho
+
+
+def _gravar_csv(blocos, caminho):
+    """
+    CSV com ';' e utf-8-sig (o BOM sai uma vez, no início do arquivo).
+    O cabeçalho sai com o primeiro bloco, mesmo vazio; sem nenhum bloco, o
+    arquivo fica vazio.
+    """
+    linhas = 0
+    cabecalho_gravado = False
+    with open(caminho, 'w', encoding='utf-8-sig', newline='') as arquivo:
+        for bloco in blocos:
+            bloco.to_csv(arquivo, index=False, sep=';', header=not cabecalho_gravado)
+            cabecalho_gravado = True
+            linhas += len(bloco)
+    return linhas
+
+
+def _sem_categorias(bloco):
+    """Categorias viram texto, para todos os blocos terem o mesmo esquema"""
+    categoricas = [col for col in bloco.columns if isinstance(bloco[col].dtype, pd.CategoricalDtype)]
+    if not categoricas:
+        return bloco
+    return bloco.astype({col: object for col in categoricas})
+
+
+def _gravar_parquet(blocos, caminho):
+    """Parquet com um row group por bloco"""
+    if pq is None:
+        raise ImportError("pyarrow não está instalado: instale com 'pip install pyarrow' para exportar Parquet")
+
+    linhas = 0
+    escritor = None
+    esquema = None
+    try:
+        for bloco in blocos:
+            tabela = pa.Table.from_pandas(_sem_categorias(bloco), schema=esquema, preserve_index=False)
+            if escritor is None:
+                esquema = tabela.schema
+                escritor = pq.ParquetWriter(caminho, esquema)
+            escritor.write_table(tabela)
+            linhas += len(bloco)
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+    if escritor is None:
+        pq.write_table(pa.table({}), caminho)
+    return linhas
+
+
+def _gravar_xlsx(blocos, caminho):
+    """XLSX em modo write-only; passando do limite de linhas, continua numa nova planilha"""
+    if Workbook is None:
+        raise ImportError("openpyxl não está instalado: instale com 'pip install openpyxl' para exportar XLSX")
+
+    pasta_trabalho = Workbook(write_only=True)
+    planilha = None
+    linhas_planilha = 0
+    linhas = 0
+    for bloco in blocos:
+        # Valores como objetos Python; NaN vira célula vazia
+        valores = bloco.astype(object).where(bloco.notna(), None).to_numpy().tolist()
+        for linha in valores:
+            if planilha is None or linhas_planilha == LINHAS_POR_PLANILHA_XLSX:
+                planilha = pasta_trabalho.create_sheet(f"Planilha{len(pasta_trabalho.worksheets) + 1}")
+                planilha.append(list(bloco.columns))
+                linhas_planilha = 0
+            planilha.append(linha)
+            linhas_planilha += 1
+        linhas += len(bloco)
+
+    if planilha is None:
+        pasta_trabalho.create_sheet("Planilha1")
+    pasta_trabalho.save(caminho)
+    return linhas
+
+
+GRAVADORES_EXPORTACAO = {
+    'csv': _gravar_csv,
+    'parquet': _gravar_parquet,
+    'xlsx': _gravar_xlsx,
+}
+
+
+def exportar_blocos(blocos, caminho, formato='csv'):
+    """
+    Grava os blocos em `caminho` no formato pedido ('csv', 'parquet' ou
+    'xlsx') e devolve o número de linhas gravadas. O arquivo é montado num
+    .tmp e só substitui o destino no fim, então uma falha no meio não deixa
+    exportação pela metade.
+    """
+    if formato not in GRAVADORES_EXPORTACAO:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+
+    caminho = os.fspath(caminho)
+    temporario = caminho + '.tmp'
+    try:
+        linhas = GRAVADORES_EXPORTACAO[formato](blocos, temporario)
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return linhas
@@ -0,0 +1,170 @@
+"""
+Formatação pt-BR de valores monetários e CPFs, compartilhada pelas páginas.
+
+As funções escalares (`format_value`, `format_cpf_completo`) são as mesmas
+usadas até aqui. A versão vetorizada `formatar_valores` trabalha sobre uma
+Series/array inteira e devolve exatamente o mesmo texto que aplicar
+`format_value` linha a linha.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Troca os separadores do formato en-US ("1,234.56") pelos do pt-BR ("1.234,56")
+TRADUCAO_PT_BR = str.maketrans(",.", ".,")
+
+# Acima disso os centavos não cabem com folga em int64; usa o formato do Python
+LIMITE_VETORIZADO = 1e15
+
+
+def format_value(val, manter_invalidos=False):
+    """
+    Formata valores monetários. Com `manter_invalidos`, devolve sem alteração
+    o que não for número, em vez de `str(val)`.
+    """
+    return _texto_escalar(val, manter_invalidos, separador_milhar=True)
+
+
+@lru_cache(maxsize=65536)
+def format_cpf_completo(cpf):
+    """Formata CPF completo para exibição (sem máscara)"""
+    if not cpf or cpf is None:
+        return "N/A"
+
+    # Remove formatação existente
+    cpf_limpo = str(cpf).replace(".", "").replace("-", "").replace(" ", "")
+
+    if len(cpf_limpo) == 11 and cpf_limpo.isdigit():
+        return f"{cpf_limpo[:3]}.{cpf_limpo[3:6]}.{cpf_limpo[6:9]}-{cpf_limpo[9:]}"
+    return str(cpf)
+
+
+def _texto_escalar(val, manter_invalidos, separador_milhar):
+    """Formata um único valor como `format_value` (ou sem milhar)"""
+    formato = "{:,.2f}" if separador_milhar else "{:.2f}"
+    try:
+        return formato.format(float(val)).translate(TRADUCAO_PT_BR)
+    except:
+        return val if manter_invalidos else str(val)
+
+
+def _mapear_distintos(dados, funcao):
+    """Aplica `funcao` uma vez por valor distinto de um array de objetos"""
+    cache = {}
+    resultado = np.empty(len(dados), dtype=object)
+    for i, valor in enumerate(dados):
+        try:
+            resultado[i] = cache[valor]
+        except KeyError:
+            resultado[i] = cache[valor] = funcao(valor)
+        except TypeError:  # valor não hashable
+            resultado[i] = funcao(valor)
+    return resultado
+
+
+def _quantidade_digitos(inteiros):
+    """Número de dígitos decimais de cada inteiro não negativo (mínimo 1)"""
+    digitos = np.ones(len(inteiros), dtype=np.int64)
+    potencia = 10
+    while (inteiros >= potencia).any():
+        digitos += inteiros >= potencia
+        potencia *= 10
+    return digitos
+
+
+def _formatar_floats(x, prefixo, separador_milhar):
+    """
+    Formata um array float64. Devolve (textos, pendentes), onde `pendentes`
+    marca os elementos que precisam do formato do Python: não finitos, muito
+    grandes ou a menos de um ulp de meio centavo, onde o arredondamento de
+    `x * 100` poderia divergir do arredondamento exato de `format`.
+
+    Os textos são montados numa matriz de códigos de caractere (uma linha por
+    valor, alinhada à direita) que depois é lida como array de strings.
+    """
+    centavos = x * 100
+    with np.errstate(invalid='ignore', over='ignore'):
+        fracao = np.abs(centavos - np.floor(centavos))
+        pendentes = (~np.isfinite(x)) | (np.abs(x) >= LIMITE_VETORIZADO) | (
+            np.abs(fracao - 0.5) <= 2 * np.spacing(np.abs(centavos)))
+
+    seguros = ~pendentes
+    centavos = np.abs(np.rint(centavos[seguros])).astype(np.int64)
+    inteiros = centavos // 100
+    # O sinal segue o do float original, como em f"{-0.001:.2f}" == "-0.00"
+    negativos = np.signbit(x[seguros])
+
+    digitos = _quantidade_digitos(inteiros)
+    separadores = (digitos - 1) // 3 if separador_milhar else np.zeros_like(digitos)
+    max_digitos = int(digitos.max()) if len(digitos) else 1
+    largura = len(prefixo) + 1 + max_digitos + (max_digitos - 1) // 3 + 3
+    linhas = np.arange(len(inteiros))
+
+    matriz = np.zeros((len(inteiros), largura), dtype=np.uint32)
+    matriz[:, -1] = ord("0") + centavos % 10
+    matriz[:, -2] = ord("0") + centavos // 10 % 10
+    matriz[:, -3] = ord(",")
+    coluna = largura - 4
+    for k in range(max_digitos):
+        if separador_milhar and k and k % 3 == 0:
+            matriz[:, coluna] = np.where(digitos > k, ord("."), 0)
+            coluna -= 1
+        matriz[:, coluna] = np.where(digitos > k, ord("0") + inteiros % 10, 0)
+        inteiros = inteiros // 10
+        coluna -= 1
+
+    # Sinal e prefixo ficam logo antes do primeiro dígito
+    inicio = largura - 3 - digitos - separadores
+    matriz[linhas[negativos], inicio[negativos] - 1] = ord("-")
+    inicio = inicio - negativos
+    for caractere in reversed(prefixo):
+        inicio = inicio - 1
+        matriz[linhas, inicio] = ord(caractere)
+
+    # Alinha à esquerda: o que sobra no fim da linha fica com caractere nulo,
+    # que o numpy descarta ao ler a string
+    colunas = np.arange(largura) + inicio[:, None]
+    matriz = np.take_along_axis(matriz, np.minimum(colunas, largura - 1), axis=1)
+    matriz[colunas >= largura] = 0
+    textos_seguros = matriz.view(f"<U{largura}").ravel()
+    textos = np.empty(len(x), dtype=object)
+    textos[seguros] = textos_seguros
+    return textos, pendentes
+
+
+def formatar_valores(valores, prefixo="", manter_invalidos=False, separador_milhar=True):
+    """
+    Versão vetorizada de `format_value` para uma Series/array inteira.
+
+    - `prefixo`: texto colado antes de cada valor (ex.: "R$ ")
+    - `manter_invalidos`: devolve sem alteração o que não for número, em vez de `str(val)`
+    - `separador_milhar`: com False, gera "1234,56" (formato usado nos CSVs)
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores)
+    resultado = np.empty(len(serie), dtype=object)
+
+    if len(serie):
+        dados = serie.to_numpy()
+        if isinstance(serie.dtype, pd.CategoricalDtype) or dados.dtype.kind not in "biuf":
+            # Textos/objetos: formata cada valor distinto uma vez só
+            if pd.api.types.infer_dtype(dados, skipna=False) in ("floating", "integer", "mixed-integer-float"):
+                dados = dados.astype(np.float64)
+            else:
+                resultado = _mapear_distintos(
+                    dados, lambda v: _texto_escalar(v, manter_invalidos, separador_milhar))
+                dados = None
+
+        if dados is not None:
+            x = dados.astype(np.float64)
+            resultado, pendentes = _formatar_floats(x, prefixo, separador_milhar)
+            for i in np.flatnonzero(pendentes):
+                resultado[i] = prefixo + _texto_escalar(x[i], manter_invalidos, separador_milhar)
+        elif prefixo:
+            resultado = np.array([prefixo + str(t) for t in resultado], dtype=object)
+
+    if isinstance(valores, pd.Series):
+        return pd.Series(resultado, index=valores.index, name=valores.name, dtype=object)
+    return resultado
+
@@ -3,12 +3,12 @@ import os
 import pandas as pd
 import io
 from datetime import datetime
-import base64
 import locale
 import sys
 import json
 import pickle
 import hashlib
+import time
 from pathlib import Path
 from functools import lru_cache
 
@@ -19,6 +19,12 @@ except ImportError:
     st.error("Biblioteca FPDF não encontrada. Instale com: pip install fpdf2")
     FPDF = None
 
+# Hash rápido opcional para chaves de cache (sem ele, usa BLAKE2 da hashlib)
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 # Configuração da página
 st.set_page_config(
     page_title="S-5002 - Informe de Imposto (Otimizado)",
@@ -27,13 +33,36 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Configuração do parser XML
-try:
-    from lxml import etree
-    USAR_LXML = True
-except ImportError:
-    import xml.etree.ElementTree as etree
-    USAR_LXML = False
+# Módulos compartilhados ficam na pasta do main.py
+PASTA_MODULOS = str(Path(__file__).resolve().parent.parent)
+if PASTA_MODULOS not in sys.path:
+    sys.path.insert(0, PASTA_MODULOS)
+
+# Parser XML e indexação (módulo compartilhado com os processos filhos)
+from s5002_processamento import (
+    abrir_cache_xmls,
+    comparar_impressoes,
+    contar_cache_xmls,
+    gravar_cache_xml,
+    indexar_arquivos_s5002,
+    ler_cache_xml,
+    limpar_cache_xmls,
+    filtrar_tabelas_s5002,
+    listar_xmls_s5002,
+    processar_xml_s5002
+)
+from downloads import gravar_exportacao, oferecer_download
+from formatacao import format_value, formatar_valores
+from comprovante_in2060 import (
+    CAMPOS_COMPROVANTE_IN2060,
+    calcular_comprovante_in2060,
+    consolidar_dados_s5002,
+    cpfs_concluidos_in2060,
+    empacotar_comprovantes_in2060,
+    gerar_comprovantes_in2060,
+    nome_comprovante_in2060,
+    renderizar_comprovante_in2060
+)
 
 # --- Configuração inicial ---
 try:
@@ -44,77 +73,20 @@ except:
     except:
         pass
 
-# Namespaces possíveis para S-5002
-NAMESPACES_S5002 = {
-    'ns1': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v_S_01_03_00',
-    'ns2': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v_S_01_02_00',
-    'ns3': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v_S_01_01_00',
-    'ns4': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v02_05_00',
-    'ns5': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v02_04_02'
-}
-
 # Caminhos (ajuste conforme necessário)
 PASTA_BASE = r"C:\Users\tst\OneDrive\Área de Trabalho\Meus Phytons\.vscode\pages\Eventos_eSocial"
 ARQUIVO_CODIGOS = r"C:\Users\tst\OneDrive\Área de Trabalho\Meus Phytons\codigos_s5002.json"
 ARQUIVO_MAPEAMENTO = r"C:\Users\tst\OneDrive\Área de Trabalho\Meus Phytons\mapeamento_in2060.json"
 
 # Arquivos de cache
-CACHE_XMLS = Path("cache_s5002_xmls.pkl")
+CACHE_XMLS = Path("cache_s5002_xmls.sqlite")
+CACHE_XMLS_LEGADO = Path("cache_s5002_xmls.pkl")  # Formato antigo (pickle único), removido na primeira carga
 CACHE_INDICE = Path("cache_s5002_indice.pkl")
-CACHE_VERSAO = "2.4"
-
-# --- Estrutura do Comprovante IN 2060/2021 ---
-CAMPOS_COMPROVANTE_IN2060 = {
-    "quadro3": {
-        "nome": "Quadro 3 - Rendimentos Tributáveis, Deduções e Imposto sobre a Renda Retido na Fonte (IRRF)",
-        "linhas": {
-            "linha1": "Total dos rendimentos tributáveis (inclusive férias e décimo terceiro salário)",
-            "linha2": "Dedução: Contribuição à Previdência Oficial",
-            "linha3": "Dedução: Contribuição a entidades de previdência complementar",
-            "linha4": "Dedução: Pensão alimentícia",
-            "linha5": "Imposto sobre a Renda Retido na Fonte (IRRF)",
-            "linha6": "Rendimentos isentos de pensão, proventos de aposentadoria ou reforma por moléstia grave"
-        }
-    },
-    "quadro4": {
-        "nome": "Quadro 4 - Rendimentos Isentos e Não-Tributáveis",
-        "linhas": {
-            "linha1": "Parcela isenta dos proventos de aposentadoria (65 anos ou mais), exceto 13º",
-            "linha2": "Parcela isenta do 13º salário (65 anos ou mais)",
-            "linha3": "Diárias",
-            "linha4": "Pensão e proventos por moléstia grave ou acidente em serviço",
-            "linha5": "Outros rendimentos isentos e não-tributáveis"
-        }
-    },
-    "quadro5": {
-        "nome": "Quadro 5 - Rendimentos Sujeitos à Tributação Exclusiva",
-        "linhas": {
-            "linha1": "Décimo terceiro salário",
-            "linha2": "Imposto sobre a Renda Retido na Fonte sobre 13º salário",
-            "linha3": "Participação nos Lucros ou Resultados (PLR)",
-            "linha4": "Imposto sobre a Renda Retido na Fonte sobre PLR",
-            "linha5": "Outros rendimentos sujeitos à tributação exclusiva"
-        }
-    },
-    "quadro6": {
-        "nome": "Quadro 6 - Rendimentos Recebidos Acumuladamente (RRA)",
-        "linhas": {
-            "linha1": "Total dos rendimentos tributáveis (RRA)",
-            "linha2": "Dedução: Contribuição à Previdência Oficial (RRA)",
-            "linha3": "Dedução: Contribuição a entidades de previdência complementar (RRA)",
-            "linha4": "Dedução: Pensão alimentícia (RRA)",
-            "linha5": "Imposto sobre a Renda Retido na Fonte (RRA)"
-        }
-    },
-    "quadro7": {
-        "nome": "Quadro 7 - Informações Complementares",
-        "linhas": {
-            "linha1": "Rendimentos com exigibilidade suspensa",
-            "linha2": "Depósitos judiciais",
-            "linha3": "Outras informações"
-        }
-    }
-}
+CACHE_VERSAO = "2.7"
+CACHE_INDICE_VERSAO = "3.1"  # Índice com impressão digital (tamanho, mtime) e cabeçalho por arquivo
+
+# Geração de comprovantes em lote (ZIP final e pasta de trabalho para retomada)
+PASTA_LOTES_IN2060 = Path("lotes_in2060")
 
 # --- Mapeamento Padrão Sugerido ---
 MAPEAMENTO_PADRAO_SUGERIDO = {
@@ -180,53 +152,12 @@ MAPEAMENTO_PADRAO_SUGERIDO = {
 def voltar_pagina_principal():
     st.switch_page("main.py")
 
-def format_value(val):
-    """Formata valores monetários"""
-    try:
-        return f"{float(val):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except:
-        return val
-
 def filtrar_cpfs(cpfs, termo_busca):
     """Filtra CPFs baseado no termo de busca"""
     if not termo_busca:
         return cpfs
     return [cpf for cpf in cpfs if termo_busca.replace(".", "").replace("-", "") in cpf.replace(".", "").replace("-", "")]
 
-def mapear_codigo_corrigido(codigo):
-    """Mapeia códigos inválidos conhecidos para códigos válidos"""
-    mapeamento_correcoes = {
-        '011': '11',   # Remove zero à esquerda
-        '341': '34',   # Possível erro de digitação
-        '431': '43',   # Possível erro de digitação
-        '179': '79',   # Possível erro de digitação
-    }
-    return mapeamento_correcoes.get(codigo, codigo)
-
-def get_descricao_codigo_melhorada(codigos_dict, codigo, tipo_codigo="Código"):
-    """Versão melhorada que trata códigos inválidos conhecidos"""
-    if not codigo:
-        return f'{tipo_codigo} não informado'
-    
-    codigo_str = str(codigo).strip()
-    
-    # Primeiro tenta busca direta
-    if codigo_str in codigos_dict:
-        return codigos_dict[codigo_str]
-    
-    # Tenta código corrigido se não encontrou
-    codigo_corrigido = mapear_codigo_corrigido(codigo_str)
-    if codigo_corrigido != codigo_str and codigo_corrigido in codigos_dict:
-        return f"{codigos_dict[codigo_corrigido]} (código original: {codigo_str})"
-    
-    # Remove zeros à esquerda
-    codigo_sem_zeros = codigo_str.lstrip('0')
-    if codigo_sem_zeros and codigo_sem_zeros in codigos_dict:
-        return f"{codigos_dict[codigo_sem_zeros]} (código: {codigo_str})"
-    
-    # Se não encontrou, retorna erro informativo
-    return f'Código {codigo_str} não catalogado no sistema'
-
 @lru_cache(maxsize=1)
 def carregar_codigos_s5002():
     """Carrega os códigos de descrição do arquivo JSON com cache"""
@@ -254,37 +185,82 @@ def carregar_mapeamento_personalizado():
         return MAPEAMENTO_PADRAO_SUGERIDO.copy()
 
 # --- Sistema de Cache ---
-def get_file_hash(file_path):
-    """Gera hash do arquivo para detectar mudanças"""
+# mtime mais recente que isso pode não ter mudado numa regravação (resolução de FAT/rede)
+JANELA_MTIME_AMBIGUO_NS = 2_000_000_000
+# Bytes lidos do início e do fim do arquivo na impressão digital
+TAMANHO_BLOCO_IMPRESSAO = 64 * 1024
+
+def _hash_bytes(dados):
+    """Hash rápido (xxhash se disponível, senão BLAKE2)"""
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(dados)
+    return hashlib.blake2b(dados, digest_size=16).hexdigest()
+
+def hash_conteudo_rapido(file_path):
+    """Hash rápido do conteúdo inteiro"""
+    return _hash_bytes(Path(file_path).read_bytes())
+
+def hash_extremidades(file_path, tamanho):
+    """Hash do primeiro e do último bloco do arquivo (o arquivo inteiro, se for pequeno)"""
+    with open(file_path, 'rb') as arquivo:
+        if tamanho <= 2 * TAMANHO_BLOCO_IMPRESSAO:
+            return _hash_bytes(arquivo.read())
+        inicio = arquivo.read(TAMANHO_BLOCO_IMPRESSAO)
+        arquivo.seek(-TAMANHO_BLOCO_IMPRESSAO, os.SEEK_END)
+        return _hash_bytes(inicio + arquivo.read())
+
+def get_file_fingerprint(file_path):
+    """
+    Gera impressão digital (tamanho, mtime_ns e hash do início e do fim do
+    arquivo) para detectar mudanças, inclusive regravações que preservam
+    tamanho e mtime (cópias com data preservada, sincronização de nuvem).
+    """
     try:
-        return hashlib.md5(Path(file_path).read_bytes()).hexdigest()
+        info = os.stat(file_path)
+        fingerprint = f"{info.st_size}_{info.st_mtime_ns}_{hash_extremidades(file_path, info.st_size)}"
+
+        # Arquivo acabou de ser gravado: o mtime pode não ter mudado, lê o conteúdo inteiro
+        if time.time_ns() - info.st_mtime_ns < JANELA_MTIME_AMBIGUO_NS:
+            fingerprint += f"_{hash_conteudo_rapido(file_path)}"
+
+        return fingerprint
     except:
         return None
 
 def carregar_cache():
-    """Carrega cache existente ou cria novo"""
-    if CACHE_XMLS.exists():
+    """Abre o cache de XMLs (uma entrada por arquivo, lida sob demanda)"""
+    if CACHE_XMLS_LEGADO.exists():
         try:
-            with open(CACHE_XMLS, 'rb') as f:
-                cache = pickle.load(f)
-                if cache.get('versao') == CACHE_VERSAO:
-                    return cache.get('dados', {})
-        except:
+            CACHE_XMLS_LEGADO.unlink()
+        except OSError:
             pass
-    return {}
+    try:
+        return abrir_cache_xmls(CACHE_XMLS)
+    except Exception as e:
+        st.warning(f"Erro ao abrir cache: {e}")
+        return None
 
-def salvar_cache(cache_dados):
-    """Salva cache em disco"""
+def salvar_cache(conn):
+    """Fecha o cache (cada entrada já foi confirmada ao ser gravada)"""
+    if conn is None:
+        return
     try:
-        cache = {
-            'versao': CACHE_VERSAO,
-            'dados': cache_dados,
-            'timestamp': datetime.now()
-        }
-        with open(CACHE_XMLS, 'wb') as f:
-            pickle.dump(cache, f)
+        conn.close()
+    except Exception as e:
+        st.warning(f"Erro ao fechar cache: {e}")
+
+def gravar_cache(conn, chave, arquivo, dados):
+    """Grava um XML processado no cache; falha de gravação não interrompe o processamento"""
+    try:
+        gravar_cache_xml(conn, chave, arquivo, CACHE_VERSAO, dados)
     except Exception as e:
-        st.warning(f"Erro ao salvar cache: {e}")
+        st.warning(f"Erro ao gravar cache de {arquivo}: {e}")
+
+def limpar_caches():
+    """Apaga o índice de CPFs e esvazia o cache de XMLs"""
+    if CACHE_INDICE.exists():
+        CACHE_INDICE.unlink()
+    limpar_cache_xmls(CACHE_XMLS)
 
 def carregar_indice_cpfs():
     """Carrega índice de CPFs ou cria novo"""
@@ -292,7 +268,7 @@ def carregar_indice_cpfs():
         try:
             with open(CACHE_INDICE, 'rb') as f:
                 indice = pickle.load(f)
-                if indice.get('versao') == CACHE_VERSAO:
+                if indice.get('versao') == CACHE_INDICE_VERSAO:
                     return indice.get('dados', {})
         except:
             pass
@@ -302,7 +278,7 @@ def salvar_indice_cpfs(indice_dados):
     """Salva índice de CPFs"""
     try:
         indice = {
-            'versao': CACHE_VERSAO,
+            'versao': CACHE_INDICE_VERSAO,
             'dados': indice_dados,
             'timestamp': datetime.now()
         }
@@ -312,287 +288,100 @@ def salvar_indice_cpfs(indice_dados):
         st.warning(f"Erro ao salvar índice: {e}")
 
 # --- Parser XML Otimizado ---
-def parse_xml_rapido(file_path):
-    """Parser mais rápido e seguro usando lxml se disponível"""
-    try:
-        file_path = Path(file_path)
-        
-        if USAR_LXML:
-            parser = etree.XMLParser(
-                recover=True, 
-                huge_tree=True,
-                strip_cdata=False,
-                resolve_entities=False,
-                load_dtd=False,
-                no_network=True
-            )
-            
-            with open(file_path, 'rb') as f:
-                xml_content = f.read()
-            
-            return etree.fromstring(xml_content, parser)
-        else:
-            import xml.etree.ElementTree as ET
-            
-            encodings = ['utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252']
-            
-            for encoding in encodings:
-                try:
-                    with open(file_path, 'r', encoding=encoding) as f:
-                        content = f.read()
-                    return ET.fromstring(content)
-                except (UnicodeDecodeError, ET.ParseError):
-                    continue
-            
-            tree = ET.parse(str(file_path))
-            return tree.getroot()
-            
-    except Exception as e:
-        st.warning(f"Erro no parser XML para {file_path.name}: {str(e)}")
-        return None
-
-def detectar_namespace_s5002(root):
-    """Detecta o namespace correto para S-5002 no XML"""
-    if root is None:
-        return None, None
-        
-    for ns_name, ns_uri in NAMESPACES_S5002.items():
-        ns_dict = {ns_name: ns_uri}
-        evt = root.find(f'.//{ns_name}:evtIrrfBenef', ns_dict)
-        if evt is not None:
-            return ns_dict, ns_name
-
-    for elem in root.iter():
-        if elem.tag.endswith('evtIrrfBenef'):
-            if '}' in elem.tag:
-                namespace_uri = elem.tag.split('}')[0][1:]
-                return {'ns': namespace_uri}, 'ns'
-
-    return None, None
-
-def verificar_arquivo_s5002_rapido(file_path):
-    """Verificação rápida se o arquivo é S-5002"""
-    try:
-        file_path = Path(file_path)
-        
-        if 'S-5002' in file_path.name.upper():
-            return True
-
-        encodings = ['utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252']
-        
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    primeiras_linhas = f.read(2048)
-                    return 'evtIrrfBenef' in primeiras_linhas or 'S-5002' in primeiras_linhas
-            except UnicodeDecodeError:
-                continue
-                
-        return False
-    except Exception:
-        return False
-
-def extrair_cpf_rapido(file_path):
-    """Extrai apenas o CPF do arquivo XML"""
-    try:
-        if not verificar_arquivo_s5002_rapido(file_path):
-            return None
-
-        root = parse_xml_rapido(file_path)
-        if root is None:
-            return None
-
-        ns_dict, ns_prefix = detectar_namespace_s5002(root)
-        if not ns_dict:
-            return None
-
-        ide_trab = root.find(f'.//{ns_prefix}:ideTrabalhador', ns_dict)
-        if ide_trab is None:
-            return None
-
-        cpf_elem = ide_trab.find(f'{ns_prefix}:cpfBenef', ns_dict)
-        if cpf_elem is None:
-            return None
-
-        return cpf_elem.text
-
-    except Exception as e:
-        st.warning(f"Erro ao extrair CPF de {Path(file_path).name}: {str(e)}")
-        return None
-
 def processar_xml_completo(file_path):
     """Processa arquivo XML completo com tratamento melhorado de códigos"""
     try:
-        codigos = carregar_codigos_s5002()
-
-        root = parse_xml_rapido(file_path)
-        if root is None:
-            return None
-
-        ns_dict, ns_prefix = detectar_namespace_s5002(root)
-        if not ns_dict:
-            return None
-
-        evt = root.find(f'.//{ns_prefix}:evtIrrfBenef', ns_dict)
-        if evt is None:
-            return None
-
-        ide_evento = evt.find(f'{ns_prefix}:ideEvento', ns_dict)
-        ide_empregador = evt.find(f'{ns_prefix}:ideEmpregador', ns_dict)
-        ide_trabalhador = evt.find(f'{ns_prefix}:ideTrabalhador', ns_dict)
-
-        dados = {
-            'arquivo': Path(file_path).name,
-            'nrRecArqBase': ide_evento.find(f'{ns_prefix}:nrRecArqBase', ns_dict).text if ide_evento and ide_evento.find(f'{ns_prefix}:nrRecArqBase', ns_dict) is not None else '',
-            'perApur': ide_evento.find(f'{ns_prefix}:perApur', ns_dict).text if ide_evento and ide_evento.find(f'{ns_prefix}:perApur', ns_dict) is not None else '',
-            'tpInsc': ide_empregador.find(f'{ns_prefix}:tpInsc', ns_dict).text if ide_empregador and ide_empregador.find(f'{ns_prefix}:tpInsc', ns_dict) is not None else '',
-            'nrInsc': ide_empregador.find(f'{ns_prefix}:nrInsc', ns_dict).text if ide_empregador and ide_empregador.find(f'{ns_prefix}:nrInsc', ns_dict) is not None else '',
-            'cpfBenef': ide_trabalhador.find(f'{ns_prefix}:cpfBenef', ns_dict).text if ide_trabalhador and ide_trabalhador.find(f'{ns_prefix}:cpfBenef', ns_dict) is not None else '',
-            'pagamentos': [],
-            'dependentes': [],
-            'deducoes_dependentes': []
-        }
-
-        if ide_trabalhador is not None:
-            for dm_dev in ide_trabalhador.findall(f'{ns_prefix}:dmDev', ns_dict):
-                cod_categ_elem = dm_dev.find(f'{ns_prefix}:codCateg', ns_dict)
-                cod_categ = cod_categ_elem.text if cod_categ_elem is not None else ''
-                per_ref = dm_dev.find(f'{ns_prefix}:perRef', ns_dict).text if dm_dev.find(f'{ns_prefix}:perRef', ns_dict) is not None else ''
-                
-                pagamento = {
-                    'perRef': per_ref,
-                    'ideDmDev': dm_dev.find(f'{ns_prefix}:ideDmDev', ns_dict).text if dm_dev.find(f'{ns_prefix}:ideDmDev', ns_dict) is not None else '',
-                    'tpPgto': dm_dev.find(f'{ns_prefix}:tpPgto', ns_dict).text if dm_dev.find(f'{ns_prefix}:tpPgto', ns_dict) is not None else '',
-                    'dtPgto': dm_dev.find(f'{ns_prefix}:dtPgto', ns_dict).text if dm_dev.find(f'{ns_prefix}:dtPgto', ns_dict) is not None else '',
-                    'codCateg': cod_categ,
-                    'codCategDesc': get_descricao_codigo_melhorada(codigos['CodCateg'], cod_categ, 'CodCateg'),
-                    'infoIR': [],
-                    'totApurMen': {},
-                    'dependentes': [],  # Dependentes específicos deste pagamento
-                    'deducoes_dependentes': []  # Deduções específicas deste pagamento
-                }
-
-                # Informações de IR com tratamento melhorado
-                for info_ir in dm_dev.findall(f'{ns_prefix}:infoIR', ns_dict):
-                    tp_info_ir_elem = info_ir.find(f'{ns_prefix}:tpInfoIR', ns_dict)
-                    tp_info_ir = tp_info_ir_elem.text if tp_info_ir_elem is not None else ''
-
-                    pagamento['infoIR'].append({
-                        'tpInfoIR': tp_info_ir,
-                        'tpInfoIRDesc': get_descricao_codigo_melhorada(codigos['TPInfoIR'], tp_info_ir, 'TPInfoIR'),
-                        'valor': float(info_ir.find(f'{ns_prefix}:valor', ns_dict).text) if info_ir.find(f'{ns_prefix}:valor', ns_dict) is not None else 0.0,
-                        'descRendimento': info_ir.find(f'{ns_prefix}:descRendimento', ns_dict).text if info_ir.find(f'{ns_prefix}:descRendimento', ns_dict) is not None else ''
-                    })
-
-                # Totalização mensal
-                tot_apur_men = dm_dev.find(f'{ns_prefix}:totApurMen', ns_dict)
-                if tot_apur_men is not None:
-                    pagamento['totApurMen'] = {
-                        'CRMen': tot_apur_men.find(f'{ns_prefix}:CRMen', ns_dict).text if tot_apur_men.find(f'{ns_prefix}:CRMen', ns_dict) is not None else '',
-                        'vlrRendTrib': float(tot_apur_men.find(f'{ns_prefix}:vlrRendTrib', ns_dict).text) if tot_apur_men.find(f'{ns_prefix}:vlrRendTrib', ns_dict) is not None else 0.0,
-                        'vlrPrevOficial': float(tot_apur_men.find(f'{ns_prefix}:vlrPrevOficial', ns_dict).text) if tot_apur_men.find(f'{ns_prefix}:vlrPrevOficial', ns_dict) is not None else 0.0,
-                        'vlrCRMen': float(tot_apur_men.find(f'{ns_prefix}:vlrCRMen', ns_dict).text) if tot_apur_men.find(f'{ns_prefix}:vlrCRMen', ns_dict) is not None else 0.0,
-                        'vlrIsenOutros': float(tot_apur_men.find(f'{ns_prefix}:vlrIsenOutros', ns_dict).text) if tot_apur_men.find(f'{ns_prefix}:vlrIsenOutros', ns_dict) is not None else 0.0,
-                        'descRendimento': tot_apur_men.find(f'{ns_prefix}:descRendimento', ns_dict).text if tot_apur_men.find(f'{ns_prefix}:descRendimento', ns_dict) is not None else ''
-                    }
-
-                # Processamento de dependentes por pagamento (dentro de dm_dev)
-                info_complem = dm_dev.find(f'{ns_prefix}:infoIRComplem', ns_dict)
-                if info_complem is not None:
-                    for ide_dep in info_complem.findall(f'{ns_prefix}:ideDep', ns_dict):
-                        tp_dep_elem = ide_dep.find(f'{ns_prefix}:tpDep', ns_dict)
-                        tp_dep = tp_dep_elem.text if tp_dep_elem is not None else ''
-
-                        pagamento['dependentes'].append({
-                            'cpfDep': ide_dep.find(f'{ns_prefix}:cpfDep', ns_dict).text if ide_dep.find(f'{ns_prefix}:cpfDep', ns_dict) is not None else '',
-                            'depIRRF': ide_dep.find(f'{ns_prefix}:depIRRF', ns_dict).text if ide_dep.find(f'{ns_prefix}:depIRRF', ns_dict) is not None else '',
-                            'dtNascto': ide_dep.find(f'{ns_prefix}:dtNascto', ns_dict).text if ide_dep.find(f'{ns_prefix}:dtNascto', ns_dict) is not None else '',
-                            'nome': ide_dep.find(f'{ns_prefix}:nome', ns_dict).text if ide_dep.find(f'{ns_prefix}:nome', ns_dict) is not None else '',
-                            'tpDep': tp_dep,
-                            'tpDepDesc': get_descricao_codigo_melhorada(codigos['TPDep'], tp_dep, 'TPDep'),
-                            'perRef': per_ref  # Associa dependente ao período
-                        })
-
-                    # Deduções por dependente deste pagamento
-                    for info_ircr in info_complem.findall(f'{ns_prefix}:infoIRCR', ns_dict):
-                        for ded_depen in info_ircr.findall(f'{ns_prefix}:dedDepen', ns_dict):
-                            pagamento['deducoes_dependentes'].append({
-                                'tpRend': ded_depen.find(f'{ns_prefix}:tpRend', ns_dict).text if ded_depen.find(f'{ns_prefix}:tpRend', ns_dict) is not None else '',
-                                'cpfDep': ded_depen.find(f'{ns_prefix}:cpfDep', ns_dict).text if ded_depen.find(f'{ns_prefix}:cpfDep', ns_dict) is not None else '',
-                                'vlrDedDep': float(ded_depen.find(f'{ns_prefix}:vlrDedDep', ns_dict).text) if ded_depen.find(f'{ns_prefix}:vlrDedDep', ns_dict) is not None else 0.0,
-                                'perRef': per_ref  # Associa dedução ao período
-                            })
-
-                dados['pagamentos'].append(pagamento)
-
-            # Consolida dependentes globalmente (para compatibilidade com código anterior)
-            for pagamento in dados['pagamentos']:
-                dados['dependentes'].extend(pagamento['dependentes'])
-                dados['deducoes_dependentes'].extend(pagamento['deducoes_dependentes'])
-
-        return dados
-
+        return processar_xml_s5002(file_path, carregar_codigos_s5002())
     except Exception as e:
         st.warning(f"Erro ao processar {Path(file_path).name}: {str(e)}")
         return None
 
 # --- Funções de Indexação ---
 def criar_indice_cpfs_otimizado():
-    """Cria índice otimizado de CPFs para arquivos"""
+    """Cria ou atualiza incrementalmente o índice de CPFs para arquivos"""
     indice_cache = carregar_indice_cpfs()
-    if indice_cache:
-        return indice_cache
+    indice = indice_cache.get('cpfs', {})
+    # arquivo -> (tamanho, mtime_ns, cpfBenef, perApur, nrRecArqBase)
+    indexados = indice_cache.get('arquivos', {})
 
-    indice = {}
-    
     try:
-        arquivos_xml = [f for f in os.listdir(PASTA_BASE) if f.lower().endswith('.xml')]
+        arquivos_atuais = listar_xmls_s5002(PASTA_BASE)
     except Exception as e:
         st.error(f"Erro ao acessar pasta {PASTA_BASE}: {e}")
         return indice
 
-    if not arquivos_xml:
+    if not arquivos_atuais:
         st.warning("Nenhum arquivo XML encontrado na pasta especificada.")
+        return {}
+
+    alterados, removidos = comparar_impressoes(indexados, arquivos_atuais)
+    if not alterados and not removidos:
         return indice
 
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    indice_novo = not indexados
+    cpfs_afetados = set()
+
+    # Retira do índice os arquivos apagados ou modificados
+    for arquivo in removidos + alterados:
+        anterior = indexados.pop(arquivo, None)
+        cpf_anterior = anterior[2] if anterior else None
+        if cpf_anterior in indice and arquivo in indice[cpf_anterior]:
+            indice[cpf_anterior].remove(arquivo)
+            if not indice[cpf_anterior]:
+                del indice[cpf_anterior]
+
+    if alterados:
+        progress_bar = st.progress(0)
+        status_text = st.empty()
 
-    total_arquivos = len(arquivos_xml)
+    total_arquivos = len(alterados)
+    concluidos = 0
     processados_com_sucesso = 0
     erros = 0
 
-    for i, arquivo in enumerate(arquivos_xml):
-        file_path = os.path.join(PASTA_BASE, arquivo)
-
-        try:
-            cpf = extrair_cpf_rapido(file_path)
+    # Lotes chegam fora de ordem quando processados em paralelo
+    for lote in indexar_arquivos_s5002(PASTA_BASE, alterados):
+        for arquivo, cabecalho, erro in lote:
+            cabecalho = cabecalho or {}
+            cpf = cabecalho.get('cpfBenef')
+
+            # Arquivos sem CPF também são registrados para não serem relidos a cada carga
+            indexados[arquivo] = (
+                *arquivos_atuais[arquivo],
+                cpf,
+                cabecalho.get('perApur', ''),
+                cabecalho.get('nrRecArqBase', '')
+            )
 
             if cpf:
                 if cpf not in indice:
                     indice[cpf] = []
                 indice[cpf].append(arquivo)
+                cpfs_afetados.add(cpf)
                 processados_com_sucesso += 1
             else:
                 erros += 1
+                if erro:
+                    st.warning(f"Erro ao processar {arquivo}: {erro}")
 
-        except Exception as e:
-            erros += 1
-            st.warning(f"Erro ao processar {arquivo}: {str(e)}")
+        concluidos += len(lote)
+        progress_bar.progress(concluidos / total_arquivos)
+        status_text.text(f"Indexando arquivos: {concluidos}/{total_arquivos} (Sucessos: {processados_com_sucesso}, Erros: {erros})")
 
-        progress = (i + 1) / total_arquivos
-        progress_bar.progress(progress)
-        status_text.text(f"Indexando arquivos: {i + 1}/{total_arquivos} (Sucessos: {processados_com_sucesso}, Erros: {erros})")
+    for cpf in cpfs_afetados:
+        indice[cpf].sort()
 
-    progress_bar.empty()
-    status_text.empty()
+    if alterados:
+        progress_bar.empty()
+        status_text.empty()
 
-    if indice:
-        salvar_indice_cpfs(indice)
+    salvar_indice_cpfs({'cpfs': indice, 'arquivos': indexados})
 
-    if processados_com_sucesso > 0:
+    if indice_novo and processados_com_sucesso > 0:
         st.success(f"Índice criado: {len(indice)} CPFs encontrados em {processados_com_sucesso} arquivos processados")
-    
+    elif not indice_novo:
+        st.info(f"Índice atualizado: {len(alterados)} arquivo(s) novo(s) ou alterado(s), {len(removidos)} removido(s)")
+
     if erros > 0:
         st.warning(f"{erros} arquivo(s) com erro durante o processamento")
 
@@ -606,49 +395,46 @@ def listar_cpfs_otimizado():
 
 def obter_periodos_referencia(dados):
     """Obtém todos os períodos de referência únicos dos pagamentos"""
-    periodos = set()
-    for pagamento in dados.get('pagamentos', []):
-        if pagamento.get('perRef'):
-            periodos.add(pagamento['perRef'])
-    return sorted(list(periodos))
+    per_ref = dados['tabelas']['pagamentos']['perRef']
+    return sorted(periodo for periodo in per_ref.dropna().unique() if periodo)
 
 def filtrar_pagamentos_por_periodo(dados, periodos_selecionados):
-    """Filtra pagamentos pelos períodos de referência selecionados"""
+    """Filtra as tabelas pelos períodos de referência selecionados"""
     if not periodos_selecionados:
         return dados
     
     dados_filtrados = dados.copy()
-    dados_filtrados['pagamentos'] = [
-        pag for pag in dados['pagamentos'] 
-        if pag.get('perRef') in periodos_selecionados
-    ]
-    
-    # Reconstrói listas de dependentes e deduções baseadas nos pagamentos filtrados
-    dados_filtrados['dependentes'] = []
-    dados_filtrados['deducoes_dependentes'] = []
-    
-    for pagamento in dados_filtrados['pagamentos']:
-        dados_filtrados['dependentes'].extend(pagamento.get('dependentes', []))
-        dados_filtrados['deducoes_dependentes'].extend(pagamento.get('deducoes_dependentes', []))
+    dados_filtrados['tabelas'] = filtrar_tabelas_s5002(dados['tabelas'], periodos_selecionados)
     
     return dados_filtrados
 
-def agrupar_pagamentos_por_competencia(dados_filtrados):
-    """Agrupa pagamentos por mês de competência"""
-    pagamentos_por_mes = {}
-    
-    for pagamento in dados_filtrados.get('pagamentos', []):
-        per_ref = pagamento.get('perRef', '')
-        if per_ref:
-            if per_ref not in pagamentos_por_mes:
-                pagamentos_por_mes[per_ref] = []
-            pagamentos_por_mes[per_ref].append(pagamento)
-    
-    # Ordena por data dentro de cada mês
-    for mes in pagamentos_por_mes:
-        pagamentos_por_mes[mes].sort(key=lambda x: x.get('dtPgto', ''))
-    
-    return dict(sorted(pagamentos_por_mes.items()))
+def agrupar_pagamentos_por_competencia(tabelas):
+    """Agrupa pagamentos por mês de competência (ordenados por data dentro de cada mês)"""
+    pagamentos = tabelas['pagamentos']
+    pagamentos = pagamentos[pagamentos['perRef'] != ''].sort_values('dtPgto', kind='stable')
+    return dict(iter(pagamentos.groupby('perRef', observed=True, sort=True)))
+
+def linhas_por_pagamento(tabela):
+    """Linhas de uma tabela agrupadas pelo dmDev de origem: (arquivo, seqPgto) -> DataFrame"""
+    return dict(iter(tabela.groupby(['arquivo', 'seqPgto'], observed=True)))
+
+# Classificação dos códigos TPInfoIR nos totais mensais
+CLASSE_TOTAL_POR_CODIGO = {
+    **{codigo: 'tributavel' for codigo in ('11', '13', '31', '33', '91', '93')},
+    **{codigo: 'irrf' for codigo in ('41', '43')},
+    **{codigo: 'isento' for codigo in ('70', '71', '72', '73', '74', '75')},
+}
+CLASSES_TOTAL = ['tributavel', 'irrf', 'isento']
+
+def calcular_totais_por_competencia(info_ir):
+    """Totais tributável/IRRF/isento de todas as competências em uma única agregação"""
+    classes = info_ir['tpInfoIR'].astype(object).map(CLASSE_TOTAL_POR_CODIGO)
+    linhas = info_ir.assign(classe=classes).dropna(subset=['classe'])
+    if linhas.empty:
+        return pd.DataFrame(columns=CLASSES_TOTAL, dtype='float64')
+
+    totais = linhas.groupby(['perRef', 'classe'], observed=True)['valor'].sum().unstack(fill_value=0.0)
+    return totais.reindex(columns=CLASSES_TOTAL, fill_value=0.0)
 
 # --- Processamento Principal Otimizado ---
 def processar_arquivos_xml_otimizado(cpf_sel):
@@ -656,19 +442,18 @@ def processar_arquivos_xml_otimizado(cpf_sel):
     indice = criar_indice_cpfs_otimizado()
 
     if cpf_sel not in indice:
-        return {'pagamentos': [], 'dependentes': [], 'deducoes_dependentes': []}
+        return consolidar_dados_s5002([])
 
     cache = carregar_cache()
     arquivos_relevantes = indice[cpf_sel]
 
     dados_consolidados = {
-        'pagamentos': [],
-        'dependentes': [],
-        'deducoes_dependentes': [],
         'arquivos_processados': 0,
         'cache_hits': 0,
         'processados_novos': 0
     }
+    dados_do_cpf = []
+    leiautes_desconhecidos = {}
 
     if len(arquivos_relevantes) > 1:
         progress_bar = st.progress(0)
@@ -676,31 +461,24 @@ def processar_arquivos_xml_otimizado(cpf_sel):
 
     for i, arquivo in enumerate(arquivos_relevantes):
         file_path = os.path.join(PASTA_BASE, arquivo)
-        file_hash = get_file_hash(file_path)
-        cache_key = f"{arquivo}_{file_hash}"
+        fingerprint = get_file_fingerprint(file_path)
+        cache_key = f"{arquivo}_{fingerprint}"
+
+        dados = ler_cache_xml(cache, cache_key, CACHE_VERSAO) if cache is not None else None
 
-        if cache_key in cache:
-            dados = cache[cache_key]
+        if dados is not None:
             dados_consolidados['cache_hits'] += 1
         else:
             dados = processar_xml_completo(file_path)
             if dados:
-                cache[cache_key] = dados
+                if cache is not None:
+                    gravar_cache(cache, cache_key, arquivo, dados)
                 dados_consolidados['processados_novos'] += 1
 
         if dados and dados.get('cpfBenef') == cpf_sel:
-            dados_consolidados['pagamentos'].extend(dados.get('pagamentos', []))
-            dados_consolidados['dependentes'].extend(dados.get('dependentes', []))
-            dados_consolidados['deducoes_dependentes'].extend(dados.get('deducoes_dependentes', []))
-
-            if 'perApur' not in dados_consolidados:
-                dados_consolidados.update({
-                    'nrRecArqBase': dados.get('nrRecArqBase'),
-                    'perApur': dados.get('perApur'),
-                    'tpInsc': dados.get('tpInsc'),
-                    'nrInsc': dados.get('nrInsc'),
-                    'cpfBenef': dados.get('cpfBenef')
-                })
+            dados_do_cpf.append(dados)
+            if not dados['leiauteConhecido']:
+                leiautes_desconhecidos.setdefault(dados['versaoLeiaute'], []).append(arquivo)
 
         dados_consolidados['arquivos_processados'] += 1
 
@@ -713,8 +491,13 @@ def processar_arquivos_xml_otimizado(cpf_sel):
         progress_bar.empty()
         status_text.empty()
 
-    if dados_consolidados['processados_novos'] > 0:
-        salvar_cache(cache)
+    salvar_cache(cache)
+
+    for versao, arquivos in sorted(leiautes_desconhecidos.items()):
+        st.warning(f"Leiaute S-5002 não reconhecido ({versao}) em {len(arquivos)} arquivo(s), "
+                   f"lido(s) com o layout S-1.x; confira os valores: {', '.join(arquivos[:5])}")
+
+    dados_consolidados.update(consolidar_dados_s5002(dados_do_cpf))
 
     return dados_consolidados
 
@@ -804,22 +587,16 @@ def criar_filtro_periodos(dados):
 
 def mostrar_alertas_codigos_invalidos(dados):
     """Mostra alertas para códigos inválidos encontrados"""
-    codigos_invalidos = []
+    info_ir = dados['tabelas']['info_ir']
+    desc = info_ir['tpInfoIRDesc'].astype(object).fillna('')
+    invalidos = (desc.str.contains('não catalogado', regex=False)
+                 | desc.str.contains('código original:', regex=False))
+    codigos_invalidos = info_ir.loc[invalidos, ['tpInfoIR', 'tpInfoIRDesc', 'valor']]
     
-    for pagamento in dados.get('pagamentos', []):
-        for info_ir in pagamento.get('infoIR', []):
-            desc = info_ir.get('tpInfoIRDesc', '')
-            if 'não catalogado' in desc or 'código original:' in desc:
-                codigos_invalidos.append({
-                    'codigo': info_ir.get('tpInfoIR'),
-                    'descricao': desc,
-                    'valor': info_ir.get('valor', 0)
-                })
-    
-    if codigos_invalidos:
+    if not codigos_invalidos.empty:
         st.warning("Códigos não catalogados ou corrigidos encontrados:")
-        for item in codigos_invalidos:
-            st.write(f"- **{item['codigo']}**: {item['descricao']} (Valor: {format_value(item['valor'])})")
+        for codigo, descricao, valor in codigos_invalidos.itertuples(index=False):
+            st.write(f"- **{codigo}**: {descricao} (Valor: {format_value(valor)})")
         
         st.info("Dica: Verifique se estes códigos precisam ser adicionados à tabela oficial ou se há erros nos XMLs originais.")
 
@@ -850,8 +627,15 @@ def mostrar_resultados_segregados_por_competencia(dados, cpf_sel):
     # Mostra alertas para códigos não catalogados
     mostrar_alertas_codigos_invalidos(dados_filtrados)
     
-    # Agrupa pagamentos por competência
-    pagamentos_por_mes = agrupar_pagamentos_por_competencia(dados_filtrados)
+    # Agrupa pagamentos por competência e as demais tabelas por pagamento
+    tabelas = dados_filtrados['tabelas']
+    pagamentos_por_mes = agrupar_pagamentos_por_competencia(tabelas)
+    info_ir_por_pagamento = linhas_por_pagamento(tabelas['info_ir'])
+    dependentes_por_pagamento = linhas_por_pagamento(tabelas['dependentes'])
+    deducoes_por_pagamento = linhas_por_pagamento(tabelas['deducoes'])
+    
+    # Totais mensais de todas as competências em uma única agregação
+    totais_por_mes = calcular_totais_por_competencia(tabelas['info_ir'])
     
     # Exibição segregada por mês
     st.subheader("Pagamentos por Mês de Competência")
@@ -860,20 +644,10 @@ def mostrar_resultados_segregados_por_competencia(dados, cpf_sel):
         with st.expander(f"📅 Competência {mes} ({len(pagamentos_mes)} pagamento(s))", expanded=True):
             
             # Métricas do mês
-            total_tributavel_mes = 0
-            total_irrf_mes = 0
-            total_isento_mes = 0
-            
-            for pagamento in pagamentos_mes:
-                for info_ir in pagamento.get('infoIR', []):
-                    valor = info_ir.get('valor', 0.0)
-                    codigo = info_ir.get('tpInfoIR', '')
-                    if codigo in ['11', '13', '31', '33', '91', '93']:  # Códigos tributáveis
-                        total_tributavel_mes += valor
-                    elif codigo in ['41', '43']:  # IRRF
-                        total_irrf_mes += valor
-                    elif codigo in ['70', '71', '72', '73', '74', '75']:  # Isentos
-                        total_isento_mes += valor
+            if mes in totais_por_mes.index:
+                total_tributavel_mes, total_irrf_mes, total_isento_mes = totais_por_mes.loc[mes, CLASSES_TOTAL]
+            else:
+                total_tributavel_mes = total_irrf_mes = total_isento_mes = 0
             
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -886,14 +660,15 @@ def mostrar_resultados_segregados_por_competencia(dados, cpf_sel):
             st.markdown("---")
             
             # Pagamentos do mês
-            for i, pagamento in enumerate(pagamentos_mes):
-                st.markdown(f"**Pagamento {i+1} - {pagamento.get('dtPgto', 'Data não informada')}**")
-                mostrar_detalhes_pagamento_resumido(pagamento)
+            for i, pagamento in enumerate(pagamentos_mes.itertuples(index=False)):
+                chave = (pagamento.arquivo, pagamento.seqPgto)
+                st.markdown(f"**Pagamento {i+1} - {pagamento.dtPgto}**")
+                mostrar_detalhes_pagamento_resumido(pagamento, info_ir_por_pagamento.get(chave))
                 
                 # Dependentes específicos deste pagamento
-                if pagamento.get('dependentes'):
+                if chave in dependentes_por_pagamento:
                     st.markdown("**Dependentes (deste pagamento):**")
-                    mostrar_dependentes_compacto(pagamento['dependentes'], pagamento.get('deducoes_dependentes', []))
+                    mostrar_dependentes_compacto(dependentes_por_pagamento[chave], deducoes_por_pagamento.get(chave))
                 
                 if i < len(pagamentos_mes) - 1:
                     st.markdown("---")
@@ -914,50 +689,42 @@ def mostrar_resultados_segregados_por_competencia(dados, cpf_sel):
             st.session_state.dados_para_comprovante = dados_filtrados
             st.rerun()
 
-def mostrar_detalhes_pagamento_resumido(pagamento):
-    """Versão resumida para exibição dentro dos meses"""
+def mostrar_detalhes_pagamento_resumido(pagamento, info_ir):
+    """Versão resumida para exibição dentro dos meses (linha da tabela de pagamentos e seu infoIR)"""
     col1, col2 = st.columns(2)
     
     with col1:
-        st.write(f"**Tipo de Pagamento:** {pagamento.get('tpPgto', '')}")
-        cod_categ = pagamento.get('codCateg', '')
-        cod_categ_desc = pagamento.get('codCategDesc', '')
+        st.write(f"**Tipo de Pagamento:** {pagamento.tpPgto}")
+        cod_categ = pagamento.codCateg
+        cod_categ_desc = pagamento.codCategDesc
         if cod_categ and cod_categ_desc:
             st.write(f"**Categoria:** {cod_categ} - {cod_categ_desc}")
         else:
             st.write(f"**Categoria:** {cod_categ}")
     
     with col2:
-        if pagamento['totApurMen']:
-            tot = pagamento['totApurMen']
-            st.write(f"**Rendimentos Tributáveis:** {format_value(tot.get('vlrRendTrib', 0))}")
-            st.write(f"**IRRF:** {format_value(tot.get('vlrCRMen', 0))}")
+        if not pd.isna(pagamento.vlrRendTrib):
+            st.write(f"**Rendimentos Tributáveis:** {format_value(pagamento.vlrRendTrib)}")
+            st.write(f"**IRRF:** {format_value(pagamento.vlrCRMen)}")
 
-    if pagamento['infoIR']:
+    if info_ir is not None:
         with st.expander("Ver detalhes dos valores de IR", expanded=False):
-            df_info_ir = pd.DataFrame(pagamento['infoIR'])
-
-            if 'tpInfoIRDesc' in df_info_ir.columns:
-                df_info_ir['Tipo Completo'] = df_info_ir['tpInfoIR'] + ' - ' + df_info_ir['tpInfoIRDesc']
-                df_display = df_info_ir[['Tipo Completo', 'valor', 'descRendimento']].copy()
-                df_display.columns = ['Tipo de Informação IR', 'Valor', 'Descrição']
-            else:
-                df_display = df_info_ir[['tpInfoIR', 'valor', 'descRendimento']].copy()
-                df_display.columns = ['Tipo IR', 'Valor', 'Descrição']
-
-            df_display['Valor'] = df_display['Valor'].apply(format_value)
+            df_display = pd.DataFrame({
+                'Tipo de Informação IR': info_ir['tpInfoIR'].astype(object) + ' - ' + info_ir['tpInfoIRDesc'].astype(object),
+                'Valor': formatar_valores(info_ir['valor'], manter_invalidos=True),
+                'Descrição': info_ir['descRendimento'],
+            }).reset_index(drop=True)
             st.dataframe(df_display)
 
 def mostrar_dependentes_compacto(dependentes, deducoes):
     """Versão compacta para exibição de dependentes"""
-    if dependentes:
-        for dep in dependentes:
-            st.write(f"- **{dep.get('nome', 'Nome não informado')}** (CPF: {dep.get('cpfDep', '')}) - {dep.get('tpDepDesc', dep.get('tpDep', ''))}")
+    for dep in dependentes.itertuples(index=False):
+        st.write(f"- **{dep.nome}** (CPF: {dep.cpfDep}) - {dep.tpDepDesc}")
     
-    if deducoes:
+    if deducoes is not None:
         st.write("**Deduções:**")
-        for ded in deducoes:
-            st.write(f"- CPF {ded.get('cpfDep', '')}: {format_value(ded.get('vlrDedDep', 0))}")
+        for cpf_dep, valor in zip(deducoes['cpfDep'], deducoes['vlrDedDep']):
+            st.write(f"- CPF {cpf_dep}: {format_value(valor)}")
 
 # --- Funções do Mapeamento IN 2060 ---
 def salvar_mapeamento_personalizado(mapeamento):
@@ -974,36 +741,9 @@ def processar_dados_para_comprovante(dados_xml):
     """Processa dados XML usando o mapeamento para gerar dados do comprovante"""
     
     mapeamento = carregar_mapeamento_personalizado()
+    info_ir = dados_xml['tabelas']['info_ir']
     
-    # Inicializa estrutura do comprovante
-    comprovante_dados = {}
-    for quadro_id, quadro_info in CAMPOS_COMPROVANTE_IN2060.items():
-        comprovante_dados[quadro_id] = {}
-        for linha_id in quadro_info["linhas"].keys():
-            comprovante_dados[quadro_id][linha_id] = 0.0
-    
-    # Processa cada pagamento
-    for pagamento in dados_xml.get('pagamentos', []):
-        for info_ir in pagamento.get('infoIR', []):
-            codigo = info_ir.get('tpInfoIR', '')
-            valor = info_ir.get('valor', 0.0)
-            
-            if codigo in mapeamento:
-                quadro, linha = mapeamento[codigo]
-                if quadro in comprovante_dados and linha in comprovante_dados[quadro]:
-                    comprovante_dados[quadro][linha] += valor
-    
-    # Adiciona dados básicos
-    comprovante_dados['dados_basicos'] = {
-        'exercicio': str(int(dados_xml.get('perApur', '2025-01')[:4]) + 1),
-        'ano_calendario': dados_xml.get('perApur', '2025-01')[:4],
-        'cnpj_fonte': dados_xml.get('nrInsc', ''),
-        'cpf_beneficiario': dados_xml.get('cpfBenef', ''),
-        'nome_beneficiario': 'A DEFINIR',
-        'natureza_rendimento': 'RENDIMENTOS DO TRABALHO ASSALARIADO'
-    }
-    
-    return comprovante_dados
+    return calcular_comprovante_in2060(dados_xml, info_ir, mapeamento)
 
 def tela_mapeamento_comprovante(dados_xml):
     """Tela intermediária para mapear TPInfoIR aos campos do comprovante IN 2060"""
@@ -1021,14 +761,8 @@ def tela_mapeamento_comprovante(dados_xml):
     mapeamento_atual = carregar_mapeamento_personalizado()
     
     # Extrai todos os códigos TPInfoIR únicos dos dados
-    codigos_encontrados = set()
-    for pagamento in dados_xml.get('pagamentos', []):
-        for info_ir in pagamento.get('infoIR', []):
-            codigo = info_ir.get('tpInfoIR', '')
-            if codigo:
-                codigos_encontrados.add(codigo)
-    
-    codigos_encontrados = sorted(list(codigos_encontrados))
+    tp_info_ir = dados_xml['tabelas']['info_ir']['tpInfoIR']
+    codigos_encontrados = sorted(codigo for codigo in tp_info_ir.dropna().unique() if codigo)
     
     if not codigos_encontrados:
         st.warning("Nenhum código TPInfoIR encontrado nos dados XML.")
@@ -1149,48 +883,6 @@ def tela_mapeamento_comprovante(dados_xml):
     
     return None
 
-class ComprovanteIN2060PDF:
-    """Classe para gerar PDF do comprovante conforme IN 2060/2021"""
-    
-    def __init__(self):
-        if FPDF is None:
-            raise ImportError("FPDF não está disponível. Instale com: pip install fpdf2")
-        
-        self.pdf = FPDF('P', 'mm', 'A4')
-        self.pdf.set_auto_page_break(auto=True, margin=15)
-    
-    def header(self):
-        self.pdf.set_font('Arial', 'B', 16)
-        self.pdf.cell(0, 10, 'COMPROVANTE DE RENDIMENTOS PAGOS', 0, 1, 'C')
-        self.pdf.cell(0, 10, 'E DE IMPOSTO SOBRE A RENDA RETIDO NA FONTE', 0, 1, 'C')
-        self.pdf.ln(5)
-    
-    def footer(self):
-        self.pdf.set_y(-15)
-        self.pdf.set_font('Arial', 'I', 8)
-        self.pdf.cell(0, 10, f'Página {self.pdf.page_no()} - Conforme IN RFB nº 2060/2021', 0, 0, 'C')
-    
-    def add_page(self):
-        self.pdf.add_page()
-        self.header()
-    
-    def add_quadro(self, titulo, dados, linha_descricoes):
-        """Adiciona um quadro ao comprovante"""
-        self.pdf.set_font('Arial', 'B', 10)
-        self.pdf.cell(0, 8, titulo, 1, 1, 'L')
-        
-        self.pdf.set_font('Arial', '', 9)
-        for linha_id, descricao in linha_descricoes.items():
-            valor = dados.get(linha_id, 0.0)
-            if valor != 0.0 or linha_id in ['linha1', 'linha5']:
-                self.pdf.cell(120, 6, descricao, 1, 0, 'L')
-                self.pdf.cell(70, 6, format_value(valor), 1, 1, 'R')
-        
-        self.pdf.ln(3)
-    
-    def output(self, buffer):
-        return self.pdf.output(buffer)
-
 def gerar_comprovante_in2060(dados_xml, cpf_sel):
     """Gera o comprovante oficial conforme IN 2060/2021"""
     
@@ -1204,54 +896,12 @@ def gerar_comprovante_in2060(dados_xml, cpf_sel):
             comprovante_dados = processar_dados_para_comprovante(dados_xml)
             
             # Cria PDF
-            pdf = ComprovanteIN2060PDF()
-            pdf.add_page()
-            
-            # Dados básicos
+            pdf_bytes = renderizar_comprovante_in2060(comprovante_dados)
             dados_basicos = comprovante_dados['dados_basicos']
-            pdf.pdf.set_font('Arial', 'B', 10)
-            pdf.pdf.cell(40, 8, 'Exercício:', 1, 0, 'L')
-            pdf.pdf.cell(40, 8, dados_basicos['exercicio'], 1, 0, 'C')
-            pdf.pdf.cell(40, 8, 'Ano-calendário:', 1, 0, 'L')
-            pdf.pdf.cell(70, 8, dados_basicos['ano_calendario'], 1, 1, 'C')
-            pdf.pdf.ln(3)
-            
-            # Quadro 1 - Fonte Pagadora
-            pdf.pdf.set_font('Arial', 'B', 10)
-            pdf.pdf.cell(0, 8, 'QUADRO 1 - FONTE PAGADORA', 1, 1, 'L')
-            pdf.pdf.set_font('Arial', '', 9)
-            pdf.pdf.cell(30, 6, 'CNPJ:', 1, 0, 'L')
-            pdf.pdf.cell(160, 6, dados_basicos['cnpj_fonte'], 1, 1, 'L')
-            pdf.pdf.ln(3)
-            
-            # Quadro 2 - Beneficiário
-            pdf.pdf.set_font('Arial', 'B', 10)
-            pdf.pdf.cell(0, 8, 'QUADRO 2 - PESSOA FÍSICA BENEFICIÁRIA', 1, 1, 'L')
-            pdf.pdf.set_font('Arial', '', 9)
-            pdf.pdf.cell(30, 6, 'CPF:', 1, 0, 'L')
-            pdf.pdf.cell(160, 6, dados_basicos['cpf_beneficiario'], 1, 1, 'L')
-            pdf.pdf.cell(30, 6, 'Nome:', 1, 0, 'L')
-            pdf.pdf.cell(160, 6, dados_basicos['nome_beneficiario'], 1, 1, 'L')
-            pdf.pdf.ln(3)
-            
-            # Quadros principais
-            for quadro_id, quadro_info in CAMPOS_COMPROVANTE_IN2060.items():
-                if quadro_id in comprovante_dados:
-                    pdf.add_quadro(
-                        quadro_info["nome"].upper(),
-                        comprovante_dados[quadro_id],
-                        quadro_info["linhas"]
-                    )
-            
-            # Gera arquivo
-            buffer = io.BytesIO()
-            pdf.output(buffer)
-            pdf_bytes = buffer.getvalue()
-            buffer.close()
             
             # Cria link de download
-            nome_arquivo = f"Comprovante_IN2060_{cpf_sel}_{dados_basicos['ano_calendario']}.pdf"
-            st.markdown(create_download_link(pdf_bytes, nome_arquivo), unsafe_allow_html=True)
+            nome_arquivo = nome_comprovante_in2060(cpf_sel, dados_basicos['ano_calendario'])
+            oferecer_download(gravar_exportacao(nome_arquivo, pdf_bytes), "Download do Comprovante", mime="application/pdf")
             st.success("Comprovante IN 2060/2021 gerado com sucesso!")
             
             # Mostra resumo
@@ -1292,11 +942,6 @@ class ComprovantePDF(FPDF):
         self.set_font('Arial', 'I', 8)
         self.cell(0, 10, f'Página {self.page_no()}', 0, 0, 'C')
 
-def create_download_link(pdf_bytes, filename):
-    """Cria um link para download do PDF"""
-    b64 = base64.b64encode(pdf_bytes).decode()
-    return f'<a href="data:application/octet-stream;base64,{b64}" download="{filename}">Download do Comprovante</a>'
-
 def gerar_comprovante(dados, cpf_sel):
     """Gera o PDF do comprovante simples"""
     try:
@@ -1318,35 +963,40 @@ def gerar_comprovante(dados, cpf_sel):
             pdf.ln(5)
 
             # Agrupa por competência para o PDF
-            pagamentos_por_mes = agrupar_pagamentos_por_competencia(dados)
+            tabelas = dados['tabelas']
+            pagamentos_por_mes = agrupar_pagamentos_por_competencia(tabelas)
+            info_ir_por_pagamento = linhas_por_pagamento(tabelas['info_ir'])
+            dependentes_por_pagamento = linhas_por_pagamento(tabelas['dependentes'])
             
             for mes, pagamentos_mes in pagamentos_por_mes.items():
                 pdf.cell(0, 8, f"Competência: {mes}", 0, 1)
                 
-                for pagamento in pagamentos_mes:
-                    pdf.cell(0, 8, f"Data do Pagamento: {pagamento.get('dtPgto', '')}", 0, 1)
+                for pagamento in pagamentos_mes.itertuples(index=False):
+                    chave = (pagamento.arquivo, pagamento.seqPgto)
+                    pdf.cell(0, 8, f"Data do Pagamento: {pagamento.dtPgto}", 0, 1)
                     pdf.cell(60, 8, "Tipo de Pagamento:", 1)
-                    pdf.cell(0, 8, pagamento.get('tpPgto', ''), 1, 1)
+                    pdf.cell(0, 8, pagamento.tpPgto, 1, 1)
 
-                    if pagamento['infoIR']:
+                    if chave in info_ir_por_pagamento:
+                        info_ir = info_ir_por_pagamento[chave]
                         pdf.cell(0, 8, "Informações de IR:", 0, 1)
-                        for info in pagamento['infoIR']:
-                            pdf.cell(100, 8, f"Tipo {info.get('tpInfoIR', '')}:", 1)
-                            pdf.cell(0, 8, format_value(info.get('valor', 0)), 1, 1)
+                        for codigo, valor in zip(info_ir['tpInfoIR'], info_ir['valor']):
+                            pdf.cell(100, 8, f"Tipo {codigo}:", 1)
+                            pdf.cell(0, 8, format_value(valor), 1, 1)
 
-                    if pagamento['totApurMen']:
-                        tot = pagamento['totApurMen']
+                    if not pd.isna(pagamento.vlrRendTrib):
                         pdf.cell(0, 8, "Totalização Mensal:", 0, 1)
                         pdf.cell(100, 8, "Rendimentos Tributáveis:", 1)
-                        pdf.cell(0, 8, format_value(tot.get('vlrRendTrib', 0)), 1, 1)
+                        pdf.cell(0, 8, format_value(pagamento.vlrRendTrib), 1, 1)
                         pdf.cell(100, 8, "Valor do IRRF:", 1)
-                        pdf.cell(0, 8, format_value(tot.get('vlrCRMen', 0)), 1, 1)
+                        pdf.cell(0, 8, format_value(pagamento.vlrCRMen), 1, 1)
 
-                    if pagamento.get('dependentes'):
+                    if chave in dependentes_por_pagamento:
+                        dependentes = dependentes_por_pagamento[chave]
                         pdf.cell(0, 8, f"Dependentes ({mes}):", 0, 1)
-                        for dep in pagamento['dependentes']:
-                            pdf.cell(60, 8, f"Nome: {dep.get('nome', '')}", 1)
-                            pdf.cell(0, 8, f"CPF: {dep.get('cpfDep', '')}", 1, 1)
+                        for nome, cpf_dep in zip(dependentes['nome'], dependentes['cpfDep']):
+                            pdf.cell(60, 8, f"Nome: {nome}", 1)
+                            pdf.cell(0, 8, f"CPF: {cpf_dep}", 1, 1)
 
                     pdf.ln(3)
                 
@@ -1358,7 +1008,7 @@ def gerar_comprovante(dados, cpf_sel):
             buffer.close()
 
             nome_arquivo = f"Comprovante_IRRF_{cpf_sel}_{dados.get('perApur', '')}.pdf"
-            st.markdown(create_download_link(pdf_bytes, nome_arquivo), unsafe_allow_html=True)
+            oferecer_download(gravar_exportacao(nome_arquivo, pdf_bytes), "Download do Comprovante", mime="application/pdf")
             st.success("Comprovante gerado com sucesso!")
 
     except Exception as e:
@@ -1381,10 +1031,95 @@ def mostrar_estatisticas_sistema():
             if CACHE_XMLS.exists():
                 tamanho_cache = CACHE_XMLS.stat().st_size / 1024
                 st.metric("Cache XMLs", f"{tamanho_cache:.1f} KB")
+                st.metric("XMLs em cache", contar_cache_xmls(CACHE_XMLS))
 
         except Exception as e:
             st.warning(f"Erro ao carregar estatísticas: {e}")
 
+# --- Geração de Comprovantes em Lote ---
+def montar_tarefas_lote_in2060(arquivos_indexados, ano_calendario, cpfs_filtro=None):
+    """CPF -> XMLs do ano-calendário, a partir do cabeçalho guardado no índice"""
+    tarefas = {}
+    for arquivo, (_, _, cpf, per_apur, _) in arquivos_indexados.items():
+        if cpf and per_apur.startswith(ano_calendario) and (not cpfs_filtro or cpf in cpfs_filtro):
+            tarefas.setdefault(cpf, []).append(arquivo)
+    for arquivos in tarefas.values():
+        arquivos.sort()
+    return tarefas
+
+def mostrar_geracao_em_lote_in2060():
+    """Gera os comprovantes IN 2060/2021 de todos (ou alguns) CPFs de um ano-calendário em um ZIP"""
+    with st.expander("Comprovantes IN 2060/2021 em lote", expanded=False):
+        if FPDF is None:
+            st.error("FPDF não está disponível. Instale com: pip install fpdf2")
+            return
+
+        # O índice só é lido quando a seção é ativada, e uma vez por execução
+        if not st.toggle("Ativar geração em lote", key="lote_in2060_ativo"):
+            return
+
+        arquivos_indexados = carregar_indice_cpfs().get('arquivos', {})
+        anos = sorted({info[3][:4] for info in arquivos_indexados.values() if info[2] and info[3]}, reverse=True)
+        if not anos:
+            st.info("Nenhum período de apuração encontrado no índice.")
+            return
+
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            ano_calendario = st.selectbox("Ano-calendário:", anos, key="lote_in2060_ano")
+        with col2:
+            texto_cpfs = st.text_area(
+                "CPFs (um por linha, vazio = todos):",
+                key="lote_in2060_cpfs",
+                help="Informe apenas os CPFs que devem receber comprovante"
+            )
+
+        cpfs_filtro = {
+            linha.strip().replace(".", "").replace("-", "")
+            for linha in texto_cpfs.splitlines() if linha.strip()
+        }
+        tarefas = montar_tarefas_lote_in2060(arquivos_indexados, ano_calendario, cpfs_filtro)
+
+        caminho_zip = PASTA_LOTES_IN2060 / f"Comprovantes_IN2060_{ano_calendario}.zip"
+        pasta_trabalho = PASTA_LOTES_IN2060 / f"Comprovantes_IN2060_{ano_calendario}_parcial"
+
+        concluidos = cpfs_concluidos_in2060(pasta_trabalho, ano_calendario) & set(tarefas)
+        st.write(f"**CPFs no lote:** {len(tarefas)}")
+        if concluidos:
+            st.info(f"Lote interrompido encontrado: {len(concluidos)} comprovante(s) já gerado(s) serão reaproveitados.")
+
+        if not tarefas:
+            st.warning("Nenhum CPF com XMLs no ano-calendário selecionado.")
+            return
+
+        if st.button("Gerar Comprovantes em Lote", type="primary", key="lote_in2060_gerar"):
+            progress_bar = st.progress(len(concluidos) / len(tarefas))
+            status_text = st.empty()
+            gerados = len(concluidos)
+            erros = 0
+
+            for registro in gerar_comprovantes_in2060(
+                PASTA_BASE, tarefas, ano_calendario,
+                carregar_codigos_s5002(), carregar_mapeamento_personalizado(), pasta_trabalho
+            ):
+                if registro['status'] == 'ok':
+                    gerados += 1
+                else:
+                    erros += 1
+                progress_bar.progress((gerados + erros) / len(tarefas))
+                status_text.text(f"Gerando comprovantes: {gerados + erros}/{len(tarefas)} (Erros: {erros})")
+
+            status_text.text("Compactando comprovantes...")
+            manifesto = empacotar_comprovantes_in2060(pasta_trabalho, caminho_zip, tarefas)
+            progress_bar.empty()
+            status_text.empty()
+
+            st.success(f"{gerados} comprovante(s) gravado(s) em {caminho_zip.resolve()}")
+            oferecer_download(caminho_zip, "Download dos Comprovantes (ZIP)", mime="application/zip")
+            erros_manifesto = [r for r in manifesto.values() if r['status'] != 'ok']
+            if erros_manifesto:
+                st.warning(f"{len(erros_manifesto)} CPF(s) com erro (detalhes em manifesto.csv dentro do ZIP)")
+
 # --- Interface Principal ---
 def main_interface_atualizada():
     """Interface principal atualizada com as melhorias solicitadas"""
@@ -1401,10 +1136,13 @@ def main_interface_atualizada():
         st.info(f"Pasta de eventos: {PASTA_BASE}")
 
         st.markdown("**Cache:**")
+        if st.button("Atualizar Índice", help="Indexa apenas XMLs novos, alterados ou removidos"):
+            st.cache_data.clear()
+            st.session_state.pop('cpfs_carregados', None)
+            st.rerun()
+
         if st.button("Recriar Índice"):
-            for cache_file in [CACHE_XMLS, CACHE_INDICE]:
-                if cache_file.exists():
-                    cache_file.unlink()
+            limpar_caches()
             st.cache_data.clear()
             st.rerun()
 
@@ -1424,6 +1162,8 @@ def main_interface_atualizada():
         st.warning("Nenhum CPF encontrado nos arquivos S-5002.")
         return
 
+    mostrar_geracao_em_lote_in2060()
+
     cpf_sel = criar_interface_cpf_pesquisavel(cpfs)
 
     if cpf_sel:
@@ -1442,11 +1182,29 @@ def main_interface_atualizada():
                 st.metric("Processados agora",
                           dados_consolidados.get('processados_novos', 0))
 
-        if dados_consolidados and dados_consolidados.get('pagamentos'):
+        if not dados_consolidados['tabelas']['pagamentos'].empty:
             mostrar_resultados_segregados_por_competencia(dados_consolidados, cpf_sel)
         else:
             st.warning("Nenhum registro encontrado para este CPF.")
 
+def main_interface_com_in2060():
+    """Alterna entre a consulta por CPF e a tela de mapeamento do comprovante IN 2060"""
+    if st.session_state.get('tela_atual') != "mapeamento":
+        main_interface_atualizada()
+        return
+
+    dados_xml = st.session_state.get('dados_para_comprovante')
+    if not dados_xml:
+        st.session_state.tela_atual = None
+        st.rerun()
+
+    acao = tela_mapeamento_comprovante(dados_xml)
+    if acao == "voltar":
+        st.session_state.tela_atual = None
+        st.rerun()
+    elif acao == "gerar_comprovante":
+        gerar_comprovante_in2060(dados_xml, dados_xml.get('cpfBenef', ''))
+
 # --- Ponto de entrada ---
 if __name__ == "__main__":
     try:
@@ -1463,21 +1221,6 @@ if __name__ == "__main__":
         st.exception(e)
 
         if st.button("Limpar Cache e Reiniciar"):
-            for cache_file in [CACHE_XMLS, CACHE_INDICE]:
-                if cache_file.exists():
-                    cache_file.unlink()
+            limpar_caches()
             st.cache_data.clear()
-            st.rerun()estatisticas_sistema()
-            main_interface_atualizada()
-
-    except Exception as e:
-        st.error(f"Ocorreu um erro inesperado: {str(e)}")
-        st.error("Detalhes técnicos:")
-        st.exception(e)
-
-        if st.button("Limpar Cache e Reiniciar"):
-            for cache_file in [CACHE_XMLS, CACHE_INDICE]:
-                if cache_file.exists():
-                    cache_file.unlink()
-            st.cache_data.clear()
-            st.rerun()
\ No newline at end of file
+            st.rerun()
@@ -1,13 +1,12 @@
 import streamlit as st
 import os
-import xml.etree.ElementTree as ET
 import pandas as pd
 import io
 from datetime import datetime
-import base64
 import locale
 import sys
 from collections import defaultdict
+from pathlib import Path
 
 
 # Configura locale para formatação de valores
@@ -28,6 +27,36 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Módulos compartilhados ficam na pasta do main.py
+PASTA_MODULOS = str(Path(__file__).resolve().parent.parent)
+if PASTA_MODULOS not in sys.path:
+    sys.path.insert(0, PASTA_MODULOS)
+
+from downloads import exportar_em_blocos, oferecer_download
+from exportacao import FORMATOS_EXPORTACAO
+from formatacao import format_value, formatar_valores
+from reinf_processamento import (
+    CACHE_REINF_VERSAO,
+    LeiauteReinfNaoSuportado,
+    abrir_cache_reinf,
+    arquivos_desatualizados,
+    arquivos_do_cpf_reinf,
+    blocos_relatorio_reinf,
+    gravar_registros_reinf,
+    impressao_arquivo,
+    ler_registros_reinf,
+    limpar_cache_reinf,
+    listar_cpfs_indexados_reinf,
+    obter_arquivos_xml_por_competencia,
+    obter_subpastas_competencias,
+    processar_arquivos_reinf,
+    registrar_leiaute_nao_suportado,
+    registros_vazios_reinf,
+    relatorio_ingestao_reinf,
+    remover_arquivos_ausentes,
+    resumir_relatorio_reinf
+)
+
 # --- Funções auxiliares ---
 
 
@@ -93,250 +122,248 @@ def criar_interface_cpf_pesquisavel(cpfs):
     return cpf_selecionado if cpf_selecionado else None
 
 
-def format_value(val):
-    """Formata valores monetários"""
-    try:
-        return f"{float(val):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except:
-        return str(val)
-
-
-def format_cpf_completo(cpf):
-    """Formata CPF completo para exibição (sem máscara)"""
-    if not cpf or cpf is None:
-        return "N/A"
-
-    # Remove formatação existente
-    cpf_limpo = str(cpf).replace(".", "").replace("-", "").replace(" ", "")
-
-    if len(cpf_limpo) == 11 and cpf_limpo.isdigit():
-        return f"{cpf_limpo[:3]}.{cpf_limpo[3:6]}.{cpf_limpo[6:9]}-{cpf_limpo[9:]}"
-    return str(cpf)
-
-
 # --- Configuração inicial ---
 
-# Namespace para REINF 4010
-NS_REINF = {
-    'ns': 'http://www.reinf.esocial.gov.br/schemas/evt4010PagtoBeneficiarioPF/v2_01_02'
-}
-
 # Caminho corrigido
 PASTA_BASE = r"C:\Users\tst\OneDrive\Área de Trabalho\Meus Phytons\.vscode\pages\downloads\efd_reinf"
 
-# Mapeamento de naturezas de rendimento
-NATUREZAS_RENDIMENTO = {
-    '10002': 'Diárias',
-    '10003': 'Ajudas de custo',
-    '10004': 'Jetons',
-    '10005': 'Honorários',
-    '10006': 'Serviços prestados por pessoa física',
-    '10007': 'Comissões',
-    '10008': 'Rendimentos de trabalho sem vínculo',
-    '10009': 'Rendimentos de aluguéis',
-    '10010': 'Royalties',
-    '99999': 'Outros rendimentos'
-}
+# Cache de registros por arquivo (invalidado pela impressão digital do XML)
+CACHE_REINF = Path("cache_reinf_4010.sqlite")
+
+LIMITE_DETALHADO_TELA = 500  # Máximo do slider de registros na tela
 
 # --- Funções de processamento ---
 
 
-def obter_subpastas_competencias(pasta_base):
-    """Obtém lista de subpastas de competências disponíveis"""
-    competencias = []
-    
-    if not os.path.exists(pasta_base):
-        return competencias
-    
-    for item in os.listdir(pasta_base):
-        caminho_item = os.path.join(pasta_base, item)
-        if os.path.isdir(caminho_item) and item.count('-') == 1:
-            # Verifica se o formato é YYYY-MM
+def listar_impressoes_reinf(pasta_base, competencias_selecionadas=None):
+    """Impressão digital (tamanho, mtime_ns) de cada XML das competências"""
+    arquivos_por_competencia = obter_arquivos_xml_por_competencia(pasta_base, competencias_selecionadas)
+
+    impressoes = {}
+    for arquivos in arquivos_por_competencia.values():
+        for caminho in arquivos:
             try:
-                ano, mes = item.split('-')
-                if len(ano) == 4 and len(mes) == 2 and ano.isdigit() and mes.isdigit():
-                    competencias.append(item)
-            except:
+                impressoes[caminho] = impressao_arquivo(caminho)
+            except OSError as e:
+                st.error(f"Erro ao acessar {os.path.basename(caminho)}: {str(e)}")
+    return impressoes
+
+
+def atualizar_cache_reinf(conn, impressoes):
+    """
+    Processa só os XMLs novos ou alterados, atualizando registros e índice de
+    CPFs no cache. Os apagados ou movidos saem do cache antes.
+    """
+    if remover_arquivos_ausentes(conn, impressoes):
+        conn.commit()
+    desatualizados = arquivos_desatualizados(conn, impressoes, CACHE_REINF_VERSAO)
+    if not desatualizados:
+        return
+
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    concluidos = 0
+    erros = 0
+
+    # Competências chegam fora de ordem quando processadas em paralelo
+    for lote in processar_arquivos_reinf(desatualizados):
+        for caminho, registros, erro in lote:
+            if isinstance(erro, LeiauteReinfNaoSuportado):
+                # Fica no cache sem registros e aparece no relatório de ingestão
+                registrar_leiaute_nao_suportado(conn, caminho, impressoes[caminho], CACHE_REINF_VERSAO, erro.namespace)
                 continue
-    
-    return sorted(competencias, reverse=True)
+            if erro:
+                # Arquivos com erro não entram no cache: o erro volta a aparecer até serem corrigidos
+                st.error(f"Erro ao processar {os.path.basename(caminho)}: {erro}")
+                erros += 1
+                continue
+            gravar_registros_reinf(conn, caminho, impressoes[caminho], CACHE_REINF_VERSAO, registros)
 
+        concluidos += len(lote)
+        progress_bar.progress(concluidos / len(desatualizados))
+        status_text.text(f"Processando XMLs: {concluidos}/{len(desatualizados)} (Erros: {erros})")
 
-def obter_arquivos_xml_por_competencia(pasta_base, competencias_selecionadas=None):
-    """Obtém lista de arquivos XML por competência"""
-    arquivos_por_competencia = {}
-    
-    if not competencias_selecionadas:
-        competencias_selecionadas = obter_subpastas_competencias(pasta_base)
-    
-    for competencia in competencias_selecionadas:
-        pasta_competencia = os.path.join(pasta_base, competencia)
-        if os.path.exists(pasta_competencia):
-            arquivos = []
-            for arquivo in os.listdir(pasta_competencia):
-                if arquivo.lower().endswith('.xml') and 'REINF' in arquivo.upper():
-                    arquivos.append(os.path.join(pasta_competencia, arquivo))
-            
-            if arquivos:
-                arquivos_por_competencia[competencia] = arquivos
-    
-    return arquivos_por_competencia
+    conn.commit()
+    progress_bar.empty()
+    status_text.empty()
 
 
-def parse_reinf_4010_xml(file_path):
-    """Processa um arquivo XML do REINF 4010"""
+def carregar_registros_reinf(impressoes):
+    """Carrega os registros dos arquivos como DataFrame (XMLs inalterados vêm do cache)"""
+    conn = abrir_cache_reinf(CACHE_REINF)
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-
-        # Encontra o elemento evtRetPF
-        evt = root.find('.//ns:evtRetPF', NS_REINF)
-        if evt is None:
-            return []
-
-        # Extrai informações básicas
-        ide_evento = evt.find('ns:ideEvento', NS_REINF)
-        ide_contri = evt.find('ns:ideContri', NS_REINF)
-
-        if ide_evento is None or ide_contri is None:
-            return []
-
-        per_apur = ide_evento.find('ns:perApur', NS_REINF).text if ide_evento.find(
-            'ns:perApur', NS_REINF) is not None else None
-        cnpj_contri = ide_contri.find('ns:nrInsc', NS_REINF).text if ide_contri.find(
-            'ns:nrInsc', NS_REINF) is not None else None
-
-        if not per_apur or not cnpj_contri:
-            return []
-
-        registros = []
-
-        # Processa estabelecimentos
-        for ide_estab in evt.findall('.//ns:ideEstab', NS_REINF):
-            # Processa beneficiários
-            for ide_benef in ide_estab.findall('ns:ideBenef', NS_REINF):
-                cpf_benef = ide_benef.find('ns:cpfBenef', NS_REINF).text if ide_benef.find(
-                    'ns:cpfBenef', NS_REINF) is not None else None
-
-                # Processa pagamentos
-                for ide_pgto in ide_benef.findall('ns:idePgto', NS_REINF):
-                    nat_rend = ide_pgto.find('ns:natRend', NS_REINF).text if ide_pgto.find(
-                        'ns:natRend', NS_REINF) is not None else None
-
-                    # Processa informações de pagamento
-                    for info_pgto in ide_pgto.findall('ns:infoPgto', NS_REINF):
-                        dt_fg = info_pgto.find('ns:dtFG', NS_REINF).text if info_pgto.find(
-                            'ns:dtFG', NS_REINF) is not None else None
-                        comp_fp = info_pgto.find('ns:compFP', NS_REINF).text if info_pgto.find(
-                            'ns:compFP', NS_REINF) is not None else None
-                        vlr_rend_bruto = float(info_pgto.find('ns:vlrRendBruto', NS_REINF).text.replace(
-                            ',', '.')) if info_pgto.find('ns:vlrRendBruto', NS_REINF) is not None else 0.0
-                        observ = info_pgto.find('ns:observ', NS_REINF).text if info_pgto.find(
-                            'ns:observ', NS_REINF) is not None else ''
-
-                        # Processa rendimentos isentos
-                        vlr_isento = 0.0
-                        rend_isento = info_pgto.find('ns:rendIsento', NS_REINF)
-                        if rend_isento is not None:
-                            vlr_isento = float(rend_isento.find('ns:vlrIsento', NS_REINF).text.replace(
-                                ',', '.')) if rend_isento.find('ns:vlrIsento', NS_REINF) is not None else 0.0
-
-                        # Processa retenções (IRRF)
-                        vlr_ret_ir = 0.0
-                        ret_pgto = info_pgto.find('ns:retPgto', NS_REINF)
-                        if ret_pgto is not None:
-                            vlr_ret_ir = float(ret_pgto.find('ns:vlrRetIR', NS_REINF).text.replace(
-                                ',', '.')) if ret_pgto.find('ns:vlrRetIR', NS_REINF) is not None else 0.0
-
-                        registro = {
-                            'perApur': per_apur,
-                            'cpfBenef': cpf_benef or '',
-                            'cpfBenefFormatado': format_cpf_completo(cpf_benef) if cpf_benef else 'N/A',
-                            'natRend': nat_rend or '',
-                            'natRendDesc': NATUREZAS_RENDIMENTO.get(nat_rend, f'Código {nat_rend}') if nat_rend else 'Não informado',
-                            'dtFG': dt_fg or '',
-                            'vlrRendBruto': vlr_rend_bruto,
-                            'vlrIsento': vlr_isento,
-                            'vlrRetIR': vlr_ret_ir,
-                            'vlrLiquido': vlr_rend_bruto - vlr_ret_ir,
-                            'observ': observ or '',
-                            'arquivo': os.path.basename(file_path)  # Adiciona nome do arquivo
-                        }
-
-                        registros.append(registro)
-
-        return registros
+        atualizar_cache_reinf(conn, impressoes)
+        return ler_registros_reinf(conn, list(impressoes))
+    finally:
+        conn.close()
 
-    except Exception as e:
-        st.error(f"Erro ao processar {os.path.basename(file_path)}: {str(e)}")
-        return []
+
+def consultar_cpf_reinf(pasta_base, cpf, competencias_selecionadas=None):
+    """Registros de um CPF, lendo apenas os arquivos em que o índice aponta o CPF"""
+    impressoes = listar_impressoes_reinf(pasta_base, competencias_selecionadas)
+    conn = abrir_cache_reinf(CACHE_REINF)
+    try:
+        atualizar_cache_reinf(conn, impressoes)
+        caminhos = [caminho for _, caminho, _ in arquivos_do_cpf_reinf(conn, cpf, list(impressoes))]
+        return ler_registros_reinf(conn, caminhos, cpf)
+    finally:
+        conn.close()
+
+
+def obter_base_reinf(pasta_base, competencias_selecionadas=None):
+    """
+    Registros das competências, carregados uma única vez por sessão: só são
+    relidos quando muda a seleção ou algum XML é criado, alterado ou removido.
+    A consulta de um CPF não passa por aqui (usa o índice de CPFs do cache).
+    """
+    impressoes = listar_impressoes_reinf(pasta_base, competencias_selecionadas)
+    assinatura = (CACHE_REINF_VERSAO, tuple(impressoes.items()))
+
+    base_sessao = st.session_state.get('base_reinf')
+    if base_sessao is None or base_sessao[0] != assinatura:
+        base_sessao = (assinatura, carregar_registros_reinf(impressoes))
+        st.session_state['base_reinf'] = base_sessao
+
+    return base_sessao[1]
+
+
+def obter_relatorio_reinf(registros, periodos_sel):
+    """
+    Tabelas do relatório de pagamentos, já formatadas para a tela.
+    Ficam na sessão junto com a versão da base e o filtro de períodos:
+    mexer no slider ou em outro widget não refaz agrupamentos nem formatação.
+    O detalhamento completo só é formatado na exportação, em blocos.
+    """
+    chave = (st.session_state['base_reinf'][0], tuple(periodos_sel))
+    relatorio_sessao = st.session_state.get('relatorio_reinf')
+    if relatorio_sessao is not None and relatorio_sessao[0] == chave:
+        return relatorio_sessao[1]
+
+    resumo = resumir_relatorio_reinf(registros)
+
+    # Na tela aparecem no máximo LIMITE_DETALHADO_TELA linhas (limite do slider)
+    detalhado = resumo.detalhado.head(LIMITE_DETALHADO_TELA).copy()
+    detalhado['Valor Pago'] = formatar_valores(detalhado['Valor Pago'], prefixo="R$ ")
+
+    por_competencia = resumo.por_competencia.copy()
+    por_competencia['Total Pago'] = formatar_valores(por_competencia['Total Pago'], prefixo="R$ ")
+
+    por_natureza = resumo.por_natureza.round(2)
+    por_natureza['Total Pago'] = formatar_valores(por_natureza['Total Pago'], prefixo="R$ ")
+
+    por_cpf = resumo.por_cpf.round(2)
+    por_cpf['Total Pago'] = formatar_valores(por_cpf['Total Pago'], prefixo="R$ ")
+
+    relatorio = {
+        'cpfs': len(resumo.por_cpf),
+        'pagamentos': len(resumo.detalhado),
+        'total': resumo.detalhado['Valor Pago'].sum(),
+        'registros': registros,
+        'detalhado': detalhado,
+        'por_competencia': por_competencia,
+        'por_natureza': por_natureza,
+        'resumo_natureza': resumo.por_natureza,
+        'por_cpf': por_cpf,
+        'arquivos': {}  # Exportações já gravadas: (tipo, formato) -> caminho
+    }
+    st.session_state['relatorio_reinf'] = (chave, relatorio)
+    return relatorio
 
 
 def listar_cpfs_e_periodos(pasta_base, competencias_selecionadas=None):
     """Lista todos os CPFs e períodos encontrados nos arquivos REINF 4010"""
-    cpfs = set()
-    periodos = set()
-
     if not os.path.exists(pasta_base):
         st.error(f"Pasta não encontrada: {pasta_base}")
         return [], []
 
-    arquivos_por_competencia = obter_arquivos_xml_por_competencia(pasta_base, competencias_selecionadas)
-    
-    for competencia, arquivos in arquivos_por_competencia.items():
-        for arquivo in arquivos:
-            try:
-                dados = parse_reinf_4010_xml(arquivo)
-                for registro in dados:
-                    if registro.get('cpfBenef'):
-                        cpfs.add(registro['cpfBenef'])
-                    if registro.get('perApur'):
-                        periodos.add(registro['perApur'])
-            except Exception as e:
-                continue
-
-    return sorted(cpfs), sorted(periodos)
+    # Lidos do índice de CPFs, sem carregar os registros
+    impressoes = listar_impressoes_reinf(pasta_base, competencias_selecionadas)
+    conn = abrir_cache_reinf(CACHE_REINF)
+    try:
+        atualizar_cache_reinf(conn, impressoes)
+        return listar_cpfs_indexados_reinf(conn, list(impressoes))
+    finally:
+        conn.close()
 
 
 def processar_arquivos_xml(pasta_base, cpf_sel=None, periodos_sel=None, competencias_sel=None):
-    """Processa todos os arquivos XML REINF 4010"""
-    registros = []
-
+    """Processa todos os arquivos XML REINF 4010 (DataFrame com um registro por pagamento)"""
     if not os.path.exists(pasta_base):
         st.error(f"Pasta não encontrada: {pasta_base}")
-        return registros
+        return registros_vazios_reinf()
 
     # Se não especificou competências, pega todas
     if not competencias_sel:
         competencias_sel = obter_subpastas_competencias(pasta_base)
 
-    arquivos_por_competencia = obter_arquivos_xml_por_competencia(pasta_base, competencias_sel)
-    
-    for competencia, arquivos in arquivos_por_competencia.items():
-        for arquivo in arquivos:
-            dados = parse_reinf_4010_xml(arquivo)
+    if cpf_sel:
+        # CPF especificado: lê só os arquivos em que ele aparece
+        df = consultar_cpf_reinf(pasta_base, cpf_sel, competencias_sel)
+    else:
+        df = obter_base_reinf(pasta_base, competencias_sel)
 
-            # Filtra por CPF se especificado
-            if cpf_sel:
-                dados = [r for r in dados if r.get("cpfBenef") == cpf_sel]
+    # Filtra por períodos se especificado
+    if periodos_sel:
+        # Garante que periodos_sel seja uma lista
+        if isinstance(periodos_sel, str):
+            periodos_sel = [periodos_sel]
+        df = df[df['perApur'].isin(periodos_sel)]
+
+    return df.reset_index(drop=True)
+
+
+def blocos_exportacao_reinf(relatorio, tipo, formato):
+    """Blocos de uma exportação do relatório; no CSV, valores como "1234,56" """
+    if tipo == 'detalhado':
+        return blocos_relatorio_reinf(relatorio['registros'], valores_texto=(formato == 'csv'))
+
+    resumo = relatorio['resumo_natureza'].reset_index()
+    if formato == 'csv':
+        resumo['Total Pago'] = formatar_valores(resumo['Total Pago'], separador_milhar=False)
+    return [resumo]
+
+
+def oferecer_exportacao_reinf(relatorio, tipo, formato, nome_base, key=None):
+    """
+    Grava a exportação em disco (uma vez por relatório e formato, em blocos)
+    e mostra o download. Falta de pyarrow/openpyxl aparece como erro na tela.
+    """
+    extensao, mime = FORMATOS_EXPORTACAO[formato]
+    caminho = relatorio['arquivos'].get((tipo, formato))
+    if caminho is None or not caminho.exists():
+        try:
+            with st.spinner("Gerando arquivo..."):
+                caminho = exportar_em_blocos(blocos_exportacao_reinf(relatorio, tipo, formato),
+                                             nome_base + extensao, formato)
+        except ImportError as e:
+            st.error(str(e))
+            return
+        relatorio['arquivos'][(tipo, formato)] = caminho
 
-            # Filtra por períodos se especificado
-            if periodos_sel:
-                # Garante que periodos_sel seja uma lista
-                if isinstance(periodos_sel, str):
-                    periodos_sel = [periodos_sel]
-                dados = [r for r in dados if r.get("perApur") in periodos_sel]
+    oferecer_download(caminho, f"📥 Download {formato.upper()}", mime=mime, key=key)
 
-            registros.extend(dados)
 
-    return registros
+def mostrar_relatorio_ingestao(competencias_sel):
+    """Avisa sobre XMLs de leiaute não suportado nas competências (lidos do cache, sem reprocessar)"""
+    if not CACHE_REINF.exists():
+        return
+    conn = abrir_cache_reinf(CACHE_REINF)
+    try:
+        relatorio = relatorio_ingestao_reinf(conn, competencias_sel)
+    finally:
+        conn.close()
 
+    nao_suportados = relatorio[~relatorio['suportado']]
+    if nao_suportados.empty:
+        return
 
-def create_download_link_csv(df, filename):
-    """Cria um link para download do CSV"""
-    csv = df.to_csv(index=False, encoding='utf-8-sig', sep=';')
-    b64 = base64.b64encode(csv.encode()).decode()
-    return f'<a href="data:file/csv;base64,{b64}" download="{filename}">📥 Download CSV</a>'
+    st.markdown("---")
+    st.warning(f"⚠️ {int(nao_suportados['arquivos'].sum())} XML(s) com leiaute não suportado foram ignorados")
+    with st.expander("📋 Relatório de ingestão"):
+        st.dataframe(relatorio.rename(columns={
+            'namespace': 'Namespace', 'versao': 'Versão', 'suportado': 'Suportado',
+            'arquivos': 'Arquivos', 'registros': 'Registros'
+        }), use_container_width=True, hide_index=True)
 
 
 # --- Interface principal ---
@@ -388,6 +415,13 @@ def main_interface():
             st.warning("⚠️ Selecione pelo menos uma competência")
             return
 
+        mostrar_relatorio_ingestao(competencias_sel)
+
+        st.markdown("---")
+        if st.button("🗑️ Limpar Cache", help="Relê todos os XMLs na próxima consulta"):
+            limpar_cache_reinf(CACHE_REINF)
+            st.rerun()
+
         st.markdown("---")
         tipo_consulta = st.radio(
             "Tipo de Consulta:",
@@ -420,14 +454,12 @@ def show_consulta_individual(competencias_sel):
     if cpf_sel:
         # Seleção de períodos
         periodos_cpf_data = processar_arquivos_xml(PASTA_BASE, cpf_sel, competencias_sel=competencias_sel)
-        if periodos_cpf_data:
-            periodos_cpf = sorted(
-                list(set([r['perApur'] for r in periodos_cpf_data])), reverse=True)
+        if not periodos_cpf_data.empty:
+            periodos_cpf = sorted(periodos_cpf_data['perApur'].unique(), reverse=True)
             periodo_sel = st.selectbox("Período:", ["Todos"] + periodos_cpf)
 
             if periodo_sel != "Todos":
-                dados = [r for r in periodos_cpf_data if r['perApur']
-                         == periodo_sel]
+                dados = periodos_cpf_data[periodos_cpf_data['perApur'] == periodo_sel]
             else:
                 dados = periodos_cpf_data
 
@@ -436,16 +468,16 @@ def show_consulta_individual(competencias_sel):
 
 def mostrar_resultados_individual(registros, cpf_sel):
     """Mostra resultados da consulta individual"""
-    if not registros:
+    if registros.empty:
         st.warning("Nenhum pagamento encontrado.")
         return
 
     # Métricas
     col1, col2, col3 = st.columns(3)
 
-    total_bruto = sum(r['vlrRendBruto'] for r in registros)
-    total_ir = sum(r['vlrRetIR'] for r in registros)
-    total_liquido = sum(r['vlrLiquido'] for r in registros)
+    total_bruto = registros['vlrRendBruto'].sum()
+    total_ir = registros['vlrRetIR'].sum()
+    total_liquido = registros['vlrLiquido'].sum()
 
     with col1:
         st.metric("💰 Total Bruto", f"R$ {format_value(total_bruto)}")
@@ -455,16 +487,14 @@ def mostrar_resultados_individual(registros, cpf_sel):
         st.metric("💵 Total Líquido", f"R$ {format_value(total_liquido)}")
 
     # Tabela
-    df = pd.DataFrame(registros)
-    df_display = df[['perApur', 'natRendDesc', 'dtFG',
+    df_display = registros[['perApur', 'natRendDesc', 'dtFG',
                      'vlrRendBruto', 'vlrRetIR', 'vlrLiquido', 'arquivo']].copy()
     df_display.columns = ['Período', 'Natureza', 'Data',
                           'Valor Bruto', 'IR Retido', 'Valor Líquido', 'Arquivo']
 
     # Formatar valores para exibição
     for col in ['Valor Bruto', 'IR Retido', 'Valor Líquido']:
-        df_display[col] = df_display[col].apply(
-            lambda x: f"R$ {format_value(x)}")
+        df_display[col] = formatar_valores(df_display[col], prefixo="R$ ")
 
     st.dataframe(df_display, use_container_width=True, hide_index=True)
 
@@ -476,24 +506,23 @@ def show_consulta_geral(competencias_sel):
     with st.spinner("Processando dados..."):
         registros = processar_arquivos_xml(PASTA_BASE, competencias_sel=competencias_sel)
 
-    if not registros:
+    if registros.empty:
         st.warning("Nenhum dado encontrado para as competências selecionadas.")
         return
 
     # Filtros
-    periodos = sorted(list(set([r['perApur']
-                      for r in registros])), reverse=True)
+    periodos = sorted(registros['perApur'].unique(), reverse=True)
     periodo_sel = st.selectbox("Período:", ["Todos"] + periodos)
 
     if periodo_sel != "Todos":
-        registros = [r for r in registros if r['perApur'] == periodo_sel]
+        registros = registros[registros['perApur'] == periodo_sel]
 
     # Métricas gerais
     col1, col2, col3, col4 = st.columns(4)
 
-    total_beneficiarios = len(set([r['cpfBenef'] for r in registros]))
+    total_beneficiarios = registros['cpfBenef'].nunique()
     total_pagamentos = len(registros)
-    total_valor = sum(r['vlrRendBruto'] for r in registros)
+    total_valor = registros['vlrRendBruto'].sum()
     competencias_processadas = len(competencias_sel)
 
     with col1:
@@ -506,15 +535,13 @@ def show_consulta_geral(competencias_sel):
         st.metric("📅 Competências", competencias_processadas)
 
     # Consolidado por natureza
-    df = pd.DataFrame(registros)
-    consolidado = df.groupby('natRendDesc').agg({
+    consolidado = registros.groupby('natRendDesc', observed=True).agg({
         'cpfBenef': 'nunique',
         'vlrRendBruto': ['count', 'sum']
     }).round(2)
 
     consolidado.columns = ['Beneficiários', 'Pagamentos', 'Total']
-    consolidado['Total'] = consolidado['Total'].apply(
-        lambda x: f"R$ {format_value(x)}")
+    consolidado['Total'] = formatar_valores(consolidado['Total'], prefixo="R$ ")
 
     st.dataframe(consolidado, use_container_width=True)
 
@@ -527,14 +554,14 @@ def show_relatorio_exportavel(competencias_sel):
     with st.spinner("Gerando relatório..."):
         registros = processar_arquivos_xml(PASTA_BASE, competencias_sel=competencias_sel)
 
-    if not registros:
+    if registros.empty:
         st.warning("Nenhum pagamento encontrado para as competências selecionadas.")
         return
 
     # Filtros adicionais
     st.subheader("🔍 Filtros Adicionais")
     
-    periodos_disponiveis = sorted(list(set([r['perApur'] for r in registros])), reverse=True)
+    periodos_disponiveis = sorted(registros['perApur'].unique(), reverse=True)
     periodos_sel = st.multiselect(
         "Períodos específicos (opcional):",
         options=periodos_disponiveis,
@@ -543,29 +570,13 @@ def show_relatorio_exportavel(competencias_sel):
 
     # Aplica filtro de período se selecionado
     if periodos_sel:
-        registros = [r for r in registros if r['perApur'] in periodos_sel]
+        registros = registros[registros['perApur'].isin(periodos_sel)]
 
-    if not registros:
+    if registros.empty:
         st.warning("Nenhum pagamento encontrado para os filtros selecionados.")
         return
 
-    # Prepara DataFrame do relatório
-    df_relatorio = pd.DataFrame(registros)
-
-    # Cria relatório final
-    df_final = df_relatorio[['cpfBenef', 'vlrRendBruto', 'natRendDesc', 'perApur', 'arquivo']].copy()
-    df_final.columns = ['CPF', 'Valor Pago', 'Natureza de Rendimento', 'Período', 'Arquivo']
-
-    # Formata CPFs completos
-    df_final['CPF'] = df_final['CPF'].apply(format_cpf_completo)
-
-    # Ordena por valor
-    df_final = df_final.sort_values('Valor Pago', ascending=False)
-
-    # Formata valores para exibição
-    df_display = df_final.copy()
-    df_display['Valor Pago'] = df_display['Valor Pago'].apply(
-        lambda x: f"R$ {format_value(x)}")
+    relatorio = obter_relatorio_reinf(registros, periodos_sel)
 
     # Estatísticas do relatório
     st.subheader("📊 Resumo")
@@ -573,85 +584,57 @@ def show_relatorio_exportavel(competencias_sel):
     col1, col2, col3, col4 = st.columns(4)
 
     with col1:
-        st.metric("👥 CPFs", df_final['CPF'].nunique())
+        st.metric("👥 CPFs", relatorio['cpfs'])
     with col2:
-        st.metric("📄 Pagamentos", len(df_final))
+        st.metric("📄 Pagamentos", relatorio['pagamentos'])
     with col3:
-        st.metric("💰 Total", f"R$ {format_value(df_final['Valor Pago'].sum())}")
+        st.metric("💰 Total", f"R$ {format_value(relatorio['total'])}")
     with col4:
         st.metric("📅 Competências", len(competencias_sel))
 
     # Resumo por competência
     st.subheader("📅 Por Competência")
-    
-    competencia_periodo = df_relatorio['perApur'].apply(lambda x: x[:7]).value_counts().sort_index(ascending=False)
-    competencia_df = pd.DataFrame({
-        'Competência': competencia_periodo.index,
-        'Qtd Pagamentos': competencia_periodo.values,
-        'Total Pago': [df_relatorio[df_relatorio['perApur'].str.startswith(comp)]['vlrRendBruto'].sum() 
-                       for comp in competencia_periodo.index]
-    })
-    competencia_df['Total Pago'] = competencia_df['Total Pago'].apply(lambda x: f"R$ {format_value(x)}")
-    
-    st.dataframe(competencia_df, use_container_width=True, hide_index=True)
+    st.dataframe(relatorio['por_competencia'], use_container_width=True, hide_index=True)
 
     # Resumo por natureza
     st.subheader("📈 Por Natureza de Rendimento")
+    st.dataframe(relatorio['por_natureza'], use_container_width=True)
 
-    resumo_natureza = df_final.groupby('Natureza de Rendimento').agg({
-        'CPF': 'nunique',
-        'Valor Pago': ['count', 'sum']
-    }).round(2)
-
-    resumo_natureza.columns = ['CPFs Únicos', 'Qtd Pagamentos', 'Total Pago']
-    resumo_natureza['Total Pago'] = resumo_natureza['Total Pago'].apply(
-        lambda x: f"R$ {format_value(x)}")
-    resumo_natureza = resumo_natureza.sort_values(
-        'Qtd Pagamentos', ascending=False)
-
-    st.dataframe(resumo_natureza, use_container_width=True)
+    # Resumo por CPF
+    st.subheader("👥 Por CPF")
+    st.dataframe(relatorio['por_cpf'], use_container_width=True)
 
     # Relatório detalhado
     st.subheader("📋 Relatório Detalhado")
 
     # Limita exibição na tela
-    limite_exibicao = st.slider("Registros na tela:", 50, 500, 100, 50)
-    st.dataframe(df_display.head(limite_exibicao),
+    limite_exibicao = st.slider("Registros na tela:", 50, LIMITE_DETALHADO_TELA, 100, 50)
+    st.dataframe(relatorio['detalhado'].head(limite_exibicao),
                  use_container_width=True, hide_index=True)
 
-    if len(df_display) > limite_exibicao:
+    if relatorio['pagamentos'] > limite_exibicao:
         st.info(
-            f"Mostrando {limite_exibicao} de {len(df_display)} registros. Use o download para ver todos.")
+            f"Mostrando {limite_exibicao} de {relatorio['pagamentos']} registros. Use o download para ver todos.")
 
     # Downloads
     st.subheader("📥 Downloads")
 
+    formato = st.radio("Formato:", list(FORMATOS_EXPORTACAO), horizontal=True,
+                       format_func=str.upper, key="formato_exportacao_reinf")
+    sufixo = '_'.join(competencias_sel).replace('-', '')
+
     col1, col2 = st.columns(2)
 
     with col1:
         # Relatório completo
-        df_export = df_final.copy()
-        df_export['Valor Pago'] = df_export['Valor Pago'].apply(
-            lambda x: f"{x:.2f}".replace('.', ','))
-
-        filename_completo = f"REINF_4010_Detalhado_{'_'.join(competencias_sel).replace('-', '')}.csv"
-        st.markdown(
-            create_download_link_csv(df_export, filename_completo),
-            unsafe_allow_html=True
-        )
+        oferecer_exportacao_reinf(relatorio, 'detalhado', formato, f"REINF_4010_Detalhado_{sufixo}",
+                                  key="download_detalhado")
         st.caption("Relatório completo detalhado")
 
     with col2:
         # Resumo por natureza
-        resumo_export = resumo_natureza.copy()
-        resumo_export['Total Pago'] = df_final.groupby('Natureza de Rendimento')[
-            'Valor Pago'].sum().apply(lambda x: f"{x:.2f}".replace('.', ','))
-
-        filename_resumo = f"REINF_4010_Resumo_{'_'.join(competencias_sel).replace('-', '')}.csv"
-        st.markdown(
-            create_download_link_csv(resumo_export, filename_resumo),
-            unsafe_allow_html=True
-        )
+        oferecer_exportacao_reinf(relatorio, 'natureza', formato, f"REINF_4010_Resumo_{sufixo}",
+                                  key="download_resumo")
         st.caption("Resumo por natureza")
 
 
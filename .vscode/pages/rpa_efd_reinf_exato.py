@@ -10,6 +10,10 @@ CORREÇÕES BASEADAS NO DEBUG:
 ✅ Identificação precisa da coluna de recibos
 ✅ Navegação inteligente entre páginas
 ✅ Log detalhado de recibos processados
+✅ Esperas por condição da página (tabela, detalhe, download) em vez de pausas fixas
+✅ Modo com várias abas em paralelo no mesmo contexto autenticado
+✅ Download direto por HTTP (opcional), com o fluxo de cliques como reserva
+✅ Estado em diário append-only (uma linha por recibo), compactado periodicamente
 
 EXECUÇÃO: python rpa_efd_reinf_final.py
 """
@@ -21,6 +25,7 @@ import sys
 import atexit
 from datetime import datetime, timedelta
 from pathlib import Path
+import os
 import re
 import json
 
@@ -75,7 +80,7 @@ signal.signal(signal.SIGINT, signal_handler)
 
 # Verifica se Playwright está instalado
 try:
-    from playwright.async_api import async_playwright
+    from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 except ImportError:
     print("❌ Playwright não instalado!")
     print("💡 Execute: pip install playwright")
@@ -83,6 +88,104 @@ except ImportError:
     input("Pressione Enter para sair...")
     sys.exit(1)
 
+# Timeout (ms) de cada etapa que espera uma condição da página
+TIMEOUTS_ETAPA_MS = {
+    'pagina_inicial': 10000,  # iframe carregado
+    'submenu': 3000,          # submenu aberto pelo hover
+    'campos': 10000,          # campos de período visíveis
+    'preenchimento': 2000,    # valor aceito pelo campo após o Tab
+    'tabela': 20000,          # linhas da tabela com recibo renderizadas
+    'detalhe': 15000,         # painel de detalhe com o botão de XML visível
+    'download': 15000,        # download iniciado pelo navegador
+    'troca_pagina': 20000,    # recibos da tabela diferentes dos da página anterior
+}
+
+# Linhas do diário de estado até compactá-lo no JSON de estado
+COMPACTAR_DIARIO_A_CADA = 200
+
+# Passagens extras pela competência para repetir recibos que falharam
+TENTATIVAS_RECIBOS_FALHOS = 2
+
+# Máximo de abas trabalhando em paralelo no modo multi-abas
+MAX_ABAS_PARALELAS = 6
+
+# Downloads HTTP diretos simultâneos por aba (caminho rápido)
+LIMITE_DOWNLOADS_DIRETOS = 4
+
+# Cabeçalhos do pedido capturado que não são repetidos: o contexto do
+# navegador cuida de cookies, host e tamanho do corpo
+CABECALHOS_NAO_REPETIDOS = {'cookie', 'host', 'content-length'}
+
+# Padrão do recibo baseado no DEBUG
+PADRAO_RECIBO = r'\d{8}-\d{2}-\d{4}-\d{4}-\d{8}'
+
+# Leitura da primeira tabela numa única chamada dentro do iframe: cabeçalho,
+# colunas de cada linha, recibo da coluna 6 e o índice do botão Detalhar da
+# linha (na ordem em que os seletores de Detalhar encontram os botões)
+JS_DADOS_TABELA = r"""() => {
+    const dados = {encontrada: false, cabecalho: [], linhas: [], recibos: []};
+    const tabela = document.querySelector('table');
+    if (!tabela) return dados;
+    dados.encontrada = true;
+
+    const padrao = new RegExp(%s);
+    const botoes = Array.from(document.querySelectorAll('button'))
+        .filter(el => (el.textContent || '').trim() === 'Detalhar');
+    const entradas = Array.from(document.querySelectorAll("input[type='submit'], input[type='button']"))
+        .filter(el => el.value === 'Detalhar');
+    const detalhar = botoes.length ? botoes : entradas;
+
+    const linhas = Array.from(tabela.querySelectorAll('tr'));
+    if (linhas.length) {
+        dados.cabecalho = Array.from(linhas[0].querySelectorAll('th, td')).map(c => c.innerText.trim());
+    }
+    linhas.slice(1).forEach((linha, i) => {
+        const celulas = Array.from(linha.querySelectorAll('td'));
+        const registro = {linha: i + 1, colunas: celulas.map(c => c.innerText.trim()), recibo: null, detalhar: null};
+        if (celulas.length >= 6) {
+            const achado = celulas[5].innerText.match(padrao);
+            if (achado) {
+                registro.recibo = achado[0];
+                dados.recibos.push(achado[0]);
+            }
+        }
+        const indice = detalhar.findIndex(el => linha.contains(el));
+        if (indice >= 0) registro.detalhar = indice;
+        dados.linhas.push(registro);
+    });
+    return dados;
+}""" % json.dumps(PADRAO_RECIBO)
+
+# Só os recibos da coluna 6, para as esperas por condição: roda a cada quadro
+# enquanto a espera dura, então não lê as outras células nem os botões, e usa
+# textContent (innerText força o cálculo de layout)
+JS_RECIBOS_TABELA = r"""() => {
+    const tabela = document.querySelector('table');
+    if (!tabela) return [];
+    const padrao = new RegExp(%s);
+    const recibos = [];
+    for (const celula of tabela.querySelectorAll('tr > td:nth-child(6)')) {
+        const achado = (celula.textContent || '').match(padrao);
+        if (achado) recibos.push(achado[0]);
+    }
+    return recibos;
+}""" % json.dumps(PADRAO_RECIBO)
+
+# Tabela pronta: já há linhas com recibo, ou o portal avisou que não há resultados
+JS_TABELA_PRONTA = r"""() => (%s)().length > 0
+    || /nenhum (registro|resultado|pagamento)|não (foram )?encontrad/i.test(document.body ? document.body.textContent : '')
+""" % JS_RECIBOS_TABELA
+
+# Página trocada: a tabela tem recibos e eles não são os da página anterior
+JS_PAGINA_TROCADA = r"""(anteriores) => {
+    const atuais = (%s)();
+    return atuais.length > 0 && atuais.join('|') !== anteriores.join('|');
+}""" % JS_RECIBOS_TABELA
+
+# Detalhe aberto: algum botão/link "Baixar XML" visível
+JS_DETALHE_VISIVEL = r"""() => Array.from(document.querySelectorAll('button, input, a')).some(
+    el => /Baixar XML/i.test(el.innerText || el.value || '') && el.offsetParent !== null)"""
+
 class RPAEFDReinfFinal:
     def __init__(self):
         self.browser = None
@@ -96,12 +199,28 @@ class RPAEFDReinfFinal:
         self.competencia_atual = ""
         self.pagina_atual = 1
         self.total_paginas = 0
+        self.rotulo = ""  # Identifica a aba nos logs do modo multi-abas
         
         # CONTROLE DE DUPLICATAS - NOVO
         self.recibos_processados = set()  # Set para controle de duplicatas
         self.recibos_por_pagina = {}      # Dict para debug
+        self.detalhar_por_recibo = {}     # Recibo -> índice do botão Detalhar na página atual
+        self.linhas_diario = 0            # Linhas gravadas no diário desde a última compactação
         self.paginas_visitadas = set()    # Controle de páginas já visitadas
         
+        # Compartilhados entre as abas: recibos em processamento e a trava que
+        # protege a reserva/conclusão de um recibo
+        self.recibos_em_andamento = set()
+        self.trava_recibos = asyncio.Lock()
+        # Recibo -> competência, para os que falharam e ainda não foram baixados
+        # (quem pulou um recibo reservado por outra aba não volta a ele)
+        self.recibos_falhos = {}
+        
+        # Download direto: pedido do XML capturado no primeiro download pela
+        # interface e repetido para os demais recibos (vazio = não capturado)
+        self.download_direto = False
+        self.modelo_download = {}
+        
         # Cache de seletores para reuso
         self.seletores_cache = {
             'detalhar': [],
@@ -114,37 +233,123 @@ class RPAEFDReinfFinal:
         Path("screenshots").mkdir(exist_ok=True)
         Path("logs").mkdir(exist_ok=True)
 
+    def caminho_estado(self, extensao=".json"):
+        """Arquivo de estado da competência atual (.json = compactado, .jsonl = diário)"""
+        return self.downloads_folder / f"estado_recibos_{self.competencia_atual.replace('/', '-')}{extensao}"
+
+    def registrar_estado(self, registro):
+        """
+        Acrescenta um registro ao diário da competência (uma linha JSON, sem
+        reescrever o estado inteiro). O arquivo é aberto a cada linha para
+        as abas da mesma competência poderem compactá-lo sem perder linhas.
+        """
+        try:
+            with open(self.caminho_estado(".jsonl"), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self.linhas_diario += 1
+            if self.linhas_diario >= COMPACTAR_DIARIO_A_CADA:
+                self.salvar_estado_recibos()
+        except Exception as e:
+            print(f"⚠️ Erro ao registrar estado: {str(e)}")
+
+    def ler_estado_em_disco(self):
+        """
+        Estado da competência atual gravado em disco: o JSON compactado com o
+        diário reaplicado por cima (linhas de todas as abas da competência).
+        Devolve (estado, linhas do diário reaplicadas).
+        """
+        estado = {"recibos_processados": [], "recibos_por_pagina": {}, "paginas_visitadas": []}
+        estado_path = self.caminho_estado()
+        if estado_path.exists():
+            try:
+                with open(estado_path, 'r', encoding='utf-8') as f:
+                    estado.update(json.load(f))
+            except ValueError:
+                pass
+        
+        recibos = set(estado["recibos_processados"])
+        recibos_por_pagina = {str(pagina): lista for pagina, lista in estado["recibos_por_pagina"].items()}
+        linhas = 0
+        diario_path = self.caminho_estado(".jsonl")
+        if diario_path.exists():
+            with open(diario_path, 'r', encoding='utf-8') as f:
+                for linha in f:
+                    try:
+                        registro = json.loads(linha)
+                    except ValueError:
+                        continue  # Linha incompleta de uma queda no meio da gravação
+                    if "recibo" in registro:
+                        recibos.add(registro["recibo"])
+                    if "pagina" in registro:
+                        recibos_por_pagina[str(registro["pagina"])] = registro.get("recibos", [])
+                    linhas += 1
+        
+        estado["recibos_processados"] = recibos
+        estado["recibos_por_pagina"] = recibos_por_pagina
+        estado["paginas_visitadas"] = set(estado["paginas_visitadas"])
+        return estado, linhas
+
     def salvar_estado_recibos(self):
-        """Salva estado dos recibos processados"""
+        """
+        Compacta o estado: incorpora ao JSON o diário como está em disco
+        (inclusive linhas de outras abas da mesma competência), grava num
+        .tmp trocado de uma vez (sem arquivo pela metade se o processo cair)
+        e só então esvazia o diário. Os recibos gravados são só os da
+        competência (vindos do próprio arquivo), não o conjunto em memória,
+        que é compartilhado entre competências. Não há await entre a leitura
+        e o esvaziamento, então nenhuma outra aba grava no diário no meio.
+        """
         try:
+            estado_path = self.caminho_estado()
+            em_disco, _ = self.ler_estado_em_disco()
+            
+            # O mapa de páginas e as páginas visitadas são de cada aba: mescla
+            # com o que as outras abas já gravaram em vez de sobrescrever
+            recibos_por_pagina = em_disco["recibos_por_pagina"]
+            recibos_por_pagina.update({str(pagina): recibos for pagina, recibos in self.recibos_por_pagina.items()})
+            
             estado = {
                 "timestamp": datetime.now().isoformat(),
                 "competencia": self.competencia_atual,
-                "recibos_processados": list(self.recibos_processados),
-                "recibos_por_pagina": self.recibos_por_pagina,
-                "paginas_visitadas": list(self.paginas_visitadas),
-                "total_processados": self.total_processados
+                "recibos_processados": sorted(em_disco["recibos_processados"]),
+                "recibos_por_pagina": recibos_por_pagina,
+                "paginas_visitadas": sorted(em_disco["paginas_visitadas"] | self.paginas_visitadas),
+                "total_processados": len(em_disco["recibos_processados"])
             }
             
-            estado_path = self.downloads_folder / f"estado_recibos_{self.competencia_atual.replace('/', '-')}.json"
-            with open(estado_path, 'w', encoding='utf-8') as f:
+            temporario = self.caminho_estado(".json.tmp")
+            with open(temporario, 'w', encoding='utf-8') as f:
                 json.dump(estado, f, ensure_ascii=False, indent=2)
+            os.replace(temporario, estado_path)
+            
+            # Só depois do JSON no lugar: se cair antes, o diário é reaplicado
+            open(self.caminho_estado(".jsonl"), 'w', encoding='utf-8').close()
+            self.linhas_diario = 0
                 
         except Exception as e:
             print(f"⚠️ Erro ao salvar estado: {str(e)}")
 
     def carregar_estado_recibos(self):
-        """Carrega estado anterior dos recibos"""
+        """Carrega o estado compactado e reaplica o diário gravado depois dele"""
         try:
-            estado_path = self.downloads_folder / f"estado_recibos_{self.competencia_atual.replace('/', '-')}.json"
-            if estado_path.exists():
-                with open(estado_path, 'r', encoding='utf-8') as f:
-                    estado = json.load(f)
-                
-                self.recibos_processados = set(estado.get("recibos_processados", []))
-                self.recibos_por_pagina = estado.get("recibos_por_pagina", {})
-                self.paginas_visitadas = set(estado.get("paginas_visitadas", []))
-                
+            estado, linhas = self.ler_estado_em_disco()
+            carregado = self.caminho_estado().exists() or linhas > 0
+            
+            # Atualiza no lugar: o set pode estar compartilhado com outras abas
+            self.recibos_processados.update(estado["recibos_processados"])
+            self.recibos_por_pagina = estado["recibos_por_pagina"]
+            self.paginas_visitadas = estado["paginas_visitadas"]
+            
+            if linhas:
+                print(f"📋 Diário reaplicado: {linhas} registros")
+            
+            # Compacta sempre que houver diário, mesmo sem linha legível: uma
+            # linha incompleta deixada no fim colaria no próximo registro
+            diario_path = self.caminho_estado(".jsonl")
+            if diario_path.exists() and diario_path.stat().st_size:
+                self.salvar_estado_recibos()
+            
+            if carregado:
                 print(f"📋 Estado carregado: {len(self.recibos_processados)} recibos já processados")
                 return True
                 
@@ -180,27 +385,82 @@ class RPAEFDReinfFinal:
                 
             print("✅ Página principal encontrada")
             
-            # Procura iframe EFD-REINF
-            try:
-                iframe_element = await self.page.wait_for_selector("iframe#frmApp", timeout=8000)
-                if not iframe_element:
-                    return False
-                
-                self.iframe = await iframe_element.content_frame()
-                if not self.iframe:
-                    return False
-                
-                print("✅ Iframe EFD-REINF acessado")
-                return True
-                
-            except Exception as e:
-                print(f"❌ Erro ao acessar iframe: {str(e)}")
-                return False
+            return await self.acessar_iframe()
             
         except Exception as e:
             print(f"❌ Erro ao conectar: {str(e)}")
             return False
 
+    async def acessar_iframe(self):
+        """Procura o iframe EFD-REINF na página (aba) deste RPA"""
+        try:
+            iframe_element = await self.page.wait_for_selector("iframe#frmApp", timeout=8000)
+            if not iframe_element:
+                return False
+            
+            self.iframe = await iframe_element.content_frame()
+            if not self.iframe:
+                return False
+            
+            print(f"✅ {self.rotulo}Iframe EFD-REINF acessado")
+            return True
+            
+        except Exception as e:
+            print(f"❌ {self.rotulo}Erro ao acessar iframe: {str(e)}")
+            return False
+
+    def criar_trabalhador(self, page, numero_aba):
+        """
+        RPA de outra aba do mesmo contexto autenticado. Compartilha os recibos
+        (processados e em andamento), a trava e a lista de downloads; página,
+        iframe, competência e paginação são próprios da aba.
+        """
+        trabalhador = RPAEFDReinfFinal()
+        trabalhador.browser = self.browser
+        trabalhador.playwright = self.playwright
+        trabalhador.page = page
+        trabalhador.rotulo = f"[Aba {numero_aba}] "
+        trabalhador.recibos_processados = self.recibos_processados
+        trabalhador.recibos_em_andamento = self.recibos_em_andamento
+        trabalhador.recibos_falhos = self.recibos_falhos
+        trabalhador.trava_recibos = self.trava_recibos
+        trabalhador.downloads_realizados = self.downloads_realizados
+        trabalhador.download_direto = self.download_direto
+        trabalhador.modelo_download = self.modelo_download
+        return trabalhador
+
+    async def reservar_recibo(self, recibo):
+        """Reserva o recibo para esta aba; False se já foi ou está sendo processado"""
+        async with self.trava_recibos:
+            if recibo in self.recibos_processados:
+                print(f"⚠️ Recibo {recibo} já processado - pulando")
+                return False
+            if recibo in self.recibos_em_andamento:
+                print(f"⚠️ Recibo {recibo} em processamento em outra aba - pulando")
+                return False
+            self.recibos_em_andamento.add(recibo)
+            return True
+
+    async def concluir_recibo(self, recibo, sucesso):
+        """
+        Libera a reserva e, com sucesso, marca o recibo como processado; sem
+        sucesso, ele fica na lista de falhas da competência para ser repetido
+        """
+        async with self.trava_recibos:
+            self.recibos_em_andamento.discard(recibo)
+            if sucesso:
+                self.recibos_processados.add(recibo)
+                self.recibos_falhos.pop(recibo, None)
+                self.total_processados += 1
+                self.registrar_estado({"recibo": recibo})
+            else:
+                self.recibos_falhos[recibo] = self.competencia_atual
+
+    def recibos_falhos_da_competencia(self):
+        """Recibos da competência atual que falharam (em qualquer aba) e seguem pendentes"""
+        return [recibo for recibo, competencia in self.recibos_falhos.items()
+                if competencia == self.competencia_atual and recibo not in self.recibos_processados]
+
     def criar_pasta_competencia(self, competencia):
         """Cria pasta específica para a competência"""
         try:
@@ -212,27 +472,33 @@ class RPAEFDReinfFinal:
         except Exception:
             return self.downloads_folder
 
+    def caminho_download(self, nome_sugerido=None):
+        """Caminho do XML na pasta da competência atual e o nome relativo para o relatório"""
+        pasta_destino = self.criar_pasta_competencia(self.competencia_atual)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"EFD_REINF_R4000_{timestamp}.xml"
+        
+        if nome_sugerido:
+            original_name = nome_sugerido
+            if not original_name.endswith('.xml'):
+                original_name += '.xml'
+            filename = f"{timestamp}_{original_name}"
+        
+        arquivo_relativo = f"{self.competencia_atual.replace('/', '-')}/{filename}"
+        return pasta_destino / filename, arquivo_relativo
+
     async def configurar_downloads(self):
         """Configura captura automática de downloads"""
         try:
+            # Cada aba registra o próprio handler: o arquivo vai para a pasta
+            # da competência que esta aba está processando
             async def handle_download(download):
                 try:
-                    pasta_destino = self.criar_pasta_competencia(self.competencia_atual)
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"EFD_REINF_R4000_{timestamp}.xml"
-                    
-                    if download.suggested_filename:
-                        original_name = download.suggested_filename
-                        if not original_name.endswith('.xml'):
-                            original_name += '.xml'
-                        filename = f"{timestamp}_{original_name}"
-                    
-                    download_path = pasta_destino / filename
+                    download_path, arquivo_relativo = self.caminho_download(download.suggested_filename)
                     await download.save_as(download_path)
                     
-                    arquivo_relativo = f"{self.competencia_atual.replace('/', '-')}/{filename}"
                     self.downloads_realizados.append(arquivo_relativo)
-                    print(f"📥 ✅ XML salvo: {arquivo_relativo}")
+                    print(f"📥 ✅ {self.rotulo}XML salvo: {arquivo_relativo}")
                     
                 except Exception as e:
                     print(f"❌ Erro ao salvar download: {str(e)}")
@@ -245,11 +511,218 @@ class RPAEFDReinfFinal:
             print(f"❌ Erro ao configurar downloads: {str(e)}")
 
     async def aguardar_inteligente(self, segundos=2, operacao=""):
-        """Aguarda de forma inteligente com feedback"""
+        """Pausa fixa com feedback (só quando não há condição da página a esperar)"""
         if operacao:
             print(f"   ⏳ Aguardando {operacao}...")
         await asyncio.sleep(segundos)
 
+    async def aguardar_condicao(self, espera, etapa, segundos_fallback=2, operacao=""):
+        """
+        Bloqueia só até a condição da página valer. `espera(timeout)` é a
+        espera do Playwright que termina quando a condição vale. Devolve True
+        se a condição valeu, False se o timeout da etapa esgotou; se a condição
+        não pôde ser avaliada, usa a pausa fixa antiga (`segundos_fallback`).
+        """
+        if operacao:
+            print(f"   ⏳ Aguardando {operacao}...")
+        try:
+            await espera(TIMEOUTS_ETAPA_MS[etapa])
+            return True
+        except PlaywrightTimeoutError:
+            print(f"   ⚠️ Tempo esgotado aguardando {operacao or etapa}")
+            return False
+        except Exception:
+            await asyncio.sleep(segundos_fallback)
+            return False
+
+    async def aguardar_tabela(self, segundos_fallback=2, operacao="tabela"):
+        """Aguarda as linhas da tabela com recibo (ou o aviso de tabela vazia)"""
+        return await self.aguardar_condicao(
+            lambda timeout: self.iframe.wait_for_function(JS_TABELA_PRONTA, timeout=timeout),
+            'tabela', segundos_fallback, operacao)
+
+    async def aguardar_detalhe(self, segundos_fallback=2, operacao="detalhe"):
+        """Aguarda o painel de detalhe com o botão de XML visível"""
+        return await self.aguardar_condicao(
+            lambda timeout: self.iframe.wait_for_function(JS_DETALHE_VISIVEL, timeout=timeout),
+            'detalhe', segundos_fallback, operacao)
+
+    async def aguardar_campos_periodo(self, segundos_fallback=2, operacao="campos de período"):
+        """Aguarda os campos MM/AAAA visíveis"""
+        return await self.aguardar_condicao(
+            lambda timeout: self.iframe.wait_for_selector(
+                "input[placeholder*='MM']", state='visible', timeout=timeout),
+            'campos', segundos_fallback, operacao)
+
+    async def clicar_e_aguardar_download(self, element, recibo=None, segundos_fallback=2):
+        """
+        Clica e espera o navegador iniciar o download (o arquivo é salvo pelo
+        handler de `configurar_downloads`). Devolve False só quando o clique
+        aconteceu e o download comprovadamente não começou; erros do próprio
+        clique sobem para quem chamou.
+
+        Com o download direto ligado e ainda sem modelo, os pedidos feitos
+        durante o clique são registrados para capturar o pedido do XML.
+        """
+        print("   ⏳ Aguardando início do download...")
+        capturar = bool(recibo) and self.download_direto and not self.modelo_download
+        requisicoes = []
+        registrar = requisicoes.append
+        if capturar:
+            self.page.on("request", registrar)
+        
+        clicou = False
+        try:
+            async with self.page.expect_download(timeout=TIMEOUTS_ETAPA_MS['download']) as info:
+                await element.click()
+                clicou = True
+            if capturar:
+                await self.capturar_modelo_download(await info.value, requisicoes, recibo)
+            return True
+        except PlaywrightTimeoutError:
+            if not clicou:
+                raise
+            print("   ⚠️ O download não iniciou")
+            return False
+        except Exception:
+            if not clicou:
+                raise
+            await asyncio.sleep(segundos_fallback)
+            return True
+        finally:
+            if capturar:
+                self.page.remove_listener("request", registrar)
+
+    async def capturar_modelo_download(self, download, requisicoes, recibo):
+        """
+        Guarda o pedido HTTP que gerou o download do XML de `recibo` como
+        modelo para os demais: o número do recibo na URL/corpo vira o ponto de
+        troca. Se o pedido não puder ser repetido, o download direto é
+        desligado e tudo segue pelos cliques.
+        """
+        try:
+            pedido = next((r for r in reversed(requisicoes) if r.url == download.url), None)
+            motivo = None
+            if not download.url.startswith("http") or pedido is None:
+                motivo = "o XML não veio de um pedido HTTP reproduzível"
+            elif recibo not in pedido.url and recibo not in (pedido.post_data or ""):
+                motivo = "o pedido do XML não traz o número do recibo"
+            elif not self.xml_do_recibo(Path(await download.path()).read_bytes(), recibo):
+                # O portal pode escolher o evento pela sessão/ViewState, e não
+                # pelo recibo no pedido: sem o recibo no próprio XML, repetir
+                # o pedido traria sempre o mesmo arquivo
+                motivo = "o XML baixado não traz o número do recibo"
+            
+            if motivo:
+                print(f"ℹ️ Download direto indisponível: {motivo} - seguindo pelos cliques")
+                self.modelo_download['desativado'] = True
+                return
+            
+            cabecalhos = {
+                nome: valor for nome, valor in (await pedido.all_headers()).items()
+                if not nome.startswith(':') and nome.lower() not in CABECALHOS_NAO_REPETIDOS
+            }
+            self.modelo_download.update(
+                recibo=recibo,
+                metodo=pedido.method,
+                url=pedido.url,
+                corpo=pedido.post_data,
+                cabecalhos=cabecalhos,
+            )
+            print(f"⚡ Pedido do XML capturado ({pedido.method}) - download direto ativado")
+            
+        except Exception as e:
+            print(f"⚠️ Erro ao capturar pedido do XML: {str(e)}")
+            self.modelo_download['desativado'] = True
+
+    @staticmethod
+    def xml_do_recibo(conteudo, recibo):
+        """O conteúdo é um XML (não uma página de erro/login) e cita o recibo pedido"""
+        inicio = conteudo.lstrip()[:200].lower()
+        if not inicio.startswith(b'<') or b'<html' in inicio or b'<!doctype html' in inicio:
+            return False
+        return recibo.encode() in conteudo
+
+    def download_direto_disponivel(self):
+        """Há modelo capturado e o download direto não foi desligado"""
+        return (self.download_direto and 'url' in self.modelo_download
+                and not self.modelo_download.get('desativado'))
+
+    async def baixar_xml_direto(self, recibo):
+        """Repete o pedido do XML para `recibo` com os cookies do navegador e salva o arquivo"""
+        modelo = self.modelo_download
+        url = modelo['url'].replace(modelo['recibo'], recibo)
+        corpo = modelo['corpo'].replace(modelo['recibo'], recibo) if modelo['corpo'] else None
+        
+        try:
+            resposta = await self.page.context.request.fetch(
+                url, method=modelo['metodo'], headers=modelo['cabecalhos'], data=corpo,
+                timeout=TIMEOUTS_ETAPA_MS['download'])
+            try:
+                if not resposta.ok or 'html' in resposta.headers.get('content-type', '').lower():
+                    return False
+                conteudo = await resposta.body()
+                disposicao = resposta.headers.get('content-disposition', '')
+            finally:
+                # O contexto do CDP é o do usuário e vive a execução toda: sem
+                # dispose, cada corpo de resposta fica retido na memória
+                await resposta.dispose()
+            
+            # Sessão expirada ou erro do portal voltam como página; um XML de
+            # outro recibo indica que o pedido não escolhe o evento pelo recibo
+            if not self.xml_do_recibo(conteudo, recibo):
+                print(f"⚠️ A resposta não é o XML do recibo {recibo} - download direto desativado")
+                self.modelo_download['desativado'] = True
+                return False
+            
+            nome_sugerido = None
+            achado = re.search(r'filename\*?=(?:UTF-8\'\')?"?([^";]+)"?', disposicao, re.IGNORECASE)
+            if achado:
+                nome_sugerido = Path(achado.group(1)).name
+            
+            download_path, arquivo_relativo = self.caminho_download(nome_sugerido)
+            download_path.write_bytes(conteudo)
+            self.downloads_realizados.append(arquivo_relativo)
+            print(f"📥 ⚡ {self.rotulo}XML salvo (direto): {arquivo_relativo}")
+            return True
+            
+        except Exception as e:
+            print(f"⚠️ Download direto falhou - Recibo {recibo}: {str(e)}")
+            return False
+
+    async def baixar_recibos_direto(self, recibos):
+        """
+        Caminho rápido: baixa os recibos por HTTP direto, no máximo
+        LIMITE_DOWNLOADS_DIRETOS ao mesmo tempo. Devolve os que foram baixados;
+        os demais continuam pendentes para o fluxo de cliques.
+        """
+        semaforo = asyncio.Semaphore(LIMITE_DOWNLOADS_DIRETOS)
+        
+        async def baixar(recibo):
+            if not await self.reservar_recibo(recibo):
+                return False
+            sucesso = False
+            try:
+                async with semaforo:
+                    # Desativado por outra resposta do lote: o resto vai pelos cliques
+                    if self.download_direto_disponivel():
+                        sucesso = await self.baixar_xml_direto(recibo)
+            finally:
+                await self.concluir_recibo(recibo, sucesso)
+            return sucesso
+        
+        print(f"⚡ Download direto de {len(recibos)} recibos...")
+        resultados = await asyncio.gather(*(baixar(recibo) for recibo in recibos))
+        baixados = [recibo for recibo, sucesso in zip(recibos, resultados) if sucesso]
+        
+        if not baixados and recibos:
+            # Nenhum pedido repetido funcionou: o modelo não serve, volta aos cliques
+            print("⚠️ Download direto sem sucesso - desativado, seguindo pelos cliques")
+            self.modelo_download['desativado'] = True
+        
+        print(f"⚡ {len(baixados)}/{len(recibos)} recibos baixados direto")
+        return baixados
+
     async def screenshot_debug(self, nome="debug"):
         """Screenshot para debug quando necessário"""
         try:
@@ -265,7 +738,9 @@ class RPAEFDReinfFinal:
         try:
             print("🎯 PASSO 1: Navegando para 'Visualizar pagamentos/créditos'...")
             
-            await self.aguardar_inteligente(2, "carregamento inicial")
+            await self.aguardar_condicao(
+                lambda timeout: self.iframe.wait_for_load_state('domcontentloaded', timeout=timeout),
+                'pagina_inicial', 2, "carregamento inicial")
             
             # Seletores priorizados
             seletores_visualizar = [
@@ -280,9 +755,8 @@ class RPAEFDReinfFinal:
                     element = await self.iframe.wait_for_selector(seletor, timeout=3000)
                     if element and await element.is_visible():
                         await element.click()
-                        await self.iframe.wait_for_load_state('networkidle', timeout=15000)
                         print("✅ Navegou diretamente para visualizar pagamentos")
-                        await self.aguardar_inteligente(3, "carregamento da página")
+                        await self.aguardar_campos_periodo(3, "carregamento da página")
                         return True
                 except:
                     continue
@@ -300,7 +774,10 @@ class RPAEFDReinfFinal:
                     element = await self.iframe.wait_for_selector(seletor_hover, timeout=3000)
                     if element:
                         await element.hover()
-                        await self.aguardar_inteligente(1, "submenu")
+                        await self.aguardar_condicao(
+                            lambda timeout: self.iframe.wait_for_selector(
+                                seletores_visualizar[0], state='visible', timeout=timeout),
+                            'submenu', 1, "submenu")
                         
                         # Tenta clicar no submenu
                         for seletor in seletores_visualizar:
@@ -308,9 +785,8 @@ class RPAEFDReinfFinal:
                                 sub_element = await self.iframe.wait_for_selector(seletor, timeout=2000)
                                 if sub_element and await sub_element.is_visible():
                                     await sub_element.click()
-                                    await self.iframe.wait_for_load_state('networkidle', timeout=15000)
                                     print("✅ Navegou via hover+click")
-                                    await self.aguardar_inteligente(3, "carregamento da página")
+                                    await self.aguardar_campos_periodo(3, "carregamento da página")
                                     return True
                             except:
                                 continue
@@ -331,7 +807,7 @@ class RPAEFDReinfFinal:
         try:
             print(f"📅 PASSO 2: Preenchendo período {mes_ano}...")
             
-            await self.aguardar_inteligente(2, "carregamento dos campos")
+            await self.aguardar_campos_periodo(2, "carregamento dos campos")
             
             # Seletores otimizados
             seletores_periodo = [
@@ -378,11 +854,13 @@ class RPAEFDReinfFinal:
             async def preencher_seguro(campo, valor, nome):
                 try:
                     await campo.click()
-                    await self.aguardar_inteligente(0.3)
                     await campo.press('Control+a')
                     await campo.fill(valor)
                     await campo.press('Tab')
-                    await self.aguardar_inteligente(0.5)
+                    await self.aguardar_condicao(
+                        lambda timeout: self.iframe.wait_for_function(
+                            "([campo, valor]) => campo.value === valor", arg=[campo, valor], timeout=timeout),
+                        'preenchimento', 0.5)
                     
                     # Verifica se preencheu
                     valor_atual = await campo.input_value()
@@ -423,8 +901,6 @@ class RPAEFDReinfFinal:
         try:
             print("🔍 PASSO 3: Clicando em Listar...")
             
-            await self.aguardar_inteligente(1, "preparação para listar")
-            
             seletores_listar = [
                 "//button[text()='Listar']",
                 "//input[@type='submit' and @value='Listar']",
@@ -450,9 +926,8 @@ class RPAEFDReinfFinal:
                         
                         print(f"✅ Clicando em Listar (seletor {i+1})...")
                         await element.click()
-                        await self.iframe.wait_for_load_state('networkidle', timeout=20000)
                         print("✅ Botão Listar clicado")
-                        await self.aguardar_inteligente(4, "carregamento da tabela")
+                        await self.aguardar_tabela(4, "carregamento da tabela")
                         return True
                 except:
                     continue
@@ -470,42 +945,24 @@ class RPAEFDReinfFinal:
         try:
             print(f"🔍 Extraindo recibos da página {self.pagina_atual}...")
             
-            # Padrão do recibo baseado no DEBUG
-            padrao_recibo = r'\d{8}-\d{2}-\d{4}-\d{4}-\d{8}'
-            
-            # Baseado no DEBUG: procura na tabela, coluna 6 (Número do recibo)
-            recibos_pagina = []
-            
-            # Procura a tabela
-            tabela = await self.iframe.query_selector("table")
-            if not tabela:
+            # Baseado no DEBUG: procura na tabela, coluna 6 (Número do recibo).
+            # A tabela inteira vem num só evaluate, sem uma chamada por linha/célula
+            dados = await self.iframe.evaluate(JS_DADOS_TABELA)
+            if not dados['encontrada']:
                 print("❌ Tabela não encontrada")
                 return []
             
-            # Procura linhas da tabela (pula cabeçalho)
-            linhas = await tabela.query_selector_all("tr")
+            for registro in dados['linhas']:
+                if registro['recibo']:
+                    print(f"   📋 Linha {registro['linha']}: {registro['recibo']}")
             
-            for i, linha in enumerate(linhas[1:], 1):  # Pula cabeçalho
-                try:
-                    # Procura célula da coluna 6 (número do recibo)
-                    celulas = await linha.query_selector_all("td")
-                    if len(celulas) >= 6:  # Certifica que tem pelo menos 6 colunas
-                        celula_recibo = celulas[5]  # Coluna 6 (índice 5)
-                        texto_celula = await celula_recibo.inner_text()
-                        
-                        # Procura padrão do recibo
-                        match = re.search(padrao_recibo, texto_celula)
-                        if match:
-                            recibo = match.group()
-                            recibos_pagina.append(recibo)
-                            print(f"   📋 Linha {i}: {recibo}")
-                        
-                except Exception as e:
-                    print(f"   ⚠️ Erro na linha {i}: {str(e)}")
-                    continue
-            
-            # Salva recibos desta página
+            # Salva recibos desta página e a posição do Detalhar de cada um
+            recibos_pagina = dados['recibos']
             self.recibos_por_pagina[self.pagina_atual] = recibos_pagina
+            self.detalhar_por_recibo = {
+                registro['recibo']: registro['detalhar'] for registro in dados['linhas']
+                if registro['recibo'] and registro['detalhar'] is not None
+            }
             
             print(f"✅ Encontrados {len(recibos_pagina)} recibos na página {self.pagina_atual}")
             return recibos_pagina
@@ -519,7 +976,7 @@ class RPAEFDReinfFinal:
         try:
             print("📋 Detectando eventos com controle de duplicatas...")
             
-            await self.aguardar_inteligente(2, "carregamento completo da tabela")
+            await self.aguardar_tabela(2, "carregamento completo da tabela")
             
             # Primeiro, extrai todos os recibos da página
             recibos_pagina = await self.extrair_recibos_da_pagina()
@@ -591,17 +1048,32 @@ class RPAEFDReinfFinal:
     async def processar_evento_com_controle_duplicatas(self, indice_linha, recibo_esperado):
         """NOVO: Processa evento verificando duplicata por recibo"""
         try:
-            print(f"🔄 Processando linha {indice_linha+1} - Recibo: {recibo_esperado}")
+            print(f"🔄 {self.rotulo}Processando linha {indice_linha+1} - Recibo: {recibo_esperado}")
             
-            # Verifica se já foi processado
-            if recibo_esperado in self.recibos_processados:
-                print(f"⚠️ Recibo {recibo_esperado} já processado - pulando")
+            # Verifica se já foi processado e reserva o recibo para esta aba
+            if not await self.reservar_recibo(recibo_esperado):
                 return False
             
+            sucesso = False
+            try:
+                sucesso = await self._processar_evento_reservado(indice_linha, recibo_esperado)
+            finally:
+                await self.concluir_recibo(recibo_esperado, sucesso)
+            
+            return sucesso
+            
+        except Exception as e:
+            print(f"❌ Erro no evento {indice_linha+1}: {str(e)}")
+            await self.voltar_tabela_balanceado()
+            return False
+
+    async def _processar_evento_reservado(self, indice_linha, recibo_esperado):
+        """Detalhar → baixar XML → voltar, para um recibo já reservado por esta aba"""
+        try:
             # Recarrega botões Detalhar
             seletor_detalhar = self.seletores_cache['detalhar'][0] if self.seletores_cache['detalhar'] else "//button[text()='Detalhar']"
             
-            await self.aguardar_inteligente(1, "recarregamento da tabela")
+            await self.aguardar_tabela(1, "recarregamento da tabela")
             
             elements = await self.iframe.query_selector_all(seletor_detalhar)
             if not elements or indice_linha >= len(elements):
@@ -616,19 +1088,12 @@ class RPAEFDReinfFinal:
             # Clica Detalhar
             print("👆 Clicando em Detalhar...")
             await botao_detalhar.click()
-            await self.iframe.wait_for_load_state('networkidle', timeout=15000)
-            await self.aguardar_inteligente(2, "carregamento do detalhe")
+            await self.aguardar_detalhe(2, "carregamento do detalhe")
             
-            # Baixa XML
-            sucesso_xml = await self.baixar_xml_balanceado()
+            # Baixa XML (o recibo é marcado como processado ao concluir a reserva)
+            sucesso_xml = await self.baixar_xml_balanceado(recibo_esperado)
             if sucesso_xml:
-                # Marca recibo como processado
-                self.recibos_processados.add(recibo_esperado)
-                self.total_processados += 1
                 print(f"✅ XML baixado - Recibo {recibo_esperado} processado")
-                
-                # Salva estado
-                self.salvar_estado_recibos()
             else:
                 print(f"⚠️ Falha ao baixar XML - Recibo {recibo_esperado}")
             
@@ -642,7 +1107,7 @@ class RPAEFDReinfFinal:
             await self.voltar_tabela_balanceado()
             return False
 
-    async def baixar_xml_balanceado(self):
+    async def baixar_xml_balanceado(self, recibo=None):
         """Baixa XML com método balanceado"""
         try:
             print("📥 Procurando botão 'Baixar XML do evento'...")
@@ -652,10 +1117,10 @@ class RPAEFDReinfFinal:
                 try:
                     element = await self.iframe.wait_for_selector(self.seletores_cache['xml'], timeout=3000)
                     if element and await element.is_visible():
-                        await element.click()
-                        await self.aguardar_inteligente(2, "download do XML")
-                        print("✅ XML baixado (cache)")
-                        return True
+                        if await self.clicar_e_aguardar_download(element, recibo):
+                            print("✅ XML baixado (cache)")
+                            return True
+                        return False
                 except:
                     pass
             
@@ -676,10 +1141,10 @@ class RPAEFDReinfFinal:
                     if element and await element.is_visible():
                         # Atualiza cache
                         self.seletores_cache['xml'] = seletor
-                        await element.click()
-                        await self.aguardar_inteligente(2, "download do XML")
-                        print(f"✅ XML baixado (seletor {i+1})")
-                        return True
+                        if await self.clicar_e_aguardar_download(element, recibo):
+                            print(f"✅ XML baixado (seletor {i+1})")
+                            return True
+                        return False
                 except:
                     continue
             
@@ -702,8 +1167,7 @@ class RPAEFDReinfFinal:
                     element = await self.iframe.wait_for_selector(self.seletores_cache['voltar'], timeout=3000)
                     if element and await element.is_visible():
                         await element.click()
-                        await self.iframe.wait_for_load_state('networkidle', timeout=15000)
-                        await self.aguardar_inteligente(2, "recarregamento da tabela")
+                        await self.aguardar_tabela(2, "recarregamento da tabela")
                         print("✅ Voltou (cache)")
                         return True
                 except:
@@ -724,8 +1188,7 @@ class RPAEFDReinfFinal:
                         # Atualiza cache
                         self.seletores_cache['voltar'] = seletor
                         await element.click()
-                        await self.iframe.wait_for_load_state('networkidle', timeout=15000)
-                        await self.aguardar_inteligente(2, "recarregamento da tabela")
+                        await self.aguardar_tabela(2, "recarregamento da tabela")
                         print("✅ Voltou para tabela")
                         return True
                 except:
@@ -735,8 +1198,7 @@ class RPAEFDReinfFinal:
             print("🔄 Tentando voltar pelo navegador...")
             try:
                 await self.iframe.go_back()
-                await self.iframe.wait_for_load_state('networkidle', timeout=15000)
-                await self.aguardar_inteligente(3, "recarregamento via navegador")
+                await self.aguardar_tabela(3, "recarregamento via navegador")
                 print("✅ Voltou via navegador")
                 return True
             except:
@@ -752,7 +1214,7 @@ class RPAEFDReinfFinal:
         try:
             print("📄 Detectando informações de paginação...")
             
-            await self.aguardar_inteligente(2, "análise de paginação")
+            await self.aguardar_tabela(2, "análise de paginação")
             
             # Baseado no DEBUG: procura botão "Próxima page"
             # Reset contadores
@@ -806,7 +1268,7 @@ class RPAEFDReinfFinal:
             # Marca página como visitada
             self.paginas_visitadas.add(chave_pagina)
             
-            await self.aguardar_inteligente(2, "análise de navegação")
+            await self.aguardar_tabela(2, "análise de navegação")
             
             # Baseado no DEBUG: procura especificamente botão "Próxima page"
             seletores_proxima = [
@@ -843,9 +1305,11 @@ class RPAEFDReinfFinal:
                             await element.click()
                             print("👆 Clicando na próxima página...")
                             
-                            # Aguarda navegação
-                            await self.iframe.wait_for_load_state('networkidle', timeout=20000)
-                            await self.aguardar_inteligente(4, "carregamento da nova página")
+                            # Aguarda a tabela trocar de recibos
+                            await self.aguardar_condicao(
+                                lambda timeout: self.iframe.wait_for_function(
+                                    JS_PAGINA_TROCADA, arg=recibos_antes, timeout=timeout),
+                                'troca_pagina', 4, "carregamento da nova página")
                             
                             # Verifica se realmente mudou de página
                             recibos_depois = await self.extrair_recibos_da_pagina()
@@ -892,12 +1356,21 @@ class RPAEFDReinfFinal:
             recibos_novos = [r for r in recibos_pagina if r not in self.recibos_processados]
             
             eventos_processados = 0
+            tentou_direto = False
+            
+            # Caminho rápido: com o pedido do XML já capturado, a página toda
+            # vai por download direto; o que falhar segue pelos cliques
+            if self.download_direto_disponivel():
+                tentou_direto = True
+                eventos_processados += len(await self.baixar_recibos_direto(recibos_novos))
             
             # Processa apenas eventos com recibos novos
             for i, recibo in enumerate(recibos_novos):
+                if recibo in self.recibos_processados:
+                    continue  # Já baixado pelo caminho direto
                 try:
-                    # Encontra índice da linha na tabela baseado no recibo
-                    indice_linha = recibos_pagina.index(recibo)
+                    # Índice do Detalhar da linha do recibo (ou a posição do recibo na tabela)
+                    indice_linha = self.detalhar_por_recibo.get(recibo, recibos_pagina.index(recibo))
                     
                     if await self.processar_evento_com_controle_duplicatas(indice_linha, recibo):
                         eventos_processados += 1
@@ -905,9 +1378,11 @@ class RPAEFDReinfFinal:
                     else:
                         print(f"⚠️ Falha no evento {i+1}/{len(recibos_novos)}: {recibo}")
                     
-                    # Pausa entre eventos
-                    if i < len(recibos_novos) - 1:
-                        await self.aguardar_inteligente(0.5, "preparação próximo evento")
+                    # Modelo capturado neste clique: o resto da página vai direto
+                    if not tentou_direto and self.download_direto_disponivel():
+                        tentou_direto = True
+                        restantes = [r for r in recibos_novos[i+1:] if r not in self.recibos_processados]
+                        eventos_processados += len(await self.baixar_recibos_direto(restantes))
                     
                 except Exception as e:
                     print(f"❌ Erro no evento {recibo}: {str(e)}")
@@ -929,25 +1404,70 @@ class RPAEFDReinfFinal:
             self.carregar_estado_recibos()
             
             print(f"\n{'='*60}")
-            print(f"📅 PROCESSANDO PERÍODO: {mes_ano}")
+            print(f"📅 {self.rotulo}PROCESSANDO PERÍODO: {mes_ano}")
             if self.recibos_processados:
                 print(f"🔄 Continuando de onde parou: {len(self.recibos_processados)} recibos já processados")
             print(f"{'='*60}")
             
+            total_eventos_periodo = 0
+            paginas_processadas = 0
+            for tentativa in range(1 + TENTATIVAS_RECIBOS_FALHOS):
+                if tentativa:
+                    pendentes = self.recibos_falhos_da_competencia()
+                    if not pendentes:
+                        break
+                    print(f"\n🔁 Repetindo {len(pendentes)} recibo(s) que falharam (passagem {tentativa + 1})...")
+                
+                resultado = await self.percorrer_competencia(mes_ano)
+                if resultado is None:
+                    return False
+                total_eventos_periodo += resultado[0]
+                paginas_processadas += resultado[1]
+            
+            # Compacta o diário no JSON de estado ao fim do período
+            self.salvar_estado_recibos()
+            
+            pendentes = self.recibos_falhos_da_competencia()
+            if pendentes:
+                print(f"\n❌ Período {mes_ano}: {len(pendentes)} recibo(s) não baixados após as repetições")
+                for recibo in pendentes:
+                    print(f"   ❌ {recibo}")
+                return False
+            
+            print(f"\n✅ Período {mes_ano} concluído!")
+            print(f"📊 Total de eventos novos processados: {total_eventos_periodo}")
+            print(f"📄 Páginas processadas: {paginas_processadas}")
+            print(f"📋 Total de recibos únicos: {len(self.recibos_processados)}")
+            print(f"📁 Arquivos salvos em: downloads/efd_reinf/{mes_ano.replace('/', '-')}/")
+            
+            return True
+            
+        except Exception as e:
+            print(f"❌ Erro no período {mes_ano}: {str(e)}")
+            await self.screenshot_debug("erro_periodo")
+            return False
+
+    async def percorrer_competencia(self, mes_ano):
+        """
+        Lista a competência e percorre todas as páginas processando os recibos
+        novos. Devolve (eventos processados, páginas percorridas), ou None se
+        a navegação/listagem falhar.
+        """
+        try:
             # PASSO 1: Navega para visualizar pagamentos
             if not await self.navegar_para_visualizar_pagamentos_balanceado():
                 print("❌ Falha na navegação")
-                return False
+                return None
             
             # PASSO 2: Preenche período
             if not await self.preencher_periodo_balanceado(mes_ano):
                 print("❌ Falha no preenchimento")
-                return False
+                return None
             
             # PASSO 3: Clica Listar
             if not await self.clicar_listar_balanceado():
                 print("❌ Falha ao listar")
-                return False
+                return None
             
             # Detecta paginação inteligente
             await self.detectar_paginacao_inteligente()
@@ -968,8 +1488,11 @@ class RPAEFDReinfFinal:
                 if eventos_pagina == 0:
                     print("ℹ️ Página sem eventos novos")
                 
-                # Salva estado após cada página
-                self.salvar_estado_recibos()
+                # Registra a página no diário (os recibos já entraram um a um)
+                self.registrar_estado({
+                    "pagina": self.pagina_atual,
+                    "recibos": self.recibos_por_pagina.get(self.pagina_atual, [])
+                })
                 
                 # Verifica próxima página com controle de loop
                 if await self.verificar_proxima_pagina_inteligente():
@@ -983,18 +1506,73 @@ class RPAEFDReinfFinal:
                     print("⚠️ Limite de páginas atingido - parando para evitar loop")
                     break
             
-            print(f"\n✅ Período {mes_ano} concluído!")
-            print(f"📊 Total de eventos novos processados: {total_eventos_periodo}")
-            print(f"📄 Páginas processadas: {paginas_processadas}")
-            print(f"📋 Total de recibos únicos: {len(self.recibos_processados)}")
-            print(f"📁 Arquivos salvos em: downloads/efd_reinf/{mes_ano.replace('/', '-')}/")
-            
-            return True
+            return total_eventos_periodo, paginas_processadas
             
         except Exception as e:
-            print(f"❌ Erro no período {mes_ano}: {str(e)}")
+            print(f"❌ Erro ao percorrer {mes_ano}: {str(e)}")
             await self.screenshot_debug("erro_periodo")
-            return False
+            return None
+
+    async def executar_em_abas(self, periodos, total_abas):
+        """
+        Processa os períodos em `total_abas` abas do mesmo contexto do Chrome
+        (já autenticado). Cada aba pega a próxima competência da fila; com
+        menos competências que abas, as abas que sobram entram nas mesmas
+        competências e os recibos se dividem pela reserva sob a trava.
+        Devolve quantos períodos foram concluídos.
+        """
+        self.rotulo = "[Aba 1] "
+        trabalhadores = [self]
+        
+        for numero_aba in range(2, total_abas + 1):
+            try:
+                pagina = await self.page.context.new_page()
+                await pagina.goto(self.page.url)
+                trabalhador = self.criar_trabalhador(pagina, numero_aba)
+                if await trabalhador.acessar_iframe():
+                    await trabalhador.configurar_downloads()
+                    trabalhadores.append(trabalhador)
+                else:
+                    print(f"⚠️ Aba {numero_aba} sem iframe EFD-REINF - descartada")
+                    await pagina.close()
+            except Exception as e:
+                print(f"⚠️ Erro ao abrir aba {numero_aba}: {str(e)}")
+        
+        print(f"🗂️ {len(trabalhadores)} aba(s) trabalhando em paralelo")
+        
+        fila = asyncio.Queue()
+        for i in range(max(len(periodos), len(trabalhadores))):
+            fila.put_nowait(periodos[i % len(periodos)])
+        
+        periodos_sucesso = set()
+        periodos_falha = set()
+        
+        async def trabalhar(trabalhador):
+            while True:
+                try:
+                    periodo = fila.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                if await trabalhador.processar_periodo_completo_final(periodo):
+                    periodos_sucesso.add(periodo)
+                else:
+                    periodos_falha.add(periodo)
+        
+        total_proprio = self.total_processados
+        await asyncio.gather(*(trabalhar(t) for t in trabalhadores))
+        
+        # Fecha só as abas abertas aqui e soma os eventos de todas
+        for trabalhador in trabalhadores[1:]:
+            self.total_processados += trabalhador.total_processados
+            try:
+                await trabalhador.page.close()
+            except Exception:
+                pass
+        
+        print(f"✅ Abas concluídas: {self.total_processados - total_proprio} eventos processados")
+        self.rotulo = ""
+        # Um período conta como concluído se nenhuma aba falhou nele
+        return len(periodos_sucesso - periodos_falha)
 
     async def finalizar_recursos(self):
         """Finaliza recursos de forma segura"""
@@ -1081,6 +1659,15 @@ class RPAEFDReinfFinal:
                 print("❌ Cancelado")
                 return
             
+            abas_str = input(f"\nQuantas abas em paralelo? (1-{MAX_ABAS_PARALELAS}, Enter = 1): ").strip()
+            try:
+                total_abas = min(max(int(abas_str or 1), 1), MAX_ABAS_PARALELAS)
+            except ValueError:
+                total_abas = 1
+            
+            direto = input("Usar download direto por HTTP quando possível? (s/N): ").strip().lower()
+            self.download_direto = direto in ['s', 'sim', 'y', 'yes']
+            
             # Execução final
             inicio_execucao = datetime.now()
             periodos_sucesso = 0
@@ -1090,18 +1677,21 @@ class RPAEFDReinfFinal:
             print("👀 OBSERVE O CHROME - O RPA ESTÁ TRABALHANDO!")
             print("🚫 NÃO TOQUE NO MOUSE OU TECLADO")
             
-            for i, periodo in enumerate(periodos, 1):
-                print(f"\n🎯 PERÍODO {i}/{len(periodos)}: {periodo}")
-                
-                if await self.processar_periodo_completo_final(periodo):
-                    periodos_sucesso += 1
-                    print(f"✅ Período {periodo} concluído!")
-                else:
-                    print(f"❌ Falha no período {periodo}")
-                
-                # Pausa entre períodos
-                if i < len(periodos):
-                    await self.aguardar_inteligente(2, "preparação próximo período")
+            if total_abas > 1:
+                periodos_sucesso = await self.executar_em_abas(periodos, total_abas)
+            else:
+                for i, periodo in enumerate(periodos, 1):
+                    print(f"\n🎯 PERÍODO {i}/{len(periodos)}: {periodo}")
+                    
+                    if await self.processar_periodo_completo_final(periodo):
+                        periodos_sucesso += 1
+                        print(f"✅ Período {periodo} concluído!")
+                    else:
+                        print(f"❌ Falha no período {periodo}")
+                    
+                    # Pausa entre períodos
+                    if i < len(periodos):
+                        await self.aguardar_inteligente(2, "preparação próximo período")
             
             # Relatório final
             fim_execucao = datetime.now()
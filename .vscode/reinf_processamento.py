@@ -0,0 +1,759 @@
+"""
+Processamento de XMLs EFD-REINF R-4010 (evtRetPF) independente do Streamlit.
+
+Assim como `s5002_processamento`, as funções deste módulo não chamam
+`st.*`: erros são lançados ou devolvidos ao chamador, que decide como
+exibi-los.
+"""
+
+import os
+import sqlite3
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from exportacao import TAMANHO_BLOCO_EXPORTACAO, exportar_blocos
+from formatacao import format_cpf_completo, formatar_valores
+
+# Configuração do parser XML
+try:
+    from lxml import etree
+    USAR_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as etree
+    USAR_LXML = False
+
+# Campos de cada registro (um por infoPgto), na ordem das colunas do DataFrame
+CAMPOS_REGISTRO_REINF = (
+    'perApur', 'cpfBenef', 'cpfBenefFormatado', 'natRend', 'natRendDesc', 'dtFG',
+    'vlrRendBruto', 'vlrIsento', 'vlrRetIR', 'vlrLiquido', 'observ', 'arquivo',
+)
+CAMPOS_VALOR_REINF = ('vlrRendBruto', 'vlrIsento', 'vlrRetIR', 'vlrLiquido')
+
+# Tipos das colunas: textos repetidos viram categorias (cada linha guarda só
+# um código de largura fixa) e valores, float64
+TIPOS_REGISTRO_REINF = {
+    'perApur': 'category',
+    'cpfBenef': 'category',
+    'cpfBenefFormatado': 'category',
+    'natRend': 'category',
+    'natRendDesc': 'category',
+    'dtFG': 'category',
+    **{campo: 'float64' for campo in CAMPOS_VALOR_REINF},
+    'observ': 'object',
+    'arquivo': 'category',
+}
+
+# Versão das tabelas do cache; ao mudar, o cache é recriado na próxima abertura
+ESQUEMA_CACHE_REINF = 3
+# Versão dos registros extraídos; arquivos gravados com outra são reprocessados
+CACHE_REINF_VERSAO = "1.0"
+
+LIMIAR_PROCESSAMENTO_PARALELO = 200  # Abaixo disso, o custo de subir o pool não compensa
+
+# Namespaces do R-4010 por versão de leiaute. As versões listadas têm os
+# mesmos grupos e campos lidos aqui; cada uma ganha seu extrator compilado
+PREFIXO_NS_REINF_4010 = 'http://www.reinf.esocial.gov.br/schemas/evt4010PagtoBeneficiarioPF/'
+VERSOES_LEIAUTE_REINF_4010 = ('v2_01_01', 'v2_01_02')
+
+# Namespace para REINF 4010 (versão atual)
+NS_REINF = {
+    'ns': PREFIXO_NS_REINF_4010 + 'v2_01_02'
+}
+
+
+# Mapeamento de naturezas de rendimento
+NATUREZAS_RENDIMENTO = {
+    '10002': 'Diárias',
+    '10003': 'Ajudas de custo',
+    '10004': 'Jetons',
+    '10005': 'Honorários',
+    '10006': 'Serviços prestados por pessoa física',
+    '10007': 'Comissões',
+    '10008': 'Rendimentos de trabalho sem vínculo',
+    '10009': 'Rendimentos de aluguéis',
+    '10010': 'Royalties',
+    '99999': 'Outros rendimentos'
+}
+
+
+def _valor_reinf(elem):
+    """Valor monetário de um elemento (aceita vírgula decimal); 0.0 se ausente"""
+    return float(elem.text.replace(',', '.')) if elem is not None else 0.0
+
+
+def _primeiros_filhos(elem):
+    """Primeiro filho de cada tag"""
+    filhos = {}
+    for filho in elem:
+        filhos.setdefault(filho.tag, filho)
+    return filhos
+
+
+def _liberar(elem):
+    """Descarta um elemento já consumido (e, no lxml, os irmãos anteriores já processados)"""
+    elem.clear()
+    if USAR_LXML:
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+class LeiauteReinfNaoSuportado(Exception):
+    """XML cujo namespace (versão de leiaute) não tem extrator"""
+
+    def __init__(self, namespace):
+        # Só o namespace vai em args, para a exceção voltar intacta do pool de processos
+        super().__init__(namespace)
+        self.namespace = namespace
+
+    def __str__(self):
+        return f"Leiaute não suportado: {self.namespace or 'XML sem namespace'}"
+
+
+def versao_leiaute_reinf(namespace):
+    """Versão do leiaute a partir do namespace (último trecho, ex.: v2_01_02)"""
+    return namespace.rstrip('/').rsplit('/', 1)[-1] if namespace else ''
+
+
+def _compilar_extrator_reinf_4010(namespace):
+    """
+    Extrator de uma versão de leiaute: as tags qualificadas pelo namespace
+    são montadas uma única vez, e não a cada arquivo.
+
+    O extrator recebe os eventos do iterparse e acrescenta uma linha às
+    colunas a cada infoPgto fechado. Os dados de ideEvento, ideContri,
+    ideBenef e idePgto vêm antes dos pagamentos no leiaute, então já são
+    conhecidos quando cada infoPgto termina. Grupos já consumidos são
+    descartados, mantendo a memória constante por arquivo. Só o primeiro
+    evtRetPF do documento é lido. Valores vão para arrays float64; os
+    demais campos, para listas.
+    """
+    prefixo = f"{{{namespace}}}"
+    tag_evt = prefixo + 'evtRetPF'
+    tag_ide_evento = prefixo + 'ideEvento'
+    tag_ide_contri = prefixo + 'ideContri'
+    tag_cpf_benef = prefixo + 'cpfBenef'
+    tag_nat_rend = prefixo + 'natRend'
+    tag_info_pgto = prefixo + 'infoPgto'
+    tag_ide_pgto = prefixo + 'idePgto'
+    tag_ide_benef = prefixo + 'ideBenef'
+    tag_per_apur = prefixo + 'perApur'
+    tag_nr_insc = prefixo + 'nrInsc'
+    tag_dt_fg = prefixo + 'dtFG'
+    tag_vlr_rend_bruto = prefixo + 'vlrRendBruto'
+    tag_observ = prefixo + 'observ'
+    tag_rend_isento = prefixo + 'rendIsento'
+    tag_vlr_isento = prefixo + 'vlrIsento'
+    tag_ret_pgto = prefixo + 'retPgto'
+    tag_vlr_ret_ir = prefixo + 'vlrRetIR'
+
+    def extrair(eventos, arquivo):
+        per_apur = cnpj_contri = cpf_benef = nat_rend = None
+
+        colunas = {
+            campo: array('d') if campo in CAMPOS_VALOR_REINF else []
+            for campo in CAMPOS_REGISTRO_REINF
+        }
+        anexar = {campo: coluna.append for campo, coluna in colunas.items()}
+        cpfs_formatados = {}
+
+        for evento, elem in eventos:
+            if evento != 'end':
+                continue  # Declarações de namespace internas (ex.: assinatura)
+            tag = elem.tag
+
+            if tag == tag_info_pgto:
+                if per_apur and cnpj_contri:
+                    filhos = _primeiros_filhos(elem)
+                    dt_fg = filhos.get(tag_dt_fg)
+                    observ = filhos.get(tag_observ)
+                    vlr_rend_bruto = _valor_reinf(filhos.get(tag_vlr_rend_bruto))
+
+                    # Rendimentos isentos e retenções (IRRF)
+                    rend_isento = filhos.get(tag_rend_isento)
+                    vlr_isento = _valor_reinf(rend_isento.find(tag_vlr_isento)) if rend_isento is not None else 0.0
+                    ret_pgto = filhos.get(tag_ret_pgto)
+                    vlr_ret_ir = _valor_reinf(ret_pgto.find(tag_vlr_ret_ir)) if ret_pgto is not None else 0.0
+
+                    if cpf_benef not in cpfs_formatados:
+                        cpfs_formatados[cpf_benef] = format_cpf_completo(cpf_benef) if cpf_benef else 'N/A'
+
+                    anexar['perApur'](per_apur)
+                    anexar['cpfBenef'](cpf_benef or '')
+                    anexar['cpfBenefFormatado'](cpfs_formatados[cpf_benef])
+                    anexar['natRend'](nat_rend or '')
+                    anexar['natRendDesc'](NATUREZAS_RENDIMENTO.get(nat_rend, f'Código {nat_rend}') if nat_rend else 'Não informado')
+                    anexar['dtFG']((dt_fg.text if dt_fg is not None else None) or '')
+                    anexar['vlrRendBruto'](vlr_rend_bruto)
+                    anexar['vlrIsento'](vlr_isento)
+                    anexar['vlrRetIR'](vlr_ret_ir)
+                    anexar['vlrLiquido'](vlr_rend_bruto - vlr_ret_ir)
+                    anexar['observ']((observ.text if observ is not None else '') or '')
+                    anexar['arquivo'](arquivo)
+                _liberar(elem)
+
+            elif tag == tag_cpf_benef:
+                cpf_benef = elem.text
+            elif tag == tag_nat_rend:
+                nat_rend = elem.text
+            elif tag == tag_ide_pgto:
+                nat_rend = None
+                _liberar(elem)
+            elif tag == tag_ide_benef:
+                cpf_benef = None
+                _liberar(elem)
+            elif tag == tag_ide_evento:
+                filho = elem.find(tag_per_apur)
+                per_apur = filho.text if filho is not None else None
+            elif tag == tag_ide_contri:
+                filho = elem.find(tag_nr_insc)
+                cnpj_contri = filho.text if filho is not None else None
+            elif tag == tag_evt:
+                break
+
+        return colunas
+
+    return extrair
+
+
+# Extrator de cada namespace suportado
+EXTRATORES_REINF_4010 = {
+    PREFIXO_NS_REINF_4010 + versao: _compilar_extrator_reinf_4010(PREFIXO_NS_REINF_4010 + versao)
+    for versao in VERSOES_LEIAUTE_REINF_4010
+}
+
+
+def _namespace_leiaute(declarados):
+    """Namespace do leiaute entre os declarados na raiz: um suportado, senão o de um R-4010, senão o padrão"""
+    for uri in declarados.values():
+        if uri in EXTRATORES_REINF_4010:
+            return uri
+    for uri in declarados.values():
+        if uri.startswith(PREFIXO_NS_REINF_4010):
+            return uri
+    return declarados.get('', next(iter(declarados.values()), ''))
+
+
+def ler_colunas_reinf_4010(file_path):
+    """
+    Lê o XML em streaming e devolve (namespace, colunas).
+
+    O namespace sai das declarações da raiz, que o parser entrega antes de
+    qualquer elemento: a versão é identificada já no início da leitura, que
+    segue, na mesma passada, pelo extrator daquela versão. Um R-4010 de
+    versão sem extrator lança LeiauteReinfNaoSuportado sem ler o restante
+    do arquivo. Se a raiz for de outro esquema (ex.: envelope de lote), o
+    evento pode estar declarado mais adiante, e a leitura continua até achar
+    um namespace suportado.
+    """
+    eventos = etree.iterparse(str(file_path), events=('start-ns', 'end'))
+    declarados = {}
+    primeiro = None
+    for evento, valor in eventos:
+        if evento != 'start-ns':
+            primeiro = (evento, valor)
+            break
+        prefixo_ns, uri = valor
+        declarados.setdefault(prefixo_ns, uri)
+
+    namespace = _namespace_leiaute(declarados)
+    if namespace not in EXTRATORES_REINF_4010 and not namespace.startswith(PREFIXO_NS_REINF_4010):
+        for evento, valor in eventos:
+            if evento == 'start-ns' and valor[1] in EXTRATORES_REINF_4010:
+                namespace = valor[1]
+                primeiro = None
+                break
+
+    extrator = EXTRATORES_REINF_4010.get(namespace)
+    if extrator is None:
+        raise LeiauteReinfNaoSuportado(namespace)
+
+    if primeiro is not None:
+        eventos = chain([primeiro], eventos)
+    return namespace, extrator(eventos, os.path.basename(file_path))
+
+
+def extrair_registros_reinf_4010(file_path):
+    """
+    Extrai os registros de um arquivo XML do REINF 4010 como DataFrame tipado
+    (lança exceção em caso de erro). O namespace lido fica em `attrs['namespace']`.
+    """
+    namespace, colunas = ler_colunas_reinf_4010(file_path)
+    registros = montar_dataframe_reinf(colunas)
+    registros.attrs['namespace'] = namespace
+    return registros
+
+
+def processar_lote_reinf(arquivos):
+    """
+    Processa um lote de arquivos; retorna lista de (caminho, registros, erro).
+    `erro` é o texto da exceção, exceto para leiaute não suportado, que volta
+    como a própria LeiauteReinfNaoSuportado (para o chamador registrar no cache).
+    """
+    resultados = []
+    for caminho in arquivos:
+        try:
+            resultados.append((caminho, extrair_registros_reinf_4010(caminho), None))
+        except LeiauteReinfNaoSuportado as e:
+            resultados.append((caminho, None, e))
+        except Exception as e:
+            resultados.append((caminho, None, str(e)))
+    return resultados
+
+
+def processar_arquivos_reinf(arquivos, max_workers=None, limiar_paralelo=LIMIAR_PROCESSAMENTO_PARALELO):
+    """
+    Processa os arquivos gerando, por competência (subpasta), a lista de
+    (caminho, registros, erro) de cada um.
+
+    Com `limiar_paralelo` arquivos ou mais, as competências são distribuídas
+    num pool de processos e chegam conforme terminam; a ordem final dos
+    registros é dada pelo chamador (a leitura do cache segue a ordem dos
+    arquivos). Caso o pool falhe, as competências pendentes são processadas
+    em série.
+    """
+    por_competencia = {}
+    for caminho in arquivos:
+        por_competencia.setdefault(os.path.dirname(caminho), []).append(caminho)
+    lotes = [por_competencia[pasta] for pasta in sorted(por_competencia)]
+
+    workers = max_workers or os.cpu_count() or 1
+    if len(arquivos) < limiar_paralelo or workers <= 1 or len(lotes) <= 1:
+        for lote in lotes:
+            yield processar_lote_reinf(lote)
+        return
+
+    lotes_pendentes = dict(enumerate(lotes))
+    executor = None
+    try:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(lotes)))
+        futuros = {
+            executor.submit(processar_lote_reinf, lote): indice
+            for indice, lote in lotes_pendentes.items()
+        }
+
+        for futuro in as_completed(futuros):
+            resultado = futuro.result()
+            del lotes_pendentes[futuros[futuro]]
+            yield resultado
+
+    except (BrokenProcessPool, OSError):
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        for lote in lotes_pendentes.values():
+            yield processar_lote_reinf(lote)
+
+    finally:
+        # Consumidor parou antes do fim (GeneratorExit): descarta as competências
+        # ainda na fila e só espera as que já estão em execução
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def registros_vazios_reinf():
+    """DataFrame de registros sem linhas (mesmas colunas e tipos do cache)"""
+    return tipar_registros_reinf(pd.DataFrame(columns=list(CAMPOS_REGISTRO_REINF)))
+
+
+def tipar_registros_reinf(df):
+    """Aplica os tipos de TIPOS_REGISTRO_REINF às colunas do DataFrame"""
+    return df.astype(TIPOS_REGISTRO_REINF)
+
+
+def montar_dataframe_reinf(colunas):
+    """DataFrame tipado a partir das colunas acumuladas pelo parser (sem dicionário por linha)"""
+    return pd.DataFrame({
+        campo: pd.Series(
+            np.frombuffer(colunas[campo], dtype=np.float64) if tipo == 'float64' else colunas[campo],
+            dtype=tipo
+        )
+        for campo, tipo in TIPOS_REGISTRO_REINF.items()
+    })
+
+
+def obter_subpastas_competencias(pasta_base):
+    """Obtém lista de subpastas de competências disponíveis"""
+    competencias = []
+    
+    if not os.path.exists(pasta_base):
+        return competencias
+    
+    for item in os.listdir(pasta_base):
+        caminho_item = os.path.join(pasta_base, item)
+        if os.path.isdir(caminho_item) and item.count('-') == 1:
+            # Verifica se o formato é YYYY-MM
+            try:
+                ano, mes = item.split('-')
+                if len(ano) == 4 and len(mes) == 2 and ano.isdigit() and mes.isdigit():
+                    competencias.append(item)
+            except:
+                continue
+    
+    return sorted(competencias, reverse=True)
+
+
+def obter_arquivos_xml_por_competencia(pasta_base, competencias_selecionadas=None):
+    """Obtém lista de arquivos XML por competência"""
+    arquivos_por_competencia = {}
+    
+    if not competencias_selecionadas:
+        competencias_selecionadas = obter_subpastas_competencias(pasta_base)
+    
+    for competencia in competencias_selecionadas:
+        pasta_competencia = os.path.join(pasta_base, competencia)
+        if os.path.exists(pasta_competencia):
+            arquivos = []
+            for arquivo in os.listdir(pasta_competencia):
+                if arquivo.lower().endswith('.xml') and 'REINF' in arquivo.upper():
+                    arquivos.append(os.path.join(pasta_competencia, arquivo))
+            
+            if arquivos:
+                arquivos_por_competencia[competencia] = arquivos
+    
+    return arquivos_por_competencia
+
+
+def _competencia_do_arquivo(caminho):
+    """Competência (AAAA-MM) de um XML: o nome da subpasta em que está"""
+    return os.path.basename(os.path.dirname(caminho))
+
+
+def impressao_arquivo(caminho):
+    """Impressão digital (tamanho, mtime_ns) do arquivo"""
+    info = os.stat(caminho)
+    return info.st_size, info.st_mtime_ns
+
+
+# Colunas do relatório de pagamentos (registro -> nome exibido/exportado)
+COLUNAS_RELATORIO_REINF = {
+    'cpfBenefFormatado': 'CPF',
+    'vlrRendBruto': 'Valor Pago',
+    'natRendDesc': 'Natureza de Rendimento',
+    'perApur': 'Período',
+    'arquivo': 'Arquivo',
+}
+
+# Resumos do relatório de pagamentos, montados a partir de um único agrupamento
+RelatorioReinf = namedtuple('RelatorioReinf', 'detalhado por_competencia por_natureza por_cpf')
+
+
+def resumir_relatorio_reinf(registros):
+    """
+    Monta o relatório de pagamentos: o detalhamento (maior valor primeiro) e os
+    resumos por competência, natureza e CPF. Os registros são agrupados uma só
+    vez por (período, natureza, CPF); os resumos somam esse agrupamento, que
+    tem bem menos linhas que os registros.
+    """
+    detalhado = registros[list(COLUNAS_RELATORIO_REINF)].rename(columns=COLUNAS_RELATORIO_REINF)
+    detalhado = detalhado.sort_values('Valor Pago', ascending=False)
+
+    agregado = detalhado.groupby(['Período', 'Natureza de Rendimento', 'CPF'], observed=True)['Valor Pago'].agg(
+        ['count', 'sum'])
+    agregado.columns = ['Qtd Pagamentos', 'Total Pago']
+
+    competencias = agregado.index.get_level_values('Período').astype(str).str[:7]
+    por_competencia = agregado.groupby(competencias).sum().sort_index(ascending=False)
+    por_competencia = por_competencia.rename_axis('Competência').reset_index()
+
+    por_natureza_cpf = agregado.groupby(level=['Natureza de Rendimento', 'CPF'], observed=True).sum()
+    por_natureza = por_natureza_cpf.groupby(level='Natureza de Rendimento', observed=True).agg(
+        cpfs=('Qtd Pagamentos', 'size'), pagamentos=('Qtd Pagamentos', 'sum'), total=('Total Pago', 'sum'))
+    por_natureza.columns = ['CPFs Únicos', 'Qtd Pagamentos', 'Total Pago']
+    por_natureza = por_natureza.sort_values('Qtd Pagamentos', ascending=False)
+
+    por_cpf = por_natureza_cpf.groupby(level='CPF', observed=True).sum()
+    por_cpf = por_cpf.sort_values('Total Pago', ascending=False)
+
+    return RelatorioReinf(detalhado, por_competencia, por_natureza, por_cpf)
+
+
+def blocos_relatorio_reinf(registros, tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO, valores_texto=False):
+    """
+    Detalhamento do relatório (maior valor primeiro, como na tela) em blocos
+    de `tamanho_bloco` linhas, montados e formatados um bloco por vez. Com
+    `valores_texto`, o valor sai como "1234,56" (formato do CSV). Sem
+    registros, gera um único bloco vazio, para a exportação ter cabeçalho.
+    """
+    ordem = registros['vlrRendBruto'].reset_index(drop=True).sort_values(ascending=False).index.to_numpy()
+    colunas = list(COLUNAS_RELATORIO_REINF)
+    if not len(ordem):
+        yield registros[colunas].rename(columns=COLUNAS_RELATORIO_REINF)
+        return
+    for inicio in range(0, len(ordem), tamanho_bloco):
+        bloco = registros.iloc[ordem[inicio:inicio + tamanho_bloco]][colunas].rename(columns=COLUNAS_RELATORIO_REINF)
+        if valores_texto:
+            bloco['Valor Pago'] = formatar_valores(bloco['Valor Pago'], separador_milhar=False)
+        yield bloco
+
+
+# --- Cache persistente de registros ---
+def abrir_cache_reinf(caminho):
+    """
+    Abre (ou cria) o cache SQLite de registros REINF.
+
+    `arquivos` guarda a impressão digital de cada XML lido, `registros`
+    uma linha por infoPgto, com as mesmas colunas do DataFrame, de modo que
+    a leitura volta direto para um DataFrame sem reprocessar os XMLs, e
+    `indice_cpfs` o índice invertido CPF -> (competência, arquivo, registros),
+    atualizado junto com os registros de cada arquivo.
+
+    Arquivos de leiaute não suportado ficam em `arquivos` com `suportado = 0`
+    e nenhum registro: servem de relatório de ingestão e evitam reler o XML
+    a cada execução.
+    """
+    conn = sqlite3.connect(str(caminho), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if conn.execute("PRAGMA user_version").fetchone()[0] != ESQUEMA_CACHE_REINF:
+        with conn:
+            for tabela in ('arquivos', 'registros', 'indice_cpfs'):
+                conn.execute(f"DROP TABLE IF EXISTS {tabela}")
+            conn.execute(f"PRAGMA user_version = {ESQUEMA_CACHE_REINF}")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS arquivos ("
+        " caminho TEXT PRIMARY KEY,"
+        " tamanho INTEGER NOT NULL,"
+        " mtime_ns INTEGER NOT NULL,"
+        " versao TEXT NOT NULL,"
+        " competencia TEXT NOT NULL,"
+        " namespace TEXT NOT NULL,"
+        " suportado INTEGER NOT NULL,"
+        " perApur TEXT NOT NULL,"
+        " registros INTEGER NOT NULL)"
+    )
+    colunas = ", ".join(
+        f"{campo} {'REAL' if campo in CAMPOS_VALOR_REINF else 'TEXT'}"
+        for campo in CAMPOS_REGISTRO_REINF
+    )
+    conn.execute(f"CREATE TABLE IF NOT EXISTS registros (caminho TEXT NOT NULL, {colunas})")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_registros_caminho ON registros (caminho)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS indice_cpfs ("
+        " cpfBenef TEXT NOT NULL,"
+        " caminho TEXT NOT NULL,"
+        " competencia TEXT NOT NULL,"
+        " registros INTEGER NOT NULL,"
+        " PRIMARY KEY (cpfBenef, caminho)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_indice_cpfs_caminho ON indice_cpfs (caminho)")
+    return conn
+
+
+def arquivos_desatualizados(conn, impressoes, versao):
+    """
+    Caminhos de `impressoes` (caminho -> (tamanho, mtime_ns)) ausentes do cache
+    ou alterados. Arquivos registrados como leiaute não suportado voltam a ser
+    lidos quando a versão deles passa a ter extrator.
+    """
+    em_cache = {
+        caminho: (tamanho, mtime_ns, versao_cache)
+        for caminho, tamanho, mtime_ns, versao_cache, namespace, suportado in conn.execute(
+            "SELECT caminho, tamanho, mtime_ns, versao, namespace, suportado FROM arquivos")
+        if suportado or namespace not in EXTRATORES_REINF_4010
+    }
+    return [
+        caminho for caminho, impressao in impressoes.items()
+        if em_cache.get(caminho) != (*impressao, versao)
+    ]
+
+
+def gravar_registros_reinf(conn, caminho, impressao, versao, registros):
+    """Substitui os registros em cache de um arquivo e suas entradas no índice de CPFs"""
+    conn.execute("DELETE FROM registros WHERE caminho = ?", (caminho,))
+    conn.executemany(
+        f"INSERT INTO registros (caminho, {', '.join(CAMPOS_REGISTRO_REINF)}) "
+        f"VALUES (?{', ?' * len(CAMPOS_REGISTRO_REINF)})",
+        zip([caminho] * len(registros), *(registros[campo].tolist() for campo in CAMPOS_REGISTRO_REINF))
+    )
+
+    # A competência é a subpasta do arquivo (AAAA-MM)
+    competencia = _competencia_do_arquivo(caminho)
+    conn.execute("DELETE FROM indice_cpfs WHERE caminho = ?", (caminho,))
+    conn.executemany(
+        "INSERT INTO indice_cpfs (cpfBenef, caminho, competencia, registros) VALUES (?, ?, ?, ?)",
+        ((cpf, caminho, competencia, quantidade)
+         for cpf, quantidade in registros['cpfBenef'].value_counts(sort=False).items() if quantidade)
+    )
+
+    conn.execute(
+        "INSERT OR REPLACE INTO arquivos "
+        "(caminho, tamanho, mtime_ns, versao, competencia, namespace, suportado, perApur, registros) "
+        "VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)",
+        (caminho, *impressao, versao, competencia, registros.attrs.get('namespace', ''),
+         registros['perApur'].iat[0] if len(registros) else '', len(registros))
+    )
+
+
+def registrar_leiaute_nao_suportado(conn, caminho, impressao, versao, namespace):
+    """Grava o arquivo no cache como leiaute não suportado (sem registros), para não relê-lo"""
+    conn.execute("DELETE FROM registros WHERE caminho = ?", (caminho,))
+    conn.execute("DELETE FROM indice_cpfs WHERE caminho = ?", (caminho,))
+    conn.execute(
+        "INSERT OR REPLACE INTO arquivos "
+        "(caminho, tamanho, mtime_ns, versao, competencia, namespace, suportado, perApur, registros) "
+        "VALUES (?, ?, ?, ?, ?, ?, 0, '', 0)",
+        (caminho, *impressao, versao, _competencia_do_arquivo(caminho), namespace)
+    )
+
+
+def remover_arquivos_ausentes(conn, impressoes):
+    """
+    Apaga do cache (arquivos, registros e índice de CPFs) os XMLs das
+    competências listadas em `impressoes` que saíram da listagem e não
+    existem mais no disco (apagados ou movidos). Competências fora da
+    listagem não são tocadas. Devolve a quantidade de arquivos removidos.
+    """
+    competencias = {_competencia_do_arquivo(caminho) for caminho in impressoes}
+    if not competencias:
+        return 0
+    marcadores = ', '.join('?' * len(competencias))
+    ausentes = [
+        (caminho,) for (caminho,) in conn.execute(
+            f"SELECT caminho FROM arquivos WHERE competencia IN ({marcadores})", list(competencias))
+        if caminho not in impressoes and not os.path.exists(caminho)
+    ]
+    for tabela in ('registros', 'indice_cpfs', 'arquivos'):
+        conn.executemany(f"DELETE FROM {tabela} WHERE caminho = ?", ausentes)
+    return len(ausentes)
+
+
+def relatorio_ingestao_reinf(conn, competencias):
+    """
+    Arquivos em cache das competências por versão de leiaute: DataFrame com
+    namespace, versão, se é suportado e as quantidades de arquivos e registros.
+    """
+    marcadores = ', '.join('?' * len(competencias))
+    relatorio = pd.read_sql_query(
+        "SELECT namespace, suportado, COUNT(*) AS arquivos, SUM(registros) AS registros "
+        f"FROM arquivos WHERE competencia IN ({marcadores}) "
+        "GROUP BY namespace, suportado ORDER BY suportado, namespace",
+        conn,
+        params=list(competencias)
+    )
+    relatorio.insert(1, 'versao', relatorio['namespace'].map(versao_leiaute_reinf))
+    relatorio['suportado'] = relatorio['suportado'].astype(bool)
+    return relatorio
+
+
+def sincronizar_cache_reinf(conn, impressoes, versao=CACHE_REINF_VERSAO, max_workers=None):
+    """
+    Processa os XMLs novos ou alterados e grava no cache (versão sem
+    interface do carregamento da página). Devolve [(caminho, erro)] dos
+    arquivos que falharam, que ficam fora do cache; os de leiaute não
+    suportado entram no cache sem registros (ver `relatorio_ingestao_reinf`).
+    XMLs apagados ou movidos saem do cache antes.
+    """
+    remover_arquivos_ausentes(conn, impressoes)
+    erros = []
+    for lote in processar_arquivos_reinf(arquivos_desatualizados(conn, impressoes, versao), max_workers):
+        for caminho, registros, erro in lote:
+            if isinstance(erro, LeiauteReinfNaoSuportado):
+                registrar_leiaute_nao_suportado(conn, caminho, impressoes[caminho], versao, erro.namespace)
+                continue
+            if erro:
+                erros.append((caminho, erro))
+                continue
+            gravar_registros_reinf(conn, caminho, impressoes[caminho], versao, registros)
+    conn.commit()
+    return erros
+
+
+def _selecionar_caminhos(conn, caminhos):
+    """Carrega os caminhos na tabela temporária usada nas junções, preservando a ordem"""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS selecionados (caminho TEXT PRIMARY KEY, ordem INTEGER)")
+    conn.execute("DELETE FROM selecionados")
+    conn.executemany(
+        "INSERT OR IGNORE INTO selecionados (caminho, ordem) VALUES (?, ?)",
+        ((caminho, ordem) for ordem, caminho in enumerate(caminhos))
+    )
+
+
+def ler_registros_reinf(conn, caminhos, cpf=None):
+    """DataFrame com os registros em cache dos arquivos (opcionalmente só de um CPF), na ordem informada"""
+    _selecionar_caminhos(conn, caminhos)
+    filtro = "WHERE r.cpfBenef = ? " if cpf else ""
+    return tipar_registros_reinf(pd.read_sql_query(
+        f"SELECT {', '.join('r.' + campo for campo in CAMPOS_REGISTRO_REINF)} "
+        "FROM registros r JOIN selecionados s ON s.caminho = r.caminho "
+        f"{filtro}ORDER BY s.ordem, r.rowid",
+        conn,
+        params=(cpf,) if cpf else None
+    ))
+
+
+def listar_cpfs_indexados_reinf(conn, caminhos):
+    """CPFs e períodos dos arquivos, lidos do índice sem carregar os registros"""
+    _selecionar_caminhos(conn, caminhos)
+    cpfs = [linha[0] for linha in conn.execute(
+        "SELECT DISTINCT i.cpfBenef FROM indice_cpfs i JOIN selecionados s ON s.caminho = i.caminho "
+        "WHERE i.cpfBenef <> '' ORDER BY 1")]
+    periodos = [linha[0] for linha in conn.execute(
+        "SELECT DISTINCT a.perApur FROM arquivos a JOIN selecionados s ON s.caminho = a.caminho "
+        "WHERE a.perApur <> '' ORDER BY 1")]
+    return cpfs, periodos
+
+
+def arquivos_do_cpf_reinf(conn, cpf, caminhos):
+    """Entradas do índice para o CPF: lista de (competência, caminho, registros) na ordem informada"""
+    _selecionar_caminhos(conn, caminhos)
+    return conn.execute(
+        "SELECT i.competencia, i.caminho, i.registros FROM indice_cpfs i "
+        "JOIN selecionados s ON s.caminho = i.caminho "
+        "WHERE i.cpfBenef = ? ORDER BY s.ordem",
+        (cpf,)
+    ).fetchall()
+
+
+def limpar_cache_reinf(caminho):
+    """Remove todas as entradas do cache sem apagar o arquivo (pode estar aberto em outra sessão)"""
+    if not os.path.exists(caminho):
+        return
+    conn = abrir_cache_reinf(caminho)
+    try:
+        with conn:
+            conn.execute("DELETE FROM registros")
+            conn.execute("DELETE FROM indice_cpfs")
+            conn.execute("DELETE FROM arquivos")
+    finally:
+        conn.close()
+
+
+def exportar_relatorio_reinf(caminho_cache, pasta_base, destino, versao=CACHE_REINF_VERSAO, competencias=None,
+                             formato='csv', tamanho_bloco=TAMANHO_BLOCO_EXPORTACAO):
+    """
+    Exporta o detalhamento das competências de `pasta_base` (todas, se
+    `competencias` não for informado) para `destino` sem passar pelo
+    Streamlit (jobs em lote). O cache é atualizado antes e depois lido uma
+    competência por vez, da mais recente para a mais antiga, então só os
+    registros de uma competência ficam em memória.
+
+    Devolve (linhas gravadas, [(caminho, erro)] dos XMLs que falharam).
+    """
+    arquivos_por_competencia = obter_arquivos_xml_por_competencia(pasta_base, competencias)
+    conn = abrir_cache_reinf(caminho_cache)
+    try:
+        impressoes = {
+            caminho: impressao_arquivo(caminho)
+            for arquivos in arquivos_por_competencia.values() for caminho in arquivos
+        }
+        erros = sincronizar_cache_reinf(conn, impressoes, versao)
+
+        def blocos():
+            exportou = False
+            for competencia in sorted(arquivos_por_competencia, reverse=True):
+                registros = ler_registros_reinf(conn, arquivos_por_competencia[competencia])
+                if registros.empty:
+                    continue
+                exportou = True
+                yield from blocos_relatorio_reinf(registros, tamanho_bloco, valores_texto=(formato == 'csv'))
+            if not exportou:
+                yield from blocos_relatorio_reinf(registros_vazios_reinf(), valores_texto=(formato == 'csv'))
+
+        return exportar_blocos(blocos(), destino, formato), erros
+    finally:
+        conn.close()
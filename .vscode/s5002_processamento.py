@@ -0,0 +1,733 @@
+"""
+Processamento de XMLs S-5002 (evtIrrfBenef) independente do Streamlit.
+
+As funções deste módulo rodam também em processos filhos
+(ProcessPoolExecutor), por isso não chamam `st.*`: erros são lançados
+ou devolvidos ao chamador, que decide como exibi-los.
+"""
+
+import os
+import pickle
+import sqlite3
+from collections import namedtuple
+from functools import lru_cache
+from itertools import chain
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+# Configuração do parser XML
+try:
+    from lxml import etree
+    USAR_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as etree
+    USAR_LXML = False
+
+# Namespaces possíveis para S-5002
+NAMESPACES_S5002 = {
+    'ns1': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v_S_01_03_00',
+    'ns2': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v_S_01_02_00',
+    'ns3': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v_S_01_01_00',
+    'ns4': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v02_05_00',
+    'ns5': 'http://www.esocial.gov.br/schema/evt/evtIrrfBenef/v02_04_02'
+}
+
+# Campos de ideEvento capturados junto com o CPF na leitura em streaming
+CAMPOS_CABECALHO_S5002 = ('perApur', 'nrRecArqBase')
+TAMANHO_BLOCO_LEITURA = 16 * 1024
+
+# Indexação paralela
+LIMIAR_INDEXACAO_PARALELA = 500   # Abaixo disso, o custo de subir o pool não compensa
+TAMANHO_LOTE_INDEXACAO = 200      # Arquivos por tarefa enviada ao pool
+TAMANHO_LOTE_SERIAL = 25          # Granularidade do progresso no modo serial
+
+
+# --- Parser XML ---
+def carregar_xml_s5002(file_path):
+    """Lê e faz o parse do XML, usando lxml se disponível (lança exceção em caso de erro)"""
+    file_path = Path(file_path)
+
+    if USAR_LXML:
+        parser = etree.XMLParser(
+            recover=True,
+            huge_tree=True,
+            strip_cdata=False,
+            resolve_entities=False,
+            load_dtd=False,
+            no_network=True
+        )
+
+        with open(file_path, 'rb') as f:
+            xml_content = f.read()
+
+        return etree.fromstring(xml_content, parser)
+
+    encodings = ['utf-8', 'utf-8-sig', 'iso-8859-1', 'cp1252']
+
+    for encoding in encodings:
+        try:
+            with open(file_path, 'r', encoding=encoding) as f:
+                content = f.read()
+            return etree.fromstring(content)
+        except (UnicodeDecodeError, etree.ParseError):
+            continue
+
+    tree = etree.parse(str(file_path))
+    return tree.getroot()
+
+
+class LayoutS5002(namedtuple('LayoutS5002', 'versao namespace prefixo conhecido')):
+    """
+    Versão de leiaute do evtIrrfBenef detectada no XML (hashable, chave do
+    layout compilado). `conhecido` indica se o namespace está em
+    NAMESPACES_S5002; os demais são lidos com o layout S-1.x e sinalizados.
+    """
+    __slots__ = ()
+
+    @property
+    def ns_dict(self):
+        return {self.prefixo: self.namespace}
+
+
+_PREFIXO_POR_NAMESPACE = {uri: nome for nome, uri in NAMESPACES_S5002.items()}
+
+
+@lru_cache(maxsize=None)
+def obter_layout_s5002(namespace_uri):
+    """Layout memoizado por namespace; namespaces fora de NAMESPACES_S5002 usam o prefixo 'ns'"""
+    prefixo = _PREFIXO_POR_NAMESPACE.get(namespace_uri, 'ns')
+    return LayoutS5002(
+        versao=namespace_uri.rstrip('/').rsplit('/', 1)[-1],
+        namespace=namespace_uri,
+        prefixo=prefixo,
+        conhecido=namespace_uri in _PREFIXO_POR_NAMESPACE
+    )
+
+
+def _eh_evento_s5002(elem):
+    """Verifica se o elemento é um evtIrrfBenef (qualquer namespace)"""
+    tag = elem.tag
+    return isinstance(tag, str) and tag.endswith('}evtIrrfBenef')
+
+
+def localizar_evento_s5002(root):
+    """
+    Localiza o evtIrrfBenef e detecta a versão do leiaute pelo seu namespace.
+
+    No XML do eSocial o evento é a raiz ou filho direto dela, então basta
+    olhar esses elementos. Só XMLs embrulhados (ex.: retorno de download)
+    caem num único percurso da árvore, interrompido no primeiro evento.
+    Retorna (evt, LayoutS5002) ou (None, None).
+    """
+    if root is None:
+        return None, None
+
+    evt = next((elem for elem in chain((root,), root) if _eh_evento_s5002(elem)), None)
+    if evt is None:
+        evt = next((elem for elem in root.iter() if _eh_evento_s5002(elem)), None)
+        if evt is None:
+            return None, None
+
+    return evt, obter_layout_s5002(evt.tag[1:].split('}', 1)[0])
+
+
+def _criar_pull_parser():
+    """Cria parser incremental (feed/read_events) com as mesmas proteções do parser completo"""
+    if USAR_LXML:
+        return etree.XMLPullParser(
+            events=('start', 'end'),
+            recover=True,
+            huge_tree=True,
+            resolve_entities=False,
+            load_dtd=False,
+            no_network=True
+        )
+    return etree.XMLPullParser(events=('start', 'end'))
+
+
+def _ler_cabecalho_dom(file_path):
+    """Versão com árvore completa de ler_cabecalho_s5002, usada quando o streaming falha"""
+    root = carregar_xml_s5002(file_path)
+    if root is None:
+        return None
+
+    evt, layout = localizar_evento_s5002(root)
+    if evt is None:
+        return None
+
+    ns_dict, ns_prefix = layout.ns_dict, layout.prefixo
+    ide_trab = evt.find(f'{ns_prefix}:ideTrabalhador', ns_dict)
+    if ide_trab is None:
+        return None
+
+    cpf_elem = ide_trab.find(f'{ns_prefix}:cpfBenef', ns_dict)
+    if cpf_elem is None:
+        return None
+
+    cabecalho = {'cpfBenef': cpf_elem.text, 'perApur': '', 'nrRecArqBase': ''}
+    ide_evento = evt.find(f'{ns_prefix}:ideEvento', ns_dict)
+    if ide_evento is not None:
+        for campo in CAMPOS_CABECALHO_S5002:
+            elem = ide_evento.find(f'{ns_prefix}:{campo}', ns_dict)
+            if elem is not None:
+                cabecalho[campo] = elem.text
+    return cabecalho
+
+
+def ler_cabecalho_s5002(file_path):
+    """
+    Lê o XML em streaming só até o primeiro cpfBenef de ideTrabalhador.
+
+    Retorna dict com cpfBenef, perApur e nrRecArqBase, ou None se o arquivo
+    não for S-5002 ou não tiver CPF. O arquivo é lido em blocos e cada
+    elemento é descartado ao fechar, então apenas o início do XML é lido e
+    nenhuma árvore é montada.
+    """
+    file_path = Path(file_path)
+    parser = _criar_pull_parser()
+    cabecalho = {'cpfBenef': None, 'perApur': '', 'nrRecArqBase': ''}
+    pilha = []
+    prefixo_evento = None  # '{namespace}' do evtIrrfBenef
+
+    with open(file_path, 'rb') as f:
+        bloco = f.read(TAMANHO_BLOCO_LEITURA)
+
+        # Verificação rápida se o arquivo é S-5002 (nome ou início do conteúdo)
+        inicio = bloco[:2048]
+        if 'S-5002' not in file_path.name.upper() and b'evtIrrfBenef' not in inicio and b'S-5002' not in inicio:
+            return None
+
+        try:
+            while bloco:
+                parser.feed(bloco)
+                for evento, elem in parser.read_events():
+                    tag = elem.tag
+                    if not isinstance(tag, str):
+                        continue
+
+                    if evento == 'start':
+                        if prefixo_evento is None and tag.endswith('evtIrrfBenef'):
+                            prefixo_evento = tag[:-len('evtIrrfBenef')]
+                        pilha.append(tag)
+                        continue
+
+                    pilha.pop()
+                    if prefixo_evento is not None and pilha:
+                        pai = pilha[-1]
+                        if pai == prefixo_evento + 'ideEvento':
+                            campo = tag[len(prefixo_evento):]
+                            if campo in CAMPOS_CABECALHO_S5002:
+                                cabecalho[campo] = elem.text
+                        elif pai == prefixo_evento + 'ideTrabalhador' and tag == prefixo_evento + 'cpfBenef':
+                            cabecalho['cpfBenef'] = elem.text
+                            return cabecalho
+                    elem.clear()
+
+                bloco = f.read(TAMANHO_BLOCO_LEITURA)
+
+        except etree.ParseError:
+            # Ex.: codificação não declarada; o parser completo tenta várias codificações
+            return _ler_cabecalho_dom(file_path)
+
+    return None
+
+
+# --- Descrição de códigos ---
+def mapear_codigo_corrigido(codigo):
+    """Mapeia códigos inválidos conhecidos para códigos válidos"""
+    mapeamento_correcoes = {
+        '011': '11',   # Remove zero à esquerda
+        '341': '34',   # Possível erro de digitação
+        '431': '43',   # Possível erro de digitação
+        '179': '79',   # Possível erro de digitação
+    }
+    return mapeamento_correcoes.get(codigo, codigo)
+
+
+def get_descricao_codigo_melhorada(codigos_dict, codigo, tipo_codigo="Código"):
+    """Versão melhorada que trata códigos inválidos conhecidos"""
+    if not codigo:
+        return f'{tipo_codigo} não informado'
+
+    codigo_str = str(codigo).strip()
+
+    # Primeiro tenta busca direta
+    if codigo_str in codigos_dict:
+        return codigos_dict[codigo_str]
+
+    # Tenta código corrigido se não encontrou
+    codigo_corrigido = mapear_codigo_corrigido(codigo_str)
+    if codigo_corrigido != codigo_str and codigo_corrigido in codigos_dict:
+        return f"{codigos_dict[codigo_corrigido]} (código original: {codigo_str})"
+
+    # Remove zeros à esquerda
+    codigo_sem_zeros = codigo_str.lstrip('0')
+    if codigo_sem_zeros and codigo_sem_zeros in codigos_dict:
+        return f"{codigos_dict[codigo_sem_zeros]} (código: {codigo_str})"
+
+    # Se não encontrou, retorna erro informativo
+    return f'Código {codigo_str} não catalogado no sistema'
+
+
+# --- Extração declarativa do evtIrrfBenef ---
+# Tipos de campo: texto ('' se ausente), valor (float, 0.0 se ausente) e
+# código (texto + descrição em '<campo>Desc', buscada na tabela indicada)
+TEXTO = 'texto'
+VALOR = 'valor'
+CODIGO = 'codigo'
+
+# Grupo -> campos na ordem das chaves do dicionário de saída
+LAYOUT_EVT_IRRF_BENEF = {
+    'ideEvento': (
+        ('nrRecArqBase', TEXTO, None),
+        ('perApur', TEXTO, None),
+    ),
+    'ideEmpregador': (
+        ('tpInsc', TEXTO, None),
+        ('nrInsc', TEXTO, None),
+    ),
+    'ideTrabalhador': (
+        ('cpfBenef', TEXTO, None),
+    ),
+    'dmDev': (
+        ('perRef', TEXTO, None),
+        ('ideDmDev', TEXTO, None),
+        ('tpPgto', TEXTO, None),
+        ('dtPgto', TEXTO, None),
+        ('codCateg', CODIGO, 'CodCateg'),
+    ),
+    'infoIR': (
+        ('tpInfoIR', CODIGO, 'TPInfoIR'),
+        ('valor', VALOR, None),
+        ('descRendimento', TEXTO, None),
+    ),
+    'totApurMen': (
+        ('CRMen', TEXTO, None),
+        ('vlrRendTrib', VALOR, None),
+        ('vlrPrevOficial', VALOR, None),
+        ('vlrCRMen', VALOR, None),
+        ('vlrIsenOutros', VALOR, None),
+        ('descRendimento', TEXTO, None),
+    ),
+    'ideDep': (
+        ('cpfDep', TEXTO, None),
+        ('depIRRF', TEXTO, None),
+        ('dtNascto', TEXTO, None),
+        ('nome', TEXTO, None),
+        ('tpDep', CODIGO, 'TPDep'),
+    ),
+    'dedDepen': (
+        ('tpRend', TEXTO, None),
+        ('cpfDep', TEXTO, None),
+        ('vlrDedDep', VALOR, None),
+    ),
+}
+
+# Grupos que se repetem dentro do elemento pai
+GRUPOS_REPETIDOS = ('dmDev', 'infoIR', 'ideDep', 'infoIRCR', 'dedDepen')
+
+
+# --- Tabelas colunares ---
+# Chaves comuns a todas as tabelas: permitem agrupar por arquivo/CPF/competência;
+# (arquivo, seqPgto) identifica o dmDev de origem de cada linha
+CHAVES_TABELAS_S5002 = {
+    'arquivo': 'category',
+    'cpfBenef': 'category',
+    'perRef': 'category',
+    'ideDmDev': 'object',
+    'seqPgto': 'int64',
+}
+
+# Tabela -> colunas além das chaves (códigos como categoria, valores float64;
+# vlrRendTrib/vlrCRMen ficam NaN quando o dmDev não tem totApurMen)
+ESQUEMA_TABELAS_S5002 = {
+    'pagamentos': {
+        'tpPgto': 'category',
+        'dtPgto': 'object',
+        'codCateg': 'category',
+        'codCategDesc': 'category',
+        'vlrRendTrib': 'float64',
+        'vlrCRMen': 'float64',
+    },
+    'info_ir': {
+        'tpInfoIR': 'category',
+        'tpInfoIRDesc': 'category',
+        'valor': 'float64',
+        'descRendimento': 'object',
+    },
+    'dependentes': {
+        'cpfDep': 'object',
+        'depIRRF': 'category',
+        'dtNascto': 'object',
+        'nome': 'object',
+        'tpDep': 'category',
+        'tpDepDesc': 'category',
+    },
+    'deducoes': {
+        'tpRend': 'category',
+        'cpfDep': 'object',
+        'vlrDedDep': 'float64',
+    },
+}
+
+# Grupo do leiaute -> tabela onde suas linhas são gravadas
+TABELA_POR_GRUPO = {
+    'dmDev': 'pagamentos',
+    'totApurMen': 'pagamentos',
+    'infoIR': 'info_ir',
+    'ideDep': 'dependentes',
+    'dedDepen': 'deducoes',
+}
+
+
+@lru_cache(maxsize=None)
+def compilar_layout_s5002(layout):
+    """
+    Compila o layout para uma versão de leiaute: tags já qualificadas
+    ('{uri}campo') para busca direta no mapa de filhos, sem montar
+    caminhos por elemento, e os campos de cada grupo que viram colunas.
+    """
+    prefixo = f'{{{layout.namespace}}}'
+    grupos = {
+        grupo: tuple((campo, prefixo + campo, tipo, tabela) for campo, tipo, tabela in campos)
+        for grupo, campos in LAYOUT_EVT_IRRF_BENEF.items()
+    }
+    tags = {nome: prefixo + nome for nome in (
+        'ideEvento', 'ideEmpregador', 'ideTrabalhador',
+        'totApurMen', 'infoIRComplem', 'perRef', 'ideDmDev', *GRUPOS_REPETIDOS
+    )}
+    colunas = {
+        grupo: tuple(
+            campo for campo in grupos[grupo]
+            if campo[0] in ESQUEMA_TABELAS_S5002[TABELA_POR_GRUPO[grupo]]
+        )
+        for grupo in TABELA_POR_GRUPO
+    }
+    return grupos, tags, frozenset(tags[nome] for nome in GRUPOS_REPETIDOS), colunas
+
+
+def _mapear_filhos(elem, tags_repetidas):
+    """Percorre os filhos uma única vez: primeiro filho por tag e listas das tags repetidas"""
+    primeiros = {}
+    repetidos = {}
+    for filho in elem:
+        tag = filho.tag
+        if tag not in primeiros:
+            primeiros[tag] = filho
+        if tag in tags_repetidas:
+            repetidos.setdefault(tag, []).append(filho)
+    return primeiros, repetidos
+
+
+def _extrair_campos(filhos, campos, codigos):
+    """Monta o dicionário de um grupo a partir do mapa de filhos"""
+    registro = {}
+    for campo, tag, tipo, tabela in campos:
+        filho = filhos.get(tag)
+        if tipo == VALOR:
+            registro[campo] = float(filho.text) if filho is not None else 0.0
+        else:
+            registro[campo] = filho.text if filho is not None else ''
+            if tipo == CODIGO:
+                registro[campo + 'Desc'] = get_descricao_codigo_melhorada(
+                    codigos[tabela], registro[campo], tabela)
+    return registro
+
+
+def _anexar_campos(colunas, filhos, campos, codigos):
+    """Acrescenta os campos de um grupo às listas de colunas da tabela"""
+    for campo, tag, tipo, tabela in campos:
+        filho = filhos.get(tag)
+        if tipo == VALOR:
+            colunas[campo].append(float(filho.text) if filho is not None else 0.0)
+        else:
+            texto = filho.text if filho is not None else ''
+            colunas[campo].append(texto)
+            if tipo == CODIGO:
+                colunas[campo + 'Desc'].append(get_descricao_codigo_melhorada(codigos[tabela], texto, tabela))
+
+
+def _anexar_chaves(colunas, chave):
+    """Acrescenta as chaves (na ordem de CHAVES_TABELAS_S5002) a uma linha da tabela"""
+    for coluna, valor in zip(CHAVES_TABELAS_S5002, chave):
+        colunas[coluna].append(valor)
+
+
+def colunas_vazias_s5002():
+    """Listas de colunas vazias das quatro tabelas"""
+    return {
+        tabela: {coluna: [] for coluna in chain(CHAVES_TABELAS_S5002, esquema)}
+        for tabela, esquema in ESQUEMA_TABELAS_S5002.items()
+    }
+
+
+def processar_xml_s5002(file_path, codigos):
+    """
+    Processa o XML S-5002 completo (lança exceção em caso de erro).
+
+    Retorna o cabeçalho do evento, a versão do leiaute ('leiauteConhecido'
+    falso para namespaces fora de NAMESPACES_S5002) e, em 'colunas', as
+    tabelas pagamentos, info_ir, dependentes e deducoes como listas por
+    coluna (ver `montar_tabelas_s5002`). Cada elemento é visitado uma vez:
+    os filhos de cada grupo são mapeados num único passe e os campos lidos
+    pelas tags compiladas do layout direto para as colunas.
+    """
+    root = carregar_xml_s5002(file_path)
+    if root is None:
+        return None
+
+    evt, layout = localizar_evento_s5002(root)
+    if evt is None:
+        return None
+
+    grupos, tags, tags_repetidas, campos_colunas = compilar_layout_s5002(layout)
+
+    filhos_evt, _ = _mapear_filhos(evt, tags_repetidas)
+    vazio = ({}, {})
+    grupos_evento = {
+        grupo: _mapear_filhos(filhos_evt[tags[grupo]], tags_repetidas) if tags[grupo] in filhos_evt else vazio
+        for grupo in ('ideEvento', 'ideEmpregador', 'ideTrabalhador')
+    }
+
+    dados = {
+        'arquivo': Path(file_path).name,
+        'versaoLeiaute': layout.versao,
+        'leiauteConhecido': layout.conhecido,
+    }
+    for grupo, (filhos, _) in grupos_evento.items():
+        dados.update(_extrair_campos(filhos, grupos[grupo], codigos))
+    colunas = dados['colunas'] = colunas_vazias_s5002()
+
+    _, repetidos_trab = grupos_evento['ideTrabalhador']
+    for seq, dm_dev in enumerate(repetidos_trab.get(tags['dmDev'], ())):
+        filhos_dm, repetidos_dm = _mapear_filhos(dm_dev, tags_repetidas)
+
+        chave = (
+            dados['arquivo'], dados['cpfBenef'],
+            *(filhos_dm[tags[campo]].text if tags[campo] in filhos_dm else '' for campo in ('perRef', 'ideDmDev')),
+            seq
+        )
+
+        # Pagamento (dmDev) e sua totalização mensal
+        pagamentos = colunas['pagamentos']
+        _anexar_chaves(pagamentos, chave)
+        _anexar_campos(pagamentos, filhos_dm, campos_colunas['dmDev'], codigos)
+        tot_apur_men = filhos_dm.get(tags['totApurMen'])
+        if tot_apur_men is not None:
+            _anexar_campos(pagamentos, _mapear_filhos(tot_apur_men, ())[0], campos_colunas['totApurMen'], codigos)
+        else:
+            for campo, *_ in campos_colunas['totApurMen']:
+                pagamentos[campo].append(float('nan'))
+
+        for info_ir in repetidos_dm.get(tags['infoIR'], ()):
+            _anexar_chaves(colunas['info_ir'], chave)
+            _anexar_campos(colunas['info_ir'], _mapear_filhos(info_ir, ())[0], campos_colunas['infoIR'], codigos)
+
+        # Dependentes e deduções por pagamento (dentro de dmDev)
+        info_complem = filhos_dm.get(tags['infoIRComplem'])
+        if info_complem is None:
+            continue
+        _, repetidos_complem = _mapear_filhos(info_complem, tags_repetidas)
+
+        for ide_dep in repetidos_complem.get(tags['ideDep'], ()):
+            _anexar_chaves(colunas['dependentes'], chave)
+            _anexar_campos(colunas['dependentes'], _mapear_filhos(ide_dep, ())[0], campos_colunas['ideDep'], codigos)
+
+        for info_ircr in repetidos_complem.get(tags['infoIRCR'], ()):
+            _, repetidos_ircr = _mapear_filhos(info_ircr, tags_repetidas)
+            for ded_depen in repetidos_ircr.get(tags['dedDepen'], ()):
+                _anexar_chaves(colunas['deducoes'], chave)
+                _anexar_campos(colunas['deducoes'], _mapear_filhos(ded_depen, ())[0], campos_colunas['dedDepen'], codigos)
+
+    return dados
+
+
+def montar_tabelas_s5002(lista_colunas):
+    """
+    Junta as colunas de um ou mais XMLs (campo 'colunas' de
+    `processar_xml_s5002`) nas tabelas pagamentos, info_ir, dependentes e
+    deducoes, com as chaves arquivo/cpfBenef/perRef/ideDmDev/seqPgto,
+    prontas para agregações por groupby.
+    """
+    return {
+        tabela: pd.DataFrame({
+            coluna: pd.Series(
+                list(chain.from_iterable(colunas[tabela][coluna] for colunas in lista_colunas)),
+                dtype=tipo
+            )
+            for coluna, tipo in chain(CHAVES_TABELAS_S5002.items(), esquema.items())
+        })
+        for tabela, esquema in ESQUEMA_TABELAS_S5002.items()
+    }
+
+
+def filtrar_tabelas_s5002(tabelas, periodos):
+    """Restringe todas as tabelas aos períodos de referência informados"""
+    return {
+        tabela: df[df['perRef'].isin(periodos)].reset_index(drop=True)
+        for tabela, df in tabelas.items()
+    }
+
+
+# --- Indexação ---
+def listar_xmls_s5002(pasta_base):
+    """Lista os XMLs da pasta com a impressão digital (tamanho, mtime_ns) de cada um"""
+    impressoes = {}
+    with os.scandir(pasta_base) as entradas:
+        for entrada in entradas:
+            if entrada.name.lower().endswith('.xml') and entrada.is_file():
+                info = entrada.stat()
+                impressoes[entrada.name] = (info.st_size, info.st_mtime_ns)
+    return impressoes
+
+
+def comparar_impressoes(indexados, atuais):
+    """
+    Compara o índice salvo com a listagem atual da pasta.
+
+    `indexados` mapeia arquivo -> (tamanho, mtime_ns, cpf) e `atuais`
+    mapeia arquivo -> (tamanho, mtime_ns). Retorna as listas de arquivos
+    novos ou alterados e de arquivos removidos.
+    """
+    alterados = [
+        arquivo for arquivo, impressao in atuais.items()
+        if arquivo not in indexados or indexados[arquivo][:2] != impressao
+    ]
+    removidos = [arquivo for arquivo in indexados if arquivo not in atuais]
+    return sorted(alterados), removidos
+
+
+def indexar_lote(pasta_base, arquivos):
+    """Lê o cabeçalho de um lote de arquivos; retorna lista de (arquivo, cabecalho, erro)"""
+    resultados = []
+    for arquivo in arquivos:
+        try:
+            cabecalho = ler_cabecalho_s5002(os.path.join(pasta_base, arquivo))
+            resultados.append((arquivo, cabecalho, None))
+        except Exception as e:
+            resultados.append((arquivo, None, str(e)))
+    return resultados
+
+
+def dividir_em_lotes(itens, tamanho):
+    """Divide uma lista em lotes de até `tamanho` itens"""
+    tamanho = max(1, tamanho)
+    return [itens[i:i + tamanho] for i in range(0, len(itens), tamanho)]
+
+
+def indexar_arquivos_s5002(pasta_base, arquivos, max_workers=None,
+                           limiar_paralelo=LIMIAR_INDEXACAO_PARALELA):
+    """
+    Indexa arquivos S-5002 gerando lotes de resultados conforme são concluídos.
+
+    Pastas com menos de `limiar_paralelo` arquivos (ou máquinas com um só
+    núcleo) são processadas em série. Caso o pool de processos falhe, os
+    lotes ainda pendentes são processados em série.
+    """
+    workers = max_workers or os.cpu_count() or 1
+
+    if len(arquivos) < limiar_paralelo or workers <= 1:
+        for lote in dividir_em_lotes(arquivos, TAMANHO_LOTE_SERIAL):
+            yield indexar_lote(pasta_base, lote)
+        return
+
+    # Lotes menores que o padrão quando há poucos arquivos por núcleo, para balancear a carga
+    tamanho_lote = min(TAMANHO_LOTE_INDEXACAO, -(-len(arquivos) // (workers * 4)))
+    lotes_pendentes = dict(enumerate(dividir_em_lotes(arquivos, tamanho_lote)))
+    executor = None
+
+    try:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        futuros = {
+            executor.submit(indexar_lote, pasta_base, lote): indice
+            for indice, lote in lotes_pendentes.items()
+        }
+
+        for futuro in as_completed(futuros):
+            resultado = futuro.result()
+            del lotes_pendentes[futuros[futuro]]
+            yield resultado
+
+    except (BrokenProcessPool, OSError):
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        for lote in lotes_pendentes.values():
+            yield indexar_lote(pasta_base, lote)
+
+    finally:
+        # Consumidor parou antes do fim (GeneratorExit): descarta os lotes ainda
+        # na fila e só espera os que já estão em execução
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+# --- Cache persistente de XMLs processados ---
+def abrir_cache_xmls(caminho):
+    """
+    Abre (ou cria) o cache SQLite de XMLs processados, uma linha por arquivo.
+
+    O modo WAL permite que várias sessões do Streamlit leiam enquanto outra
+    grava; cada leitura ou gravação toca só a linha do arquivo consultado.
+    """
+    conn = sqlite3.connect(str(caminho), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS xmls ("
+        " chave TEXT PRIMARY KEY,"
+        " arquivo TEXT NOT NULL,"
+        " versao TEXT NOT NULL,"
+        " dados BLOB NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_xmls_arquivo ON xmls (arquivo)")
+    return conn
+
+
+def ler_cache_xml(conn, chave, versao):
+    """Retorna os dados em cache para a chave, ou None se ausente ou de outra versão"""
+    linha = conn.execute(
+        "SELECT dados FROM xmls WHERE chave = ? AND versao = ?", (chave, versao)
+    ).fetchone()
+    return pickle.loads(linha[0]) if linha else None
+
+
+def gravar_cache_xml(conn, chave, arquivo, versao, dados):
+    """
+    Grava os dados de um arquivo, descartando entradas de versões anteriores dele.
+
+    Cada arquivo é confirmado na sua própria transação, para que a trava de
+    escrita do SQLite não fique presa durante todo o processamento de um CPF.
+    """
+    blob = pickle.dumps(dados, protocol=pickle.HIGHEST_PROTOCOL)
+    with conn:
+        conn.execute("DELETE FROM xmls WHERE arquivo = ? AND chave <> ?", (arquivo, chave))
+        conn.execute(
+            "INSERT OR REPLACE INTO xmls (chave, arquivo, versao, dados) VALUES (?, ?, ?, ?)",
+            (chave, arquivo, versao, blob)
+        )
+
+
+def limpar_cache_xmls(caminho):
+    """Remove todas as entradas do cache sem apagar o arquivo (pode estar aberto em outra sessão)"""
+    if not Path(caminho).exists():
+        return
+    conn = abrir_cache_xmls(caminho)
+    try:
+        with conn:
+            conn.execute("DELETE FROM xmls")
+    finally:
+        conn.close()
+
+
+def contar_cache_xmls(caminho):
+    """Quantidade de arquivos no cache"""
+    if not Path(caminho).exists():
+        return 0
+    conn = abrir_cache_xmls(caminho)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM xmls").fetchone()[0]
+    finally:
+        conn.close()